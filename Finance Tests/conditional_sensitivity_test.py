@@ -131,157 +131,175 @@ def fetch_data():
 # 2.  CONDITIONAL BETA ESTIMATION
 # ══════════════════════════════════════════════════════════════════════════════
 
-def regime_beta(r_exc, rm_exc, mask, min_obs=10):
-    """OLS beta of r_exc on rm_exc using only months where mask is True."""
-    r_  = r_exc[mask]
-    rm_ = rm_exc[mask]
-    if len(r_) < min_obs or rm_.var() < 1e-12:
-        # Fall back to full-sample beta
-        return float(np.cov(r_exc, rm_exc)[0,1] /
-                     (rm_exc.var() + 1e-12))
-    X = sm.add_constant(rm_)
-    return float(sm.OLS(r_, X).fit().params.iloc[1])
-
-
-def compute_characteristics(ret_series, factors_df):
+FACTOR_COLS     = ['Mkt-RF','SMB','HML','RMW','CMA','MOM']
+TERCILE_LEVELS  = [33.3, 66.7]     # market-return percentiles
+QUINTILE_LEVELS = [20, 40, 60, 80]
+MIN_MONTHS      = 60               # portfolio history needed
+MIN_BIN_OBS     = 10               # months per regime before falling back
+
+
+def market_bins(rm, levels):
+    """
+    Bin index of each month's market return, split at the given
+    percentiles of rm: bins are (lo, hi] with the bottom bin open below,
+    so K = len(levels) + 1.  -1 where rm is missing.
+    """
+    rm = np.asarray(rm, float)
+    ok = np.isfinite(rm)
+    edges = np.percentile(rm[ok], levels)
+    bins = np.full(len(rm), -1)
+    bins[ok] = np.searchsorted(edges, rm[ok], side='left')
+    return bins, len(levels) + 1
+
+
+def binned_betas(Y, x, bins, K, fallback, min_obs=MIN_BIN_OBS):
+    """
+    OLS beta of every column of Y on x within each bin, from grouped sums
+    of x, y, xy and x^2 (one (T x K)' (T x N) product per moment).
+
+    Y: (T, N) with NaN where missing; x, bins: (T,); fallback: (N,).
+    Returns (K, N); bins with fewer than min_obs months or no market
+    variation fall back to the full-sample beta.
+    """
+    ok = bins >= 0
+    G  = np.zeros((len(x), K))
+    G[np.flatnonzero(ok), bins[ok]] = 1.0
+    V  = (np.isfinite(Y) & ok[:, None]).astype(float)
+    x0 = np.where(ok, x, 0.0)[:, None]
+    Y0 = np.where(V > 0, Y, 0.0)
+
+    n   = G.T @ V
+    sx  = G.T @ (V * x0)
+    sxx = G.T @ (V * x0**2)
+    sy  = G.T @ Y0
+    sxy = G.T @ (Y0 * x0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vxx  = sxx - sx**2 / n
+        beta = (sxy - sx * sy / n) / vxx
+        flat = ~(vxx / (n - 1) >= 1e-12)
+    return np.where((n < min_obs) | flat, fallback[None, :], beta)
+
+
+def compute_characteristics(R, factors_df):
     """
-    Compute standard and conditional beta measures for one portfolio.
+    Compute standard and conditional beta measures for every portfolio in
+    R (months x portfolios, % returns on factors_df's index).
     Market return terciles define the three regimes.
+
+    Portfolios are grouped by their set of available months; within a
+    group the regime boundaries, FF5 + MOM loadings and all regime betas
+    are computed once.  Returns {portfolio: row dict} for portfolios with
+    at least MIN_MONTHS months.
     """
-    idx = ret_series.index.intersection(factors_df.index)
-    ret_series = ret_series.loc[idx].dropna()
-    idx = ret_series.index.intersection(factors_df.index)
-    if len(idx) < 60:
-        return None
-
-    r   = ret_series.loc[idx] / 100
-    rf  = factors_df.loc[idx, 'RF']  / 100
-    mkt = factors_df.loc[idx, 'Mkt-RF'] / 100
-    smb = factors_df.loc[idx, 'SMB'] / 100
-    hml = factors_df.loc[idx, 'HML'] / 100
-    rmw = factors_df.loc[idx, 'RMW'] / 100
-    cma = factors_df.loc[idx, 'CMA'] / 100
-    mom_s = factors_df.loc[idx, 'MOM'] / 100 \
-            if 'MOM' in factors_df.columns \
-            else pd.Series(0.0, index=idx)
-
-    r_exc  = r - rf
-    rm_exc = mkt
-
-    # ── FF5 + MOM factor loadings ─────────────────────────────────────────────
-    Xf = sm.add_constant(pd.DataFrame({
-        'Mkt-RF': mkt, 'SMB': smb, 'HML': hml,
-        'RMW': rmw, 'CMA': cma, 'MOM': mom_s
-    }))
-    reg = sm.OLS(r_exc, Xf).fit()
-    loadings = {f'load_{k}': reg.params[k]
-                for k in ['Mkt-RF','SMB','HML','RMW','CMA','MOM']}
-    beta_avg = float(reg.params['Mkt-RF'])
-
-    # ── Market return regime boundaries (terciles) ────────────────────────────
-    t33 = float(np.percentile(rm_exc.dropna(), 33.3))
-    t67 = float(np.percentile(rm_exc.dropna(), 66.7))
-
-    bad_mask     = rm_exc <= t33
-    neutral_mask = (rm_exc > t33) & (rm_exc <= t67)
-    good_mask    = rm_exc > t67
-
-    beta_bad     = regime_beta(r_exc, rm_exc, bad_mask)
-    beta_neutral = regime_beta(r_exc, rm_exc, neutral_mask)
-    beta_good    = regime_beta(r_exc, rm_exc, good_mask)
-
-    # Core asymmetry measure
-    beta_asym = float(beta_bad - beta_good)
-
-    # Additional resolution: quintile betas
-    q20 = float(np.percentile(rm_exc.dropna(), 20))
-    q40 = float(np.percentile(rm_exc.dropna(), 40))
-    q60 = float(np.percentile(rm_exc.dropna(), 60))
-    q80 = float(np.percentile(rm_exc.dropna(), 80))
-
-    beta_q1 = regime_beta(r_exc, rm_exc, rm_exc <= q20)
-    beta_q2 = regime_beta(r_exc, rm_exc,
-                          (rm_exc > q20) & (rm_exc <= q40))
-    beta_q3 = regime_beta(r_exc, rm_exc,
-                          (rm_exc > q40) & (rm_exc <= q60))
-    beta_q4 = regime_beta(r_exc, rm_exc,
-                          (rm_exc > q60) & (rm_exc <= q80))
-    beta_q5 = regime_beta(r_exc, rm_exc, rm_exc > q80)
-
-    # Monotonicity score: is the sensitivity curve monotonically
-    # decreasing from bad to good states?
-    # (would be -5 if perfectly decreasing, 0 if flat, +5 if increasing)
-    quintile_betas = [beta_q1, beta_q2, beta_q3, beta_q4, beta_q5]
-    mono_score = sum(
-        1 if quintile_betas[i] > quintile_betas[i+1] else -1
-        for i in range(len(quintile_betas)-1)
-    )
-
-    # Sensitivity curve slope: OLS of beta_qi on quintile rank
-    # Negative slope = higher beta in worse states (the costly pattern)
-    qranks = np.array([1,2,3,4,5], dtype=float)
-    qbetas = np.array(quintile_betas, dtype=float)
-    if qbetas.std() > 1e-10:
-        curve_slope = float(np.polyfit(qranks, qbetas, 1)[0])
-    else:
-        curve_slope = 0.0
-
-    # Standalone moments for comparison
-    sigma      = float(r_exc.std())
-    skewness   = float(stats.skew(r_exc.dropna()))
-    kurtosis   = float(stats.kurtosis(r_exc.dropna()))
-    var_5      = float(np.percentile(r_exc.dropna(), 5))
-
-    return {
-        'mean_excess':   float(r_exc.mean() * 12),
-        'n_obs':         len(idx),
-        **loadings,
-        # Standard beta
-        'beta_avg':      beta_avg,
-        # Tercile regime betas
-        'beta_bad':      beta_bad,
-        'beta_neutral':  beta_neutral,
-        'beta_good':     beta_good,
-        # Core asymmetry
-        'beta_asym':     beta_asym,
-        # Quintile betas
-        'beta_q1':       beta_q1,
-        'beta_q2':       beta_q2,
-        'beta_q3':       beta_q3,
-        'beta_q4':       beta_q4,
-        'beta_q5':       beta_q5,
-        # Sensitivity curve summary
-        'curve_slope':   curve_slope,
-        'mono_score':    float(mono_score),
-        # Standalone moments
-        'sigma':         sigma,
-        'skewness':      skewness,
-        'kurtosis':      kurtosis,
-        'var_5pct':      var_5,
-    }
+    F = factors_df.reindex(R.index)
+    if 'MOM' not in F.columns:
+        F = F.assign(MOM=0.0)
+    Fv = F[FACTOR_COLS].values / 100
+    rf = F['RF'].values / 100
+    V  = R.notna().values & np.isfinite(Fv).all(axis=1)[:, None] \
+         & np.isfinite(rf)[:, None]
+
+    groups = {}
+    for j in range(R.shape[1]):
+        groups.setdefault(V[:, j].tobytes(), []).append(j)
+
+    out = {}
+    for cols in groups.values():
+        rows = V[:, cols[0]]
+        if rows.sum() < MIN_MONTHS:
+            continue
+        r_exc  = R.values[rows][:, cols] / 100 - rf[rows, None]
+        rm_exc = Fv[rows, 0]
+
+        # ── FF5 + MOM factor loadings ─────────────────────────────────────────
+        Xf   = np.column_stack([np.ones(len(rm_exc)), Fv[rows]])
+        coef = np.linalg.lstsq(Xf, r_exc, rcond=None)[0]
+        beta_avg = coef[1]
+
+        # Full-sample CAPM beta, used when a regime is too thin
+        dm = rm_exc - rm_exc.mean()
+        beta_full = (dm @ (r_exc - r_exc.mean(axis=0))) / (len(dm) - 1) \
+                    / (dm @ dm / (len(dm) - 1) + 1e-12)
+
+        # ── Market return regimes (terciles) ──────────────────────────────────
+        bins, K = market_bins(rm_exc, TERCILE_LEVELS)
+        beta_bad, beta_neutral, beta_good = binned_betas(
+            r_exc, rm_exc, bins, K, beta_full)
+
+        # Core asymmetry measure
+        beta_asym = beta_bad - beta_good
+
+        # Additional resolution: quintile betas
+        bins, K = market_bins(rm_exc, QUINTILE_LEVELS)
+        qbetas = binned_betas(r_exc, rm_exc, bins, K, beta_full)
+
+        # Monotonicity score: is the sensitivity curve monotonically
+        # decreasing from bad to good states?
+        # (would be -4 if perfectly increasing, 0 if mixed, +4 if decreasing)
+        mono_score = np.where(qbetas[:-1] > qbetas[1:], 1, -1).sum(axis=0)
+
+        # Sensitivity curve slope: OLS of beta_qi on quintile rank
+        # Negative slope = higher beta in worse states (the costly pattern)
+        rc = np.arange(K) - (K - 1) / 2
+        curve_slope = np.where(qbetas.std(axis=0) > 1e-10,
+                               rc @ qbetas / (rc @ rc), 0.0)
+
+        # Standalone moments for comparison
+        sigma    = r_exc.std(axis=0, ddof=1)
+        skewness = stats.skew(r_exc, axis=0)
+        kurtosis = stats.kurtosis(r_exc, axis=0)
+        var_5    = np.percentile(r_exc, 5, axis=0)
+        mean_exc = r_exc.mean(axis=0) * 12
+
+        for k, j in enumerate(cols):
+            out[R.columns[j]] = {
+                'mean_excess':   float(mean_exc[k]),
+                'n_obs':         int(rows.sum()),
+                **{f'load_{f}': float(coef[1 + i, k])
+                   for i, f in enumerate(FACTOR_COLS)},
+                # Standard beta
+                'beta_avg':      float(beta_avg[k]),
+                # Tercile regime betas
+                'beta_bad':      float(beta_bad[k]),
+                'beta_neutral':  float(beta_neutral[k]),
+                'beta_good':     float(beta_good[k]),
+                # Core asymmetry
+                'beta_asym':     float(beta_asym[k]),
+                # Quintile betas
+                **{f'beta_q{i+1}': float(qbetas[i, k]) for i in range(K)},
+                # Sensitivity curve summary
+                'curve_slope':   float(curve_slope[k]),
+                'mono_score':    float(mono_score[k]),
+                # Standalone moments
+                'sigma':         float(sigma[k]),
+                'skewness':      float(skewness[k]),
+                'kurtosis':      float(kurtosis[k]),
+                'var_5pct':      float(var_5[k]),
+            }
+    return out
 
 
 def build_cross_section(all_factors, deciles, industries):
     print("\nComputing conditional betas...")
-    rows = []
-
+    cols, meta = {}, []
     for fname, ddf in deciles.items():
         for col in ddf.columns:
-            s = ddf[col].dropna()
-            idx = s.index.intersection(all_factors.index)
-            row = compute_characteristics(s.loc[idx], all_factors.loc[idx])
-            if row:
-                row['portfolio_type'] = 'decile'
-                row['factor_group']   = fname
-                rows.append(row)
-
+            key = f'{fname}:{col}'
+            cols[key] = ddf[col]
+            meta.append((key, 'decile', fname))
     for col in industries.columns:
-        s = industries[col].dropna()
-        idx = s.index.intersection(all_factors.index)
-        row = compute_characteristics(s.loc[idx], all_factors.loc[idx])
-        if row:
-            row['portfolio_type'] = 'industry'
-            row['factor_group']   = 'industry'
+        key = f'industry:{col}'
+        cols[key] = industries[col]
+        meta.append((key, 'industry', 'industry'))
+    R = pd.DataFrame(cols).reindex(all_factors.index)
+
+    chars = compute_characteristics(R, all_factors)
+    rows = []
+    for key, ptype, group in meta:
+        if key in chars:
+            row = dict(chars[key])
+            row['portfolio_type'] = ptype
+            row['factor_group']   = group
             rows.append(row)
 
     df = pd.DataFrame(rows)
@@ -51,7 +51,8 @@ import pandas as pd
 import numpy as np
 from scipy import stats
 import statsmodels.api as sm
-import requests, zipfile, io
+import requests, zipfile, io, os
+import multiprocessing as mp
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -131,142 +132,194 @@ def fetch_data():
 # 2.  COMPUTE PORTFOLIO CHARACTERISTICS
 # ══════════════════════════════════════════════════════════════════════════════
 
-def compute_characteristics(ret_series, factors_df, label=''):
-    """
-    For a single portfolio return series, compute:
-      - Factor loadings (FF5 + momentum) via time-series OLS
-      - Return distribution moments
-      - Higher-moment risk measures
+FACTOR_COLS = ['Mkt-RF','SMB','HML','RMW','CMA','MOM']
+MIN_MONTHS  = 60       # need at least 5 years per portfolio
 
-    Returns a dict of all characteristics plus mean excess return.
-    """
-    # Align
-    idx = ret_series.index\
-            .intersection(factors_df.index)\
-            .dropna()
-    ret_series = ret_series.loc[idx].dropna()
-    idx = ret_series.index.intersection(factors_df.index)
-    if len(idx) < 60:   # need at least 5 years
-        return None
 
-    r   = ret_series.loc[idx] / 100        # decimal returns
-    rf  = factors_df.loc[idx, 'RF'] / 100
-    mkt = factors_df.loc[idx, 'Mkt-RF'] / 100
-    smb = factors_df.loc[idx, 'SMB'] / 100
-    hml = factors_df.loc[idx, 'HML'] / 100
-    rmw = factors_df.loc[idx, 'RMW'] / 100
-    cma = factors_df.loc[idx, 'CMA'] / 100
-    mom_col = factors_df.loc[idx, 'MOM'] / 100 if 'MOM' in factors_df.columns else pd.Series(0, index=idx)
-
-    r_exc  = r - rf
-    rm_exc = mkt
-
-    # ── Factor loadings via OLS ───────────────────────────────────────────────
-    X_factors = sm.add_constant(pd.DataFrame({
-        'Mkt-RF': mkt, 'SMB': smb, 'HML': hml,
-        'RMW': rmw, 'CMA': cma, 'MOM': mom_col
-    }))
-    reg = sm.OLS(r_exc, X_factors).fit()
-    loadings = {f'load_{k}': reg.params[k] for k in
-                ['Mkt-RF','SMB','HML','RMW','CMA','MOM']}
-    factor_r2 = reg.rsquared
-
-    # ── Distribution moments ──────────────────────────────────────────────────
-    sigma  = r_exc.std()
-    skew   = float(stats.skew(r_exc.dropna()))
-    kurt   = float(stats.kurtosis(r_exc.dropna()))   # excess kurtosis
-
-    # Standard beta (redundant with loading but kept for clarity)
-    beta = np.cov(r_exc, rm_exc)[0,1] / (rm_exc.var() + 1e-12)
-
-    # Downside beta: beta on months where market < mean
-    down_mask  = rm_exc < rm_exc.mean()
-    r_down     = r_exc[down_mask]
-    rm_down    = rm_exc[down_mask]
-    if len(r_down) > 20:
-        down_beta = np.cov(r_down, rm_down)[0,1] / (rm_down.var() + 1e-12)
-    else:
-        down_beta = np.nan
-
-    # Upside beta: beta on months where market >= mean
-    up_mask   = ~down_mask
-    r_up      = r_exc[up_mask]
-    rm_up     = rm_exc[up_mask]
-    if len(r_up) > 20:
-        up_beta = np.cov(r_up, rm_up)[0,1] / (rm_up.var() + 1e-12)
-    else:
-        up_beta = np.nan
-
-    # Beta asymmetry: downside beta - upside beta (key higher-moment measure)
-    beta_asym = (down_beta - up_beta) if (
-        not np.isnan(down_beta) and not np.isnan(up_beta)) else np.nan
-
-    # Coskewness: E[(r-μr)(rm-μm)²] / σm²  (Harvey & Siddique 2000)
-    dr  = r_exc  - r_exc.mean()
-    drm = rm_exc - rm_exc.mean()
-    coskew = float(np.mean(dr * drm**2) / (rm_exc.std()**2 + 1e-12))
-
-    # Cokurtosis: E[(r-μr)(rm-μm)³] / σm³
-    cokurt = float(np.mean(dr * drm**3) / (rm_exc.std()**3 + 1e-12))
-
-    # Value at Risk (5th percentile) — captures tail loss
-    var_5 = float(np.percentile(r_exc.dropna(), 5))
-
-    # Mean excess return (the thing we're trying to predict)
-    mean_excess = float(r_exc.mean() * 12)   # annualised
-
-    return {
-        'label':       label,
-        'mean_excess': mean_excess,
-        'n_obs':       len(idx),
-        # Factor loadings
-        **loadings,
-        'factor_r2':   factor_r2,
-        # Distribution moments
-        'sigma':       float(sigma),
-        'skewness':    skew,
-        'kurtosis':    kurt,
-        # Higher-moment risk
-        'beta':        float(beta),
-        'down_beta':   float(down_beta) if not np.isnan(down_beta) else np.nan,
-        'up_beta':     float(up_beta)   if not np.isnan(up_beta)   else np.nan,
-        'beta_asym':   float(beta_asym) if not np.isnan(beta_asym) else np.nan,
-        'coskewness':  coskew,
-        'cokurtosis':  cokurt,
-        'var_5pct':    var_5,
-    }
+def _prefix(A):
+    """Prefix sums along axis 0 with a leading zero row: rows [s, e) = P[e] - P[s]."""
+    P = np.zeros((len(A) + 1,) + A.shape[1:])
+    np.cumsum(A, axis=0, out=P[1:])
+    return P
 
 
-def build_cross_section(factors_all, deciles, industries):
+def build_panel(factors_all, deciles, industries):
     """
-    Build cross-sectional dataset: one row per portfolio,
-    columns = mean excess return + factor loadings + distribution moments.
+    Align every decile and industry portfolio with the factors once.
+
+    Returns dict:
+      dates:  factor index (all windows are row ranges of it)
+      F:      (T, 6) FF5 + MOM factors, decimal (MOM = 0 if absent)
+      R:      (T, N) portfolio excess returns, decimal, NaN where missing
+      labels, types, groups: per-portfolio metadata
+      acc:    prefix sums of the power and cross-power sums needed for
+              the distribution moments and co-moments, masked to each
+              portfolio's own months
     """
-    all_factors = factors_all.copy()
-    rows = []
+    F = factors_all.copy()
+    if 'MOM' not in F.columns:
+        F['MOM'] = 0.0
+    Fv = F[FACTOR_COLS].values / 100
+    rf = F['RF'].values / 100
 
-    # Decile portfolios
+    cols, labels, types, groups = [], [], [], []
     for fname, ddf in deciles.items():
         for col in ddf.columns:
-            s = ddf[col].dropna()
-            idx = s.index.intersection(all_factors.index)
-            row = compute_characteristics(s.loc[idx], all_factors.loc[idx],
-                                          label=f'{fname}_{col}')
-            if row:
-                row['portfolio_type'] = 'decile'
-                row['factor_group']   = fname
-                rows.append(row)
-
-    # Industry portfolios (independent test assets)
+            cols.append(ddf[col]); labels.append(f'{fname}_{col}')
+            types.append('decile'); groups.append(fname)
     for col in industries.columns:
-        s = industries[col].dropna()
-        idx = s.index.intersection(all_factors.index)
-        row = compute_characteristics(s.loc[idx], all_factors.loc[idx],
-                                      label=f'ind_{col}')
-        if row:
-            row['portfolio_type'] = 'industry'
-            row['factor_group']   = 'industry'
-            rows.append(row)
+        cols.append(industries[col]); labels.append(f'ind_{col}')
+        types.append('industry'); groups.append('industry')
+    R = pd.concat(cols, axis=1).reindex(F.index).values / 100 - rf[:, None]
+    V = np.isfinite(R) & np.isfinite(Fv).all(axis=1)[:, None]
+    R = np.where(V, R, np.nan)
+
+    # Power sums of r and of the market over each portfolio's months
+    r  = np.where(V, R, 0.0)
+    m  = np.where(V, Fv[:, [0]], 0.0)
+    acc = {'n': V.astype(float)}
+    for k in range(1, 5):
+        acc[f'r{k}'] = r**k
+        acc[f'm{k}'] = m**k
+    for k in range(1, 4):
+        acc[f'rm{k}'] = r * m**k
+    acc = {k: _prefix(v) for k, v in acc.items()}
+
+    return {'dates': F.index, 'F': Fv, 'R': R, 'V': V, 'acc': acc,
+            'labels': labels, 'types': types, 'groups': groups}
+
+
+def window_moments(P, s, e):
+    """
+    Distribution moments and co-moments of every portfolio over rows
+    [s, e), from the accumulated power sums (O(N) per window).
+    Central moments follow from the raw sums; conventions match pandas
+    std (ddof 1) and scipy skew / kurtosis (biased).
+    """
+    S = {k: v[e] - v[s] for k, v in P['acc'].items()}
+    n = S['n']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu  = S['r1'] / n
+        m2  = S['r2'] / n - mu**2
+        m3  = S['r3'] / n - 3 * mu * S['r2'] / n + 2 * mu**3
+        m4  = S['r4'] / n - 4 * mu * S['r3'] / n + 6 * mu**2 * S['r2'] / n - 3 * mu**4
+
+        mm   = S['m1'] / n
+        mm2  = S['m2'] / n - mm**2
+        mm3  = S['m3'] / n - 3 * mm * S['m2'] / n + 2 * mm**3
+        var_m = mm2 * n / (n - 1)
+        cov   = (S['rm1'] - n * mu * mm) / (n - 1)
+
+        # Σ(r-μ)(rm-μm)^k = Σ r (rm-μm)^k - μ Σ (rm-μm)^k
+        c2 = S['rm2'] - 2 * mm * S['rm1'] + mm**2 * S['r1'] - mu * n * mm2
+        c3 = (S['rm3'] - 3 * mm * S['rm2'] + 3 * mm**2 * S['rm1']
+              - mm**3 * S['r1']) - mu * n * mm3
+
+        return {
+            'n':           n,
+            'mean_excess': mu * 12,                      # annualised
+            'sigma':       np.sqrt(m2 * n / (n - 1)),
+            'skewness':    m3 / m2**1.5,
+            'kurtosis':    m4 / m2**2 - 3.0,             # excess kurtosis
+            'beta':        cov / (var_m + 1e-12),
+            # Coskewness: E[(r-μr)(rm-μm)²] / σm²  (Harvey & Siddique 2000)
+            'coskewness':  c2 / n / (var_m + 1e-12),
+            # Cokurtosis: E[(r-μr)(rm-μm)³] / σm³
+            'cokurtosis':  c3 / n / (var_m**1.5 + 1e-12),
+        }
+
+
+def _split_beta(r, rm, mask):
+    """Beta of each column of r on rm over the months in mask (> 20 needed)."""
+    if mask.sum() <= 20:
+        return np.full(r.shape[1], np.nan)
+    x = rm[mask] - rm[mask].mean()
+    y = r[mask] - r[mask].mean(axis=0)
+    k = len(x) - 1
+    return (x @ y / k) / (x @ x / k + 1e-12)
+
+
+def panel_characteristics(P, s, e, min_months=MIN_MONTHS):
+    """
+    For every portfolio with at least min_months months in rows [s, e),
+    compute:
+      - Factor loadings (FF5 + momentum) via time-series OLS
+      - Return distribution moments
+      - Higher-moment risk measures
+
+    Portfolios sharing the same months are handled as one group: one
+    multi-column least-squares fit for the loadings and one set of
+    downside / upside masks.  Returns a list of row dicts in panel order.
+    """
+    mom = window_moments(P, s, e)
+    V   = P['V'][s:e]
+    R   = P['R'][s:e]
+    Fw  = P['F'][s:e]
+
+    groups = {}
+    for j in np.flatnonzero(mom['n'] >= min_months):
+        groups.setdefault(V[:, j].tobytes(), []).append(j)
+
+    rows = {}
+    for cols in groups.values():
+        t  = V[:, cols[0]]
+        r  = R[t][:, cols]
+        X  = np.column_stack([np.ones(t.sum()), Fw[t]])
+        rm = Fw[t, 0]
+
+        # ── Factor loadings via OLS ───────────────────────────────────────────
+        coef, ssr = np.linalg.lstsq(X, r, rcond=None)[:2]
+        if len(ssr) == 0:
+            ssr = ((r - X @ coef)**2).sum(axis=0)
+        factor_r2 = 1 - ssr / ((r - r.mean(axis=0))**2).sum(axis=0)
+
+        # Downside / upside beta: months where market < / >= its mean
+        down = rm < rm.mean()
+        down_beta = _split_beta(r, rm, down)
+        up_beta   = _split_beta(r, rm, ~down)
+        # Beta asymmetry: downside beta - upside beta (key higher-moment measure)
+        beta_asym = down_beta - up_beta
+
+        # Value at Risk (5th percentile) — captures tail loss
+        var_5 = np.percentile(r, 5, axis=0)
+
+        for k, j in enumerate(cols):
+            rows[j] = {
+                'label':       P['labels'][j],
+                'mean_excess': float(mom['mean_excess'][j]),
+                'n_obs':       int(mom['n'][j]),
+                # Factor loadings
+                **{f'load_{f}': float(coef[1 + i, k])
+                   for i, f in enumerate(FACTOR_COLS)},
+                'factor_r2':   float(factor_r2[k]),
+                # Distribution moments
+                'sigma':       float(mom['sigma'][j]),
+                'skewness':    float(mom['skewness'][j]),
+                'kurtosis':    float(mom['kurtosis'][j]),
+                # Higher-moment risk
+                'beta':        float(mom['beta'][j]),
+                'down_beta':   float(down_beta[k]),
+                'up_beta':     float(up_beta[k]),
+                'beta_asym':   float(beta_asym[k]),
+                'coskewness':  float(mom['coskewness'][j]),
+                'cokurtosis':  float(mom['cokurtosis'][j]),
+                'var_5pct':    float(var_5[k]),
+            }
+    return [rows[j] for j in sorted(rows)]
+
+
+def build_cross_section(factors_all, deciles, industries, panel=None):
+    """
+    Build cross-sectional dataset: one row per portfolio,
+    columns = mean excess return + factor loadings + distribution moments.
+    """
+    P = panel if panel is not None else build_panel(factors_all, deciles, industries)
+    rows = panel_characteristics(P, 0, len(P['dates']))
+    pos  = {l: j for j, l in enumerate(P['labels'])}
+    for row in rows:
+        j = pos[row['label']]
+        row['portfolio_type'] = P['types'][j]
+        row['factor_group']   = P['groups'][j]
 
     df = pd.DataFrame(rows)
     print(f"\nCross-section: {len(df)} portfolios "
@@ -375,93 +428,98 @@ def run_cross_sectional(df, label='All portfolios'):
 # 4.  ROLLING WINDOW VERSION (time-varying)
 # ══════════════════════════════════════════════════════════════════════════════
 
+N_WORKERS = None    # process pool size (None = all cores, 1 = serial)
+
+_PANEL = {}
+
+def _init_worker(panel):
+    _PANEL.update(panel)
+
+
+def _window_regressions(task):
+    """Cross-sectional models A/B/C for one window; None if too few portfolios."""
+    window_years, s, e, current = task
+    sub_rows = panel_characteristics(_PANEL, s, e)
+    if len(sub_rows) < 20:
+        return None
+
+    df_win = pd.DataFrame(sub_rows).dropna(
+        subset=['mean_excess'] + FACTOR_VARS + MOMENT_VARS)
+    if len(df_win) < 15:
+        return None
+
+    y   = df_win['mean_excess']
+    ra  = sm.OLS(y, sm.add_constant(df_win[FACTOR_VARS])).fit()
+    rb  = sm.OLS(y, sm.add_constant(df_win[MOMENT_VARS])).fit()
+    rc  = sm.OLS(y, sm.add_constant(
+                    df_win[FACTOR_VARS + MOMENT_VARS])).fit()
+
+    pct = rb.rsquared / ra.rsquared * 100 if ra.rsquared > 0 else 0
+
+    # F-test: do factors add over moments?
+    n, k_c, k_b = len(df_win), len(rc.params), len(rb.params)
+    dr  = rc.rsquared - rb.rsquared
+    f   = (dr/(k_c-k_b)) / ((1-rc.rsquared)/(n-k_c))
+    p   = 1 - stats.f.cdf(f, k_c-k_b, n-k_c)
+
+    return {
+        'window_end': current,
+        'r2_factors': ra.rsquared,
+        'r2_moments': rb.rsquared,
+        'r2_full':    rc.rsquared,
+        'pct_captured': pct,
+        'f_stat': f, 'p_val': p,
+        'window_years': window_years,
+    }
+
+
 def rolling_shrinkage(factors_all, deciles, industries,
-                      window_years=10, step_years=5):
+                      window_years=10, step_years=5, n_workers=N_WORKERS):
     """
     Repeat the cross-sectional test in rolling windows to check
     whether the shrinkage is stable over time.
-    """
-    print(f"\n── Rolling Shrinkage Analysis ({window_years}yr windows) ─────────────────")
-    print(f"  {'Window end':>12}  {'A R²':>7}  {'B R²':>7}  {'C R²':>7}  "
-          f"{'B/A %':>7}  {'F add?':>6}")
-    print("  " + "-" * 60)
 
-    all_factors = factors_all.copy()
-    start_date = all_factors.index.min()
-    end_date   = all_factors.index.max()
-
-    current = start_date + pd.DateOffset(years=window_years)
-    rows = []
-
-    while current <= end_date:
-        win_start = current - pd.DateOffset(years=window_years)
-
-        # Slice all data to window
-        f_win = all_factors.loc[win_start:current]
-        d_win = {k: v.loc[win_start:current] for k,v in deciles.items()}
-        i_win = industries.loc[win_start:current]
-
-        # Build cross-section for this window
-        sub_rows = []
-        for fname, ddf in d_win.items():
-            for col in ddf.columns:
-                s = ddf[col].dropna()
-                idx = s.index.intersection(f_win.index)
-                if len(idx) < 36: continue
-                row = compute_characteristics(s.loc[idx], f_win.loc[idx],
-                                              label=f'{fname}_{col}')
-                if row:
-                    sub_rows.append(row)
-
-        for col in i_win.columns:
-            s = i_win[col].dropna()
-            idx = s.index.intersection(f_win.index)
-            if len(idx) < 36: continue
-            row = compute_characteristics(s.loc[idx], f_win.loc[idx],
-                                          label=f'ind_{col}')
-            if row:
-                sub_rows.append(row)
-
-        if len(sub_rows) < 20:
+    window_years: one length or a list of lengths (years).  Portfolios
+    are aligned into one panel up front; each window is a row range of
+    it, and windows are spread across a process pool.
+    """
+    P = build_panel(factors_all, deciles, industries)
+    dates = P['dates']
+    lengths = [window_years] if np.isscalar(window_years) else list(window_years)
+
+    tasks = []
+    for wy in lengths:
+        current = dates.min() + pd.DateOffset(years=wy)
+        while current <= dates.max():
+            win_start = current - pd.DateOffset(years=wy)
+            # Rows of [win_start, current], both ends inclusive
+            s = dates.searchsorted(win_start)
+            e = dates.searchsorted(current, 'right')
+            tasks.append((wy, s, e, current))
             current += pd.DateOffset(years=step_years)
-            continue
-
-        df_win = pd.DataFrame(sub_rows).dropna(
-            subset=['mean_excess'] + FACTOR_VARS + MOMENT_VARS)
 
-        if len(df_win) < 15:
-            current += pd.DateOffset(years=step_years)
-            continue
+    if n_workers == 1 or len(tasks) < 2:
+        _init_worker(P)
+        results = list(map(_window_regressions, tasks))
+    else:
+        with mp.Pool(min(n_workers or os.cpu_count(), len(tasks)),
+                     initializer=_init_worker, initargs=(P,)) as pool:
+            results = pool.map(_window_regressions, tasks, chunksize=4)
 
-        y   = df_win['mean_excess']
-        ra  = sm.OLS(y, sm.add_constant(df_win[FACTOR_VARS])).fit()
-        rb  = sm.OLS(y, sm.add_constant(df_win[MOMENT_VARS])).fit()
-        rc  = sm.OLS(y, sm.add_constant(
-                        df_win[FACTOR_VARS + MOMENT_VARS])).fit()
-
-        pct = rb.rsquared / ra.rsquared * 100 if ra.rsquared > 0 else 0
-
-        # F-test: do factors add over moments?
-        n, k_c, k_b = len(df_win), len(rc.params), len(rb.params)
-        dr  = rc.rsquared - rb.rsquared
-        f   = (dr/(k_c-k_b)) / ((1-rc.rsquared)/(n-k_c))
-        p   = 1 - stats.f.cdf(f, k_c-k_b, n-k_c)
-        sig = '  no' if p > 0.05 else ' yes'
-
-        print(f"  {str(current.date()):>12}  {ra.rsquared:>7.4f}  "
-              f"{rb.rsquared:>7.4f}  {rc.rsquared:>7.4f}  "
-              f"{pct:>6.1f}%  {sig}")
-
-        rows.append({
-            'window_end': current,
-            'r2_factors': ra.rsquared,
-            'r2_moments': rb.rsquared,
-            'r2_full':    rc.rsquared,
-            'pct_captured': pct,
-            'f_stat': f, 'p_val': p,
-        })
-
-        current += pd.DateOffset(years=step_years)
+    rows = []
+    for wy in lengths:
+        print(f"\n── Rolling Shrinkage Analysis ({wy}yr windows) ─────────────────")
+        print(f"  {'Window end':>12}  {'A R²':>7}  {'B R²':>7}  {'C R²':>7}  "
+              f"{'B/A %':>7}  {'F add?':>6}")
+        print("  " + "-" * 60)
+        for task, row in zip(tasks, results):
+            if row is None or task[0] != wy:
+                continue
+            sig = '  no' if row['p_val'] > 0.05 else ' yes'
+            print(f"  {str(row['window_end'].date()):>12}  {row['r2_factors']:>7.4f}  "
+                  f"{row['r2_moments']:>7.4f}  {row['r2_full']:>7.4f}  "
+                  f"{row['pct_captured']:>6.1f}%  {sig}")
+            rows.append(row)
 
     return pd.DataFrame(rows)
 
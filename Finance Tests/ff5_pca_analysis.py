@@ -194,70 +194,216 @@ def interpret(results_25, results_49, pca):
 
 # ── 7. REGIME ANALYSIS ────────────────────────────────────────────────────────
 
-def regime_analysis(mkt, alpha_factors, scores):
+RECESSIONS = [                       # NBER peak/trough months
+    ('1969-12','1970-11'), ('1973-11','1975-03'), ('1980-01','1980-07'),
+    ('1981-07','1982-11'), ('1990-07','1991-03'), ('2001-03','2001-11'),
+    ('2007-12','2009-06'), ('2020-02','2020-04'),
+]
+BAD_MKT_Q   = 0.25     # market-return quantile defining a bad month
+CRASH_Q     = 0.25     # factor-return quantile counted as a crash
+VOL_WINDOW  = 24       # months in the rolling market-vol estimate
+N_BOOT      = 1000     # bootstrap resamples for confidence bands
+BOOT_BLOCK  = 1        # bootstrap block length in months (1 = iid)
+BOOT_CI     = 0.90
+BOOT_SEED   = 0
+
+
+def regime_masks(df, bad_q=BAD_MKT_Q, bad_window=None, vol_window=VOL_WINDOW,
+                 vol_window_median=None, recessions=RECESSIONS, extra=None):
+    """
+    Boolean regime masks on df's index, one column per regime.
+
+      bad_market / good_market: Mkt-RF below its bad_q quantile, taken over
+          the full sample or, with bad_window, a trailing rolling window
+      high_vol:  rolling vol_window std of Mkt-RF above its median (full
+          sample, or trailing vol_window_median months)
+      recession: inside any (start, end) month range of recessions
+      extra:     {name: bool Series on the index, or callable(df) -> mask}
+
+    Rolling thresholds only use past data; months before a window fills
+    are outside the regime.  'all' (every month) is always the first column.
+    """
+    mkt = df['Mkt-RF']
+    q = (mkt.quantile(bad_q) if bad_window is None
+         else mkt.rolling(bad_window).quantile(bad_q))
+    vol = mkt.rolling(vol_window).std()
+    med = (vol.median() if vol_window_median is None
+           else vol.rolling(vol_window_median).median())
+
+    masks = pd.DataFrame(index=df.index)
+    masks['all']         = True
+    masks['bad_market']  = mkt < q
+    masks['good_market'] = mkt >= q if bad_window is not None else ~masks['bad_market']
+    masks['recession']   = False
+    for start, end in recessions:
+        masks.loc[(df.index >= start) & (df.index <= end), 'recession'] = True
+    masks['high_vol']    = vol > med
+    for name, m in (extra or {}).items():
+        m = m(df) if callable(m) else m
+        masks[name] = pd.Series(m, index=df.index).fillna(False).astype(bool)
+    return masks.astype(bool)
+
+
+def _weighted_moments(C, X):
+    """
+    Per-regime sums from month weights.  C: (..., T, R) weights (regime mask
+    times bootstrap multiplicity), X: (T, k).  Returns n (..., R),
+    mean (..., R, k), cov (..., R, k, k) with ddof 1.
+    """
+    n   = C.sum(axis=-2)
+    S1  = np.einsum('...tr,ti->...ri', C, X)
+    S2  = np.einsum('...tr,ti,tj->...rij', C, X, X)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu  = S1 / n[..., None]
+        cov = (S2 - n[..., None, None] * mu[..., :, None] * mu[..., None, :]) \
+              / (n - 1)[..., None, None]
+    return n, mu, cov
+
+
+def _cov_to_corr(cov):
+    sd = np.sqrt(np.diagonal(cov, axis1=-2, axis2=-1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return cov / sd[..., :, None] / sd[..., None, :]
+
+
+def regime_stats(X, masks, crash_q=CRASH_Q):
+    """
+    Conditional statistics for every regime and every column of X at once.
+
+    X: (T, k) returns; masks: (T, R) bool.  Returns dict with
+      n (R,), mean (R, k), sum (R, k), cov / corr (R, k, k),
+      crash_hist (R, k+1): months with exactly j columns in their bottom
+          crash_q quantile (quantiles from the full sample),
+      co_crash (R, k, k): months where both i and j crash.
+    """
+    X = np.asarray(X, float)
+    W = np.asarray(masks, float)
+    n, mu, cov = _weighted_moments(W, X)
+
+    B = X < np.quantile(X, crash_q, axis=0)
+    k = X.shape[1]
+    n_bad = np.eye(k + 1)[B.sum(axis=1)]
+    Bf = B.astype(float)
+    return {
+        'n':          n,
+        'mean':       mu,
+        'sum':        W.T @ X,
+        'cov':        cov,
+        'corr':       _cov_to_corr(cov),
+        'crash_hist': W.T @ n_bad,
+        'co_crash':   np.einsum('tr,ti,tj->rij', W, Bf, Bf),
+    }
+
+
+def bootstrap_counts(T, n_boot=N_BOOT, block=BOOT_BLOCK, seed=BOOT_SEED):
+    """
+    (n_boot, T) multiplicity of each month in a moving-block bootstrap
+    resample of length T (block=1 is the ordinary iid bootstrap).
+    """
+    rng = np.random.default_rng(seed)
+    if block <= 1:
+        return rng.multinomial(T, np.full(T, 1.0 / T), size=n_boot).astype(float)
+    n_blocks = -(-T // block)
+    starts = rng.integers(0, T - block + 1, size=(n_boot, n_blocks))
+    rows = (starts[:, :, None] + np.arange(block)).reshape(n_boot, -1)[:, :T]
+    C = np.zeros((n_boot, T))
+    np.add.at(C, (np.arange(n_boot)[:, None], rows), 1.0)
+    return C
+
+
+def bootstrap_bands(X, masks, n_boot=N_BOOT, block=BOOT_BLOCK, ci=BOOT_CI,
+                    seed=BOOT_SEED, batch=100):
+    """
+    Percentile confidence bands for the regime means and correlations.
+    Each resample reweights the months, so regime membership stays tied
+    to the month drawn and all regimes are resampled jointly.
+    Returns dict of (lo, hi) pairs: mean (R, k), corr (R, k, k).
+    """
+    X = np.asarray(X, float)
+    W = np.asarray(masks, float)
+    C = bootstrap_counts(len(X), n_boot, block, seed)
+    mus, corrs = [], []
+    for b0 in range(0, n_boot, batch):
+        _, mu, cov = _weighted_moments(C[b0:b0+batch, :, None] * W, X)
+        mus.append(mu); corrs.append(_cov_to_corr(cov))
+    a = (1 - ci) / 2 * 100
+    band = lambda Z: tuple(np.nanpercentile(np.concatenate(Z), [a, 100 - a], axis=0))
+    return {'mean': band(mus), 'corr': band(corrs)}
+
+
+def regime_analysis(mkt, alpha_factors, scores, masks=None, n_boot=N_BOOT,
+                    block=BOOT_BLOCK, **mask_kw):
+    """
+    masks: optional precomputed regime_masks(); otherwise built from
+    mask_kw (bad_window, vol_window, recessions, extra, ...).
+    Returns (stats, bands, masks).
+    """
     df = pd.concat([mkt, alpha_factors, scores], axis=1).dropna()
+    if masks is None:
+        masks = regime_masks(df, **mask_kw)
+    masks = masks.reindex(df.index, fill_value=False)
 
-    # Regime definitions
-    q25 = df['Mkt-RF'].quantile(0.25)
-    df['bad_market'] = df['Mkt-RF'] < q25
-    df['mkt_vol'] = df['Mkt-RF'].rolling(24).std()
-    df['high_vol'] = df['mkt_vol'] > df['mkt_vol'].median()
-
-    recession_periods = [
-        ('1969-12','1970-11'), ('1973-11','1975-03'), ('1980-01','1980-07'),
-        ('1981-07','1982-11'), ('1990-07','1991-03'), ('2001-03','2001-11'),
-        ('2007-12','2009-06'), ('2020-02','2020-04'),
-    ]
-    df['recession'] = False
-    for start, end in recession_periods:
-        df.loc[(df.index >= start) & (df.index <= end), 'recession'] = True
+    cols = list(df.columns)
+    col  = {c: i for i, c in enumerate(cols)}
+    reg  = {r: i for i, r in enumerate(masks.columns)}
+    st    = regime_stats(df.values, masks.values)
+    bands = bootstrap_bands(df.values, masks.values, n_boot=n_boot, block=block) \
+            if n_boot else None
 
     factors_of_interest = ['SMB','HML','RMW','CMA']
-    pcs_of_interest     = ['PC1','PC2','PC3']
+    heads = {'all': 'All', 'bad_market': 'Bad Mkt', 'good_market': 'Good Mkt',
+             'recession': 'Recession', 'high_vol': 'High Vol'}
+    shown = list(masks.columns)
 
     # 1. Factor mean returns by regime
     print("\n── Factor Mean Monthly Returns by Regime ────────────────────────")
-    print(f"  {'Factor':<6}  {'All':>7}  {'Bad Mkt':>8}  {'Good Mkt':>9}  {'Recession':>10}  {'High Vol':>9}")
-    print("  " + "-" * 60)
+    print(f"  {'Factor':<6}" + "".join(f"  {heads.get(r, r)[:11]:>11}" for r in shown))
+    print("  " + "-" * (6 + 13 * len(shown)))
     for f in factors_of_interest:
-        print(f"  {f:<6}  "
-              f"{df[f].mean():>+7.3f}  "
-              f"{df.loc[df['bad_market'],f].mean():>+8.3f}  "
-              f"{df.loc[~df['bad_market'],f].mean():>+9.3f}  "
-              f"{df.loc[df['recession'],f].mean():>+10.3f}  "
-              f"{df.loc[df['high_vol'],f].mean():>+9.3f}")
+        print(f"  {f:<6}" + "".join(f"  {st['mean'][reg[r], col[f]]:>+11.3f}" for r in shown))
+    if bands is not None:
+        lo, hi = bands['mean']
+        print(f"  {int(BOOT_CI*100)}% bootstrap bands ({n_boot} resamples, block={block}):")
+        for f in factors_of_interest:
+            print(f"  {f:<6}" + "".join(
+                f"  {lo[reg[r], col[f]]:>+5.2f}/{hi[reg[r], col[f]]:<+5.2f}" for r in shown))
+    print(f"  {'Months':<6}" + "".join(f"  {int(st['n'][reg[r]]):>11d}" for r in shown))
 
     # 2. Conditional PC correlations
     print("\n── PC Pairwise Correlations: Unconditional vs Bad States ────────")
-    print(f"  {'Pair':<12}  {'Unconditional':>14}  {'Bad Market':>11}  {'Recession':>10}  {'High Vol':>9}")
-    print("  " + "-" * 62)
+    print(f"  {'Pair':<12}" + "".join(f"  {heads.get(r, r)[:11]:>11}" for r in shown))
+    print("  " + "-" * (12 + 13 * len(shown)))
     for p1, p2 in [('PC1','PC2'),('PC1','PC3'),('PC2','PC3')]:
-        print(f"  {p1+'/'+p2:<12}  "
-              f"{df[p1].corr(df[p2]):>+14.4f}  "
-              f"{df.loc[df['bad_market'],[p1,p2]].corr().iloc[0,1]:>+11.4f}  "
-              f"{df.loc[df['recession'],[p1,p2]].corr().iloc[0,1]:>+10.4f}  "
-              f"{df.loc[df['high_vol'],[p1,p2]].corr().iloc[0,1]:>+9.4f}")
+        i, j = col[p1], col[p2]
+        print(f"  {p1+'/'+p2:<12}" + "".join(f"  {st['corr'][reg[r], i, j]:>+11.4f}" for r in shown))
+        if bands is not None:
+            lo, hi = bands['corr']
+            print(f"  {'  band':<12}" + "".join(
+                f"  {lo[reg[r], i, j]:>+5.2f}/{hi[reg[r], i, j]:<+5.2f}" for r in shown))
 
     # 3. Simultaneous factor crashes
     print("\n── Simultaneous Factor Crashes ──────────────────────────────────")
-    bad_q = pd.DataFrame({f: df[f] < df[f].quantile(0.25) for f in factors_of_interest})
-    n_bad = bad_q.sum(axis=1)
+    sub  = regime_stats(df[factors_of_interest].values, masks.values)
+    hist = sub['crash_hist'][reg['all']]
     for k in range(5):
         label = f"ALL {len(factors_of_interest)}" if k == 4 else str(k)
-        count = (n_bad == k).sum()
-        pct   = (n_bad == k).mean() * 100
-        print(f"  {label} factors in bottom quartile: {count:4d} months ({pct:.1f}%)")
+        print(f"  {label} factors in bottom quartile: {int(hist[k]):4d} months ({hist[k]/len(df)*100:.1f}%)")
     print(f"  (Expected if fully independent: {0.25**4*100:.2f}%)")
+    print(f"  Share of months with 3+ crashes by regime:")
+    for r in shown:
+        h = sub['crash_hist'][reg[r]]
+        share = h[3:].sum() / h.sum() if h.sum() else float('nan')
+        print(f"    {heads.get(r, r):<12} {share*100:5.1f}%  ({int(h.sum())} months)")
 
     # 4. Recession premium concentration
     print("\n── Recession Premium Concentration ─────────────────────────────")
-    rec_months = df['recession'].sum()
+    rec_months = int(st['n'][reg['recession']])
     print(f"  Recession months: {rec_months} of {len(df)} ({rec_months/len(df)*100:.1f}%)\n")
     print(f"  {'Factor':<6}  {'Total premium':>14}  {'Recession share':>16}  Interpretation")
     print("  " + "-" * 70)
     for f in factors_of_interest:
-        total = df[f].sum()
-        rec   = df.loc[df['recession'], f].sum()
+        total = st['sum'][reg['all'], col[f]]
+        rec   = st['sum'][reg['recession'], col[f]]
         share = rec / total if total != 0 else float('nan')
         interp = "concentrated in recessions" if share > 0.3 else (
                  "LOST in recessions"         if share < 0  else "spread evenly")
@@ -267,10 +413,11 @@ def regime_analysis(mkt, alpha_factors, scores):
     print("\n── Factor-Market Correlation: Bad vs Good States ────────────────")
     print(f"  {'Factor':<6}  {'Overall':>8}  {'Bad Mkt':>8}  {'Good Mkt':>9}  {'Ratio':>8}")
     print("  " + "-" * 50)
+    m = col['Mkt-RF']
     for f in factors_of_interest:
-        overall   = df[f].corr(df['Mkt-RF'])
-        bad_corr  = df.loc[df['bad_market'],  [f,'Mkt-RF']].corr().iloc[0,1]
-        good_corr = df.loc[~df['bad_market'], [f,'Mkt-RF']].corr().iloc[0,1]
+        overall   = st['corr'][reg['all'],         col[f], m]
+        bad_corr  = st['corr'][reg['bad_market'],  col[f], m]
+        good_corr = st['corr'][reg['good_market'], col[f], m]
         ratio     = bad_corr / good_corr if good_corr != 0 else float('nan')
         print(f"  {f:<6}  {overall:>+8.4f}  {bad_corr:>+8.4f}  {good_corr:>+9.4f}  {ratio:>+8.3f}")
 
@@ -284,8 +431,173 @@ def regime_analysis(mkt, alpha_factors, scores):
     print("  If crashes are genuinely independent, the multi-factor structure")
     print("  is real and the theoretical framework has an unresolved gap.")
 
-
-# ── 8. MAIN ───────────────────────────────────────────────────────────────────
+    return st, bands, masks
+
+
+# ── 8. ROLLING PCA ────────────────────────────────────────────────────────────
+
+ROLL_WINDOW = 120      # months per window (expanding: first window length)
+ROLL_STEP   = 1
+MIN_OBS     = 100      # portfolio months needed for an F statistic
+ROLL_OUT    = 'ff5_pca_rolling.csv'
+
+
+def _prefix(A):
+    """Prefix sums along axis 0 with a leading zero row: window [s, e) = P[e] - P[s]."""
+    P = np.zeros((len(A) + 1,) + A.shape[1:])
+    np.cumsum(A, axis=0, out=P[1:])
+    return P
+
+
+def window_bounds(T, window=ROLL_WINDOW, step=ROLL_STEP, mode='rolling'):
+    """(start, end) row ranges, end exclusive, for rolling or expanding windows."""
+    ends = np.arange(window, T + 1, step)
+    starts = ends - window if mode == 'rolling' else np.zeros_like(ends)
+    return starts, ends
+
+
+def rolling_pca(alpha_factors, starts, ends):
+    """
+    PCA of the standardised factors (as run_pca) in every window.
+    Window covariances come from prefix sums of x and x x', so each window
+    costs O(k^2) regardless of length; the k x k eigenproblems are solved
+    as one batch.  Eigenvector signs are aligned to the previous window
+    (first window: largest loading positive) so loadings are continuous.
+
+    Returns evr (W, k), loadings (W, k, k) with loadings[w, i] = PC i+1,
+    sd (W, k) factor std used for scaling.
+    """
+    X = alpha_factors.values.astype(float)
+    P1 = _prefix(X)
+    P2 = _prefix(X[:, :, None] * X[:, None, :])
+    n  = (ends - starts).astype(float)
+    mu = (P1[ends] - P1[starts]) / n[:, None]
+    cov = ((P2[ends] - P2[starts]) - n[:, None, None] * mu[:, :, None] * mu[:, None, :]) \
+          / (n - 1)[:, None, None]
+    sd  = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+    corr = cov / sd[:, :, None] / sd[:, None, :]
+
+    vals, vecs = np.linalg.eigh(corr)
+    vals, vecs = vals[:, ::-1], vecs[:, :, ::-1]
+    L = np.transpose(vecs, (0, 2, 1)).copy()
+    prev = None
+    for w in range(len(L)):
+        if prev is None:
+            ref = np.sign(L[w][np.arange(len(L[w])), np.abs(L[w]).argmax(axis=1)])
+        else:
+            ref = np.sign(np.sum(L[w] * prev, axis=1))
+        L[w] *= np.where(ref == 0, 1, ref)[:, None]
+        prev = L[w]
+    evr = vals / vals.sum(axis=1, keepdims=True)
+    return evr, L, sd
+
+
+def rolling_f_tests(mkt, alpha_factors, port_excess, starts, ends, loadings, sd,
+                    min_obs=MIN_OBS):
+    """
+    Incremental F statistics for adding PC1..PCk to the market model, as
+    incremental_f_tests, in every window, with the PCs from that window.
+
+    Each portfolio's regressions use only its own non-missing months, so
+    the cross products of z = [1, mkt, factors] with themselves and with
+    y are prefix-summed per portfolio.  A model with the first j PCs uses
+    regressors z A_j (the PCs are linear in the factors, and centring is
+    absorbed by the constant), so its RSS is yy - b' A (A' G A)^-1 A' b:
+    every window, model and portfolio is one batched solve.
+
+    Returns (W, k) mean F across portfolios with at least min_obs months.
+    """
+    Y = port_excess.reindex(alpha_factors.index).values.astype(float)
+    Z = np.column_stack([np.ones(len(Y)), mkt.reindex(alpha_factors.index).values,
+                         alpha_factors.values]).astype(float)
+    V = np.isfinite(Y) & np.isfinite(Z).all(axis=1)[:, None]
+    Yz = np.where(V, Y, 0.0)
+    Vf = V.astype(float)
+
+    PG = _prefix(np.einsum('tp,ti,tj->tpij', Vf, Z, Z))    # (T+1, N, m, m)
+    Pb = _prefix(Yz[:, :, None] * Z[:, None, :])            # (T+1, N, m)
+    Py = _prefix(Yz**2)
+    Pn = _prefix(Vf)
+
+    k = alpha_factors.shape[1]
+    m = Z.shape[1]
+    F = np.full((len(starts), k), np.nan)
+    for w, (s, e) in enumerate(zip(starts, ends)):
+        G  = PG[e] - PG[s]
+        b  = Pb[e] - Pb[s]
+        yy = Py[e] - Py[s]
+        n  = Pn[e] - Pn[s]
+        ok = n >= min_obs
+        if not ok.any():
+            continue
+        G, b, yy, n = G[ok], b[ok], yy[ok], n[ok]
+        A = np.zeros((m, 2 + k))
+        A[0, 0] = A[1, 1] = 1.0
+        A[2:, 2:] = (loadings[w] / sd[w][None, :]).T
+        rss = []
+        for j in range(k + 1):
+            Aj = A[:, :2 + j]
+            Gj = Aj.T @ G @ Aj
+            bj = b @ Aj
+            coef = np.linalg.solve(Gj, bj[:, :, None])[:, :, 0]
+            rss.append(yy - np.sum(bj * coef, axis=1))
+        for j in range(1, k + 1):
+            df_resid = n - (2 + j)
+            F[w, j - 1] = np.mean((rss[j - 1] - rss[j]) / (rss[j] / df_resid))
+    return F
+
+
+def rolling_collapse_test(mkt, alpha_factors, port_sets, window=ROLL_WINDOW,
+                          step=ROLL_STEP, mode='rolling', out_path=ROLL_OUT):
+    """
+    Rerun the PCA collapse test in rolling or expanding windows.
+
+    port_sets: {label: port_excess}.  Returns one row per window (indexed
+    by the window's last month) with the explained-variance ratios,
+    loadings and, per portfolio set, the mean incremental F for each PC.
+    Written to out_path as CSV (one row per window, fixed precision) so
+    runs can be plotted or diffed directly.
+    """
+    alpha_factors = alpha_factors.dropna()
+    mkt = mkt.reindex(alpha_factors.index)
+    starts, ends = window_bounds(len(alpha_factors), window, step, mode)
+    if len(starts) == 0:
+        print(f"  Need at least {window} months for a {mode} window")
+        return pd.DataFrame()
+
+    evr, L, sd = rolling_pca(alpha_factors, starts, ends)
+    names = list(alpha_factors.columns)
+    k = len(names)
+    out = {'start': alpha_factors.index[starts].strftime('%Y-%m'),
+           'n_months': ends - starts}
+    for i in range(k):
+        out[f'evr_PC{i+1}'] = evr[:, i]
+    for i in range(k):
+        for j, f in enumerate(names):
+            out[f'load_PC{i+1}_{f}'] = L[:, i, j]
+    for label, port_excess in port_sets.items():
+        F = rolling_f_tests(mkt, alpha_factors, port_excess, starts, ends, L, sd)
+        for i in range(k):
+            out[f'F{label}_PC{i+1}'] = F[:, i]
+    res = pd.DataFrame(out, index=alpha_factors.index[ends - 1])
+    res.index.name = 'end'
+
+    print(f"\n── {mode.capitalize()} PCA ({window}-month windows, step {step}) ───────────────")
+    print(f"  {len(res)} windows, {res.index[0].strftime('%Y-%m')} to {res.index[-1].strftime('%Y-%m')}")
+    print(f"  {'':<10}  {'min':>7}  {'median':>7}  {'max':>7}  {'last':>7}")
+    show = [f'evr_PC{i+1}' for i in range(k)] + \
+           [f'F{label}_PC{i+1}' for label in port_sets for i in range(k)]
+    for c in show:
+        v = res[c]
+        print(f"  {c:<10}  {v.min():>7.3f}  {v.median():>7.3f}  {v.max():>7.3f}  {v.iloc[-1]:>7.3f}")
+
+    if out_path:
+        res.to_csv(out_path, float_format='%.6g')
+        print(f"  Saved to {out_path}")
+    return res
+
+
+# ── 9. MAIN ───────────────────────────────────────────────────────────────────
 
 def main():
     print("=" * 65)
@@ -323,6 +635,12 @@ def main():
     print("=" * 65)
     regime_analysis(mkt, alpha_factors, scores)
 
+    print("\n" + "=" * 65)
+    print("ROLLING-WINDOW PCA")
+    print("=" * 65)
+    rolling_collapse_test(mkt, alpha_factors,
+                          {'25': port_excess_25, '49': port_excess_49})
+
     print("\nDone.")
 
 
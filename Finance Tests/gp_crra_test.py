@@ -25,7 +25,9 @@ Pipeline:
    Compare with sys_var / sys_tail from the existing pipeline.
 """
 
-import sys, warnings
+import sys, os, warnings, hashlib
+import multiprocessing as mp
+from pathlib import Path
 warnings.filterwarnings('ignore')
 
 import numpy as np
@@ -48,11 +50,10 @@ try:
 except ImportError:
     HAS_SKLEARN_GP = False
 
-if not HAS_GPY and not HAS_SKLEARN_GP:
-    raise ImportError("Neither GPy nor sklearn GP available. "
-                      "Install either: pip install GPy  or  pip install scikit-learn")
-if not HAS_GPY:
-    print("INFO: GPy not found – using sklearn GaussianProcessRegressor")
+# GP backend for fit_gp_systematic:
+#   'kalman' — O(n) state-space Matérn-3/2 (no extra dependency)
+#   'exact'  — GPy if installed, else sklearn GaussianProcessRegressor
+GP_BACKEND = 'kalman'
 
 # ── Data loading (same as mediation_test.py) ─────────────────────────────────
 
@@ -152,15 +153,123 @@ def estimate_factor_loadings(r_exc, factors_window):
 
 # ── GP regression ─────────────────────────────────────────────────────────────
 
-def fit_gp_systematic(rm_excess, ri_excess, n_grid=200):
+def _matern32_kalman(x, y, ell, s2, n2, smooth=False):
+    """
+    Exact GP regression with a Matérn-3/2 kernel on sorted 1-D inputs via
+    its state-space form (state = [f, f']), in O(n).
+
+    x must be sorted ascending.  Returns the negative log marginal
+    likelihood, and with smooth=True also the posterior mean of f at x
+    (Rauch-Tung-Striebel smoother).
+    """
+    lam  = np.sqrt(3.0) / ell
+    pi22 = lam * lam * s2                       # stationary var of f'
+    n    = len(x)
+    m1 = m2 = 0.0
+    p11, p12, p22 = s2, 0.0, pi22
+    nll = 0.5 * n * np.log(2*np.pi)
+    if smooth:
+        filt, pred, trans = [], [], []
+    for k in range(n):
+        if k > 0:
+            d  = x[k] - x[k-1]
+            e  = np.exp(-lam * d)
+            a11, a12 = e*(1 + lam*d), e*d
+            a21, a22 = -e*lam*lam*d, e*(1 - lam*d)
+            m1, m2 = a11*m1 + a12*m2, a21*m1 + a22*m2
+            # P = A (P - P∞) A' + P∞
+            q11, q12, q22 = p11 - s2, p12, p22 - pi22
+            b11, b12 = a11*q11 + a12*q12, a11*q12 + a12*q22
+            b21, b22 = a21*q11 + a22*q12, a21*q12 + a22*q22
+            p11 = b11*a11 + b12*a12 + s2
+            p12 = b11*a21 + b12*a22
+            p22 = b21*a21 + b22*a22 + pi22
+            if smooth:
+                trans.append((a11, a12, a21, a22))
+        if smooth:
+            pred.append((m1, m2, p11, p12, p22))
+        S  = p11 + n2
+        v  = y[k] - m1
+        k1, k2 = p11 / S, p12 / S
+        m1, m2 = m1 + k1*v, m2 + k2*v
+        p11, p12, p22 = p11 - k1*p11, p12 - k1*p12, p22 - k2*p12
+        nll += 0.5 * (np.log(S) + v*v / S)
+        if smooth:
+            filt.append((m1, m2, p11, p12, p22))
+    if not smooth:
+        return nll
+
+    mean = np.empty(n)
+    s1, s2_ = filt[-1][0], filt[-1][1]
+    mean[-1] = s1
+    for k in range(n-2, -1, -1):
+        f1, f2, f11, f12, f22 = filt[k]
+        q1, q2, r11, r12, r22 = pred[k+1]
+        a11, a12, a21, a22 = trans[k]
+        # G = P_f A' P_pred⁻¹
+        c11, c12 = f11*a11 + f12*a12, f11*a21 + f12*a22
+        c21, c22 = f12*a11 + f22*a12, f12*a21 + f22*a22
+        det = r11*r22 - r12*r12
+        if abs(det) < 1e-300:
+            s1, s2_ = f1, f2
+        else:
+            i11, i12, i22 = r22/det, -r12/det, r11/det
+            g11, g12 = c11*i11 + c12*i12, c11*i12 + c12*i22
+            g21, g22 = c21*i11 + c22*i12, c21*i12 + c22*i22
+            d1, d2 = s1 - q1, s2_ - q2
+            s1, s2_ = f1 + g11*d1 + g12*d2, f2 + g21*d1 + g22*d2
+        mean[k] = s1
+    return nll, mean
+
+
+def _fit_gp_kalman(rm_c, ri_c, init=None):
+    """
+    Matérn-3/2 + white-noise GP fit with the state-space likelihood.
+    Mirrors the sklearn path: y is normalised, the length scale is bounded
+    to [0.3, 6] × std(R_m), and hyperparameters are found by L-BFGS-B on
+    log(ℓ, σ², σ²_n).  init (log-params) replaces the restarts — pass the
+    previous portfolio's fit in the same window.
+    Returns (fitted mean at rm_c, log-params).
+    """
+    order = np.argsort(rm_c, kind='stable')
+    x = rm_c[order]
+    y_mu, y_sd = float(np.mean(ri_c)), float(np.std(ri_c))
+    y_sd = y_sd if y_sd > 0 else 1.0
+    y = ((ri_c - y_mu) / y_sd)[order]
+
+    rm_std = float(np.std(rm_c))
+    bounds = [(np.log(rm_std*0.3), np.log(rm_std*6.0)),
+              (np.log(1e-5), np.log(1e5)),
+              (np.log(1e-5), np.log(1e5))]
+    x0 = init if init is not None else [np.log(rm_std*1.5), 0.0, np.log(0.1)]
+    x0 = [float(np.clip(v, lo, hi)) for v, (lo, hi) in zip(x0, bounds)]
+
+    xl, yl = x.tolist(), y.tolist()
+    obj = lambda th: _matern32_kalman(xl, yl, *np.exp(th))
+    res = optimize.minimize(obj, x0, method='L-BFGS-B', bounds=bounds)
+
+    _, mean = _matern32_kalman(xl, yl, *np.exp(res.x), smooth=True)
+    fitted = np.empty(len(x))
+    fitted[order] = mean * y_sd + y_mu
+    return fitted, res.x
+
+
+def fit_gp_systematic(rm_excess, ri_excess, n_grid=200,
+                      backend=None, init=None, seed=None):
     """
     Fit a Gaussian process regression of portfolio excess returns on
     market excess returns.
 
+    backend: 'kalman' (O(n) state-space Matérn-3/2) or 'exact' (GPy /
+    sklearn); defaults to GP_BACKEND.  init: kalman log-hyperparameters
+    to start from (see build_gp_panel).  seed: random state for the
+    sklearn optimiser restarts, so panel rebuilds are reproducible.
+
     Returns:
       sys_returns : array of GP-predicted systematic returns at each
                     observed market return (same length as input)
-      gp_model    : fitted GP object (for diagnostics)
+      gp_model    : fitted GP object (for diagnostics); for the kalman
+                    backend, its fitted log-hyperparameters
       length_scale: estimated GP length scale
     """
     rm = np.array(rm_excess, dtype=float)
@@ -174,6 +283,15 @@ def fit_gp_systematic(rm_excess, ri_excess, n_grid=200):
     rm_c = rm[mask].reshape(-1, 1)
     ri_c = ri[mask]
 
+    if (backend or GP_BACKEND) == 'kalman':
+        mu_pred, theta = _fit_gp_kalman(rm_c.ravel(), ri_c, init=init)
+        sys_ret = np.full(len(rm), np.nan)
+        sys_ret[mask] = mu_pred
+        return sys_ret, theta, float(np.exp(theta[0]))
+
+    if not HAS_GPY and not HAS_SKLEARN_GP:
+        raise ImportError("Neither GPy nor sklearn GP available. "
+                          "Install either: pip install GPy  or  pip install scikit-learn")
     if HAS_GPY:
         # Matern 3/2 kernel — once differentiable, allows curvature in tails
         # Length scale initialised at market return std (typical scale of variation)
@@ -208,7 +326,7 @@ def fit_gp_systematic(rm_excess, ri_excess, n_grid=200):
                          length_scale_bounds=(rm_std*0.3, rm_std*6)) +
                   WhiteKernel(noise_level=np.var(ri_c)*0.1))
         gp = GaussianProcessRegressor(kernel=kernel, n_restarts_optimizer=3,
-                                       normalize_y=True)
+                                       normalize_y=True, random_state=seed)
         gp.fit(rm_c, ri_c)
         mu_pred = gp.predict(rm_c)
         sys_ret = np.full(len(rm), np.nan)
@@ -316,13 +434,207 @@ def compute_risk_premium(sys_returns, gamma, W=1.0):
 
 # ── Panel building with GP ────────────────────────────────────────────────────
 
+N_WORKERS    = None         # process pool size (None = all cores, 1 = serial)
+GP_CACHE_DIR = 'gp_cache'     # per-window GP fit cache (None = off)
+GP_SEED      = 0              # base seed for the exact backend's restarts
+
+_PANEL = {}
+
+def _init_worker(panel):
+    _PANEL.update(panel)
+
+
+def _window_rows(t, P):
+    """
+    Panel rows for every portfolio × forward window starting at t.
+
+    With the kalman backend each fit starts from the previous portfolio's
+    hyperparameters in the same window, so a window's fits form one chain
+    and the window is the unit of work handed to the process pool.
+    """
+    all_factors, port_series = P['all_factors'], P['port_series']
+    lookback_years     = P['lookback_years']
+    forward_years_list = P['forward_years_list']
+    label, backend     = P['label'], P['backend']
+    rm_full = all_factors['Mkt-RF'] / 100
+    rf_full = all_factors['RF']     / 100
+
+    lookback_start = t - pd.DateOffset(years=lookback_years)
+    f_back = all_factors.loc[lookback_start:t]
+    rows = []
+
+    rm_month_t = float(rm_full.loc[t]) if t in rm_full.index else np.nan
+    gp_init = {}                            # fwd_years → log-params
+
+    for j, (port_name, s_raw) in enumerate(port_series.items()):
+        s  = s_raw.dropna() / 100
+        rf = rf_full
+
+        # Factor loadings from lookback window
+        r_back_idx = s.index.intersection(f_back.index)
+        if len(r_back_idx) < 24:
+            continue
+        r_back = s.loc[r_back_idx] - rf.loc[r_back_idx]
+        loadings = estimate_factor_loadings(r_back, f_back.loc[r_back_idx])
+        if loadings is None:
+            continue
+
+        for fwd_years in forward_years_list:
+            fwd_end = t + pd.DateOffset(years=fwd_years)
+            f_fwd   = all_factors.loc[t:fwd_end]
+
+            r_fwd_idx = s.index.intersection(f_fwd.index)
+            if len(r_fwd_idx) < 12:
+                continue
+
+            ri_fwd = (s.loc[r_fwd_idx] - rf.loc[r_fwd_idx]).values
+            rm_fwd = (rm_full.loc[r_fwd_idx]).values
+            rf_fwd_mean = float(rf.loc[r_fwd_idx].mean()) * 12
+
+            # ── GP regression ──────────────────────────────────────────
+            seed = int(np.random.SeedSequence(
+                [GP_SEED, t.year*12 + t.month, j, fwd_years]
+            ).generate_state(1)[0])
+            sys_ret, gp_model, ls = fit_gp_systematic(
+                rm_fwd, ri_fwd, backend=backend,
+                init=gp_init.get(fwd_years), seed=seed)
+            if sys_ret is None:
+                continue
+            if (backend or GP_BACKEND) == 'kalman':
+                gp_init[fwd_years] = gp_model
+            sys_ret_clean = sys_ret[np.isfinite(sys_ret)]
+            if len(sys_ret_clean) < 8:
+                continue
+
+            # ── Distribution summary stats ─────────────────────────────
+            mean_sys  = float(np.mean(sys_ret_clean)) * 12  # annualised
+            std_sys   = float(np.std(sys_ret_clean))  * np.sqrt(12)
+            skew_sys  = float(stats.skew(sys_ret_clean))
+            kurt_sys  = float(stats.kurtosis(sys_ret_clean))
+
+            # sys_var_gp: variance of systematic returns (annualised)
+            sys_var_gp = float(np.var(sys_ret_clean)) * 12
+
+            # sys_tail_gp: mean systematic return in bottom 20% market months
+            q20 = np.percentile(rm_fwd[np.isfinite(rm_fwd)], 20)
+            tail_mask = rm_fwd <= q20
+            tail_sys  = sys_ret[tail_mask & np.isfinite(sys_ret)]
+            sys_tail_gp = float(np.mean(tail_sys)) * 12 \
+                          if len(tail_sys) >= 3 else np.nan
+
+            # Realised mean excess return (annualised)
+            fwd_mean_exc = float(np.mean(ri_fwd)) * 12
+
+            # Market wealth level proxy: cumulative market return
+            # relative to start of window — proxy for W_t / W_0
+            cum_mkt = float(np.exp(np.sum(np.log1p(rm_fwd))) )
+            # Normalise so W=1 at average market level
+            W_proxy = max(0.1, cum_mkt)
+
+            # Actual observed excess returns (for CRRA utility)
+            ri_fwd_clean = ri_fwd[np.isfinite(ri_fwd)]
+
+            # Demeaned sys_tail: pure shape measure, mean removed
+            # sys_tail_gp_dm = E[R_sys|bad] - E[R_sys]
+            # This isolates tail asymmetry from mean return level
+            sys_tail_gp_dm = (sys_tail_gp - mean_sys)                                   if np.isfinite(sys_tail_gp) else np.nan
+
+            # Polynomial coskewness (Lambert-Hubner style)
+            poly_coskew = np.nan; poly_cokurt = np.nan
+            try:
+                mask_p = np.isfinite(ri_fwd) & np.isfinite(rm_fwd)
+                if mask_p.sum() >= 20:
+                    rm_s = (rm_fwd[mask_p]-np.mean(rm_fwd[mask_p]))
+                    rm_s = rm_s / (np.std(rm_s) if np.std(rm_s)>0 else 1)
+                    ri_p = ri_fwd[mask_p]
+                    Xp = sm.add_constant(pd.DataFrame(
+                        {'rm':rm_s,'rm2':rm_s**2,'rm3':rm_s**3},
+                        index=range(len(rm_s))))
+                    rp = sm.OLS(ri_p, Xp).fit()
+                    poly_coskew = float(rp.params.get('rm2', np.nan))
+                    poly_cokurt = float(rp.params.get('rm3', np.nan))
+            except Exception:
+                pass
+
+            row = {
+                'date':          t,
+                'portfolio':     port_name,
+                'fwd_years':     fwd_years,
+                'label':         label,
+                'fwd_mean_exc':  fwd_mean_exc,
+                'rf_ann':        rf_fwd_mean,
+                'mean_sys_gp':   mean_sys,
+                'std_sys_gp':    std_sys,
+                'skew_sys_gp':   skew_sys,
+                'kurt_sys_gp':   kurt_sys,
+                'sys_var_gp':    sys_var_gp,
+                'sys_tail_gp':   sys_tail_gp,
+                'sys_tail_gp_dm': sys_tail_gp_dm,
+                'poly_coskew':   poly_coskew,
+                'poly_cokurt':   poly_cokurt,
+                'gp_ls':         ls,
+                'W_proxy':       W_proxy,
+                'n_obs':         len(ri_fwd),
+                # GP systematic returns (conditional means at each R_m)
+                '_sys_ret':      sys_ret_clean.tolist(),
+                # Market returns paired with each sys_ret observation
+                # Used for market-path bootstrap in terminal wealth calculation
+                '_rm_ret':       rm_fwd[np.isfinite(sys_ret)].tolist(),
+                # Actual observed excess returns
+                '_obs_ret':      ri_fwd_clean.tolist(),
+                **loadings,
+            }
+            rows.append(row)
+
+    return rows
+
+
+def _window_task(t):
+    return t, _window_rows(t, _PANEL)
+
+
+def _window_key(t, P):
+    """
+    Hash of everything a window's fits depend on: the factor and portfolio
+    data from the lookback start to the longest forward end, the window
+    settings, the GP backend and this script's source (so any code change
+    invalidates the cached rows).
+    """
+    lo = t - pd.DateOffset(years=P['lookback_years'])
+    hi = t + pd.DateOffset(years=max(P['forward_years_list']))
+    h  = hashlib.sha1(Path(__file__).read_bytes())
+    h.update(repr((t, P['label'], P['lookback_years'],
+                   tuple(P['forward_years_list']),
+                   P['backend'] or GP_BACKEND, GP_SEED)).encode())
+    f = P['all_factors'].loc[lo:hi]
+    h.update(f.index.asi8.tobytes())
+    h.update(repr(list(f.columns)).encode())
+    h.update(np.ascontiguousarray(f.values, dtype=float).tobytes())
+    for name, s in P['port_series'].items():
+        w = s.loc[lo:hi]
+        h.update(name.encode())
+        h.update(w.index.asi8.tobytes())
+        h.update(np.ascontiguousarray(w.values, dtype=float).tobytes())
+    return h.hexdigest()
+
+
 def build_gp_panel(all_factors, portfolios, label='industry',
                    lookback_years=5, forward_years_list=(3, 5),
-                   step_years=5):
+                   step_years=5, backend=None, n_workers=N_WORKERS,
+                   cache_dir=GP_CACHE_DIR):
     """
     Build a panel of GP-estimated systematic return distributions and
     CRRA-implied risk measures.
 
+    With the kalman backend, each window's GP fits start from the previous
+    portfolio's hyperparameters in that window (all portfolios share the
+    same market inputs), so one fit per portfolio suffices.
+
+    Windows are fitted in a process pool (n_workers; 1 = serial).  Each
+    window's rows are cached in cache_dir under a hash of its input data
+    (see _window_key), so a rerun on unchanged data skips the GP fits;
+    cache_dir=None disables the cache.
+
     For each portfolio × forward window:
       - GP regresses R_i on R_m over the forward window
       - Computes E[R_systematic], sys_var_gp, sys_tail_gp
@@ -333,9 +645,6 @@ def build_gp_panel(all_factors, portfolios, label='industry',
     print(f"\nBuilding GP panel [{label}] "
           f"(lookback={lookback_years}y, forward={forward_years_list})...")
 
-    rm_full = all_factors['Mkt-RF'] / 100
-    rf_full = all_factors['RF']     / 100
-
     # Flatten portfolio dict
     port_series = {}
     if isinstance(portfolios, dict) and not isinstance(
@@ -351,132 +660,43 @@ def build_gp_panel(all_factors, portfolios, label='industry',
     start = all_factors.index.min() + pd.DateOffset(years=lookback_years)
     end   = all_factors.index.max() - pd.DateOffset(
                 years=max(forward_years_list))
+    dates = []
     t = start
-
-    panels = {fy: [] for fy in forward_years_list}
-    n_total = 0
-
     while t <= end:
-        lookback_start = t - pd.DateOffset(years=lookback_years)
-        f_back = all_factors.loc[lookback_start:t]
-
-        rm_month_t = float(rm_full.loc[t]) if t in rm_full.index else np.nan
-
-        for port_name, s_raw in port_series.items():
-            s  = s_raw.dropna() / 100
-            rf = rf_full
-
-            # Factor loadings from lookback window
-            r_back_idx = s.index.intersection(f_back.index)
-            if len(r_back_idx) < 24:
-                continue
-            r_back = s.loc[r_back_idx] - rf.loc[r_back_idx]
-            loadings = estimate_factor_loadings(r_back, f_back.loc[r_back_idx])
-            if loadings is None:
-                continue
+        dates.append(t)
+        t += pd.DateOffset(years=step_years)
 
-            for fwd_years in forward_years_list:
-                fwd_end = t + pd.DateOffset(years=fwd_years)
-                f_fwd   = all_factors.loc[t:fwd_end]
-
-                r_fwd_idx = s.index.intersection(f_fwd.index)
-                if len(r_fwd_idx) < 12:
-                    continue
-
-                ri_fwd = (s.loc[r_fwd_idx] - rf.loc[r_fwd_idx]).values
-                rm_fwd = (rm_full.loc[r_fwd_idx]).values
-                rf_fwd_mean = float(rf.loc[r_fwd_idx].mean()) * 12
-
-                # ── GP regression ──────────────────────────────────────────
-                sys_ret, gp_model, ls = fit_gp_systematic(rm_fwd, ri_fwd)
-                if sys_ret is None:
-                    continue
-                sys_ret_clean = sys_ret[np.isfinite(sys_ret)]
-                if len(sys_ret_clean) < 8:
-                    continue
-
-                # ── Distribution summary stats ─────────────────────────────
-                mean_sys  = float(np.mean(sys_ret_clean)) * 12  # annualised
-                std_sys   = float(np.std(sys_ret_clean))  * np.sqrt(12)
-                skew_sys  = float(stats.skew(sys_ret_clean))
-                kurt_sys  = float(stats.kurtosis(sys_ret_clean))
-
-                # sys_var_gp: variance of systematic returns (annualised)
-                sys_var_gp = float(np.var(sys_ret_clean)) * 12
-
-                # sys_tail_gp: mean systematic return in bottom 20% market months
-                q20 = np.percentile(rm_fwd[np.isfinite(rm_fwd)], 20)
-                tail_mask = rm_fwd <= q20
-                tail_sys  = sys_ret[tail_mask & np.isfinite(sys_ret)]
-                sys_tail_gp = float(np.mean(tail_sys)) * 12 \
-                              if len(tail_sys) >= 3 else np.nan
-
-                # Realised mean excess return (annualised)
-                fwd_mean_exc = float(np.mean(ri_fwd)) * 12
-
-                # Market wealth level proxy: cumulative market return
-                # relative to start of window — proxy for W_t / W_0
-                cum_mkt = float(np.exp(np.sum(np.log1p(rm_fwd))) )
-                # Normalise so W=1 at average market level
-                W_proxy = max(0.1, cum_mkt)
-
-                # Actual observed excess returns (for CRRA utility)
-                ri_fwd_clean = ri_fwd[np.isfinite(ri_fwd)]
-
-                # Demeaned sys_tail: pure shape measure, mean removed
-                # sys_tail_gp_dm = E[R_sys|bad] - E[R_sys]
-                # This isolates tail asymmetry from mean return level
-                sys_tail_gp_dm = (sys_tail_gp - mean_sys)                                   if np.isfinite(sys_tail_gp) else np.nan
-
-                # Polynomial coskewness (Lambert-Hubner style)
-                poly_coskew = np.nan; poly_cokurt = np.nan
-                try:
-                    mask_p = np.isfinite(ri_fwd) & np.isfinite(rm_fwd)
-                    if mask_p.sum() >= 20:
-                        rm_s = (rm_fwd[mask_p]-np.mean(rm_fwd[mask_p]))
-                        rm_s = rm_s / (np.std(rm_s) if np.std(rm_s)>0 else 1)
-                        ri_p = ri_fwd[mask_p]
-                        Xp = sm.add_constant(pd.DataFrame(
-                            {'rm':rm_s,'rm2':rm_s**2,'rm3':rm_s**3},
-                            index=range(len(rm_s))))
-                        rp = sm.OLS(ri_p, Xp).fit()
-                        poly_coskew = float(rp.params.get('rm2', np.nan))
-                        poly_cokurt = float(rp.params.get('rm3', np.nan))
-                except Exception:
-                    pass
-
-                row = {
-                    'date':          t,
-                    'portfolio':     port_name,
-                    'fwd_years':     fwd_years,
-                    'label':         label,
-                    'fwd_mean_exc':  fwd_mean_exc,
-                    'rf_ann':        rf_fwd_mean,
-                    'mean_sys_gp':   mean_sys,
-                    'std_sys_gp':    std_sys,
-                    'skew_sys_gp':   skew_sys,
-                    'kurt_sys_gp':   kurt_sys,
-                    'sys_var_gp':    sys_var_gp,
-                    'sys_tail_gp':   sys_tail_gp,
-                    'sys_tail_gp_dm': sys_tail_gp_dm,
-                    'poly_coskew':   poly_coskew,
-                    'poly_cokurt':   poly_cokurt,
-                    'gp_ls':         ls,
-                    'W_proxy':       W_proxy,
-                    'n_obs':         len(ri_fwd),
-                    # GP systematic returns (conditional means at each R_m)
-                    '_sys_ret':      sys_ret_clean.tolist(),
-                    # Market returns paired with each sys_ret observation
-                    # Used for market-path bootstrap in terminal wealth calculation
-                    '_rm_ret':       rm_fwd[np.isfinite(sys_ret)].tolist(),
-                    # Actual observed excess returns
-                    '_obs_ret':      ri_fwd_clean.tolist(),
-                    **loadings,
-                }
-                panels[fwd_years].append(row)
-                n_total += 1
+    P = {'all_factors': all_factors, 'port_series': port_series,
+         'label': label, 'lookback_years': lookback_years,
+         'forward_years_list': tuple(forward_years_list), 'backend': backend}
+
+    done, paths = {}, {}
+    if cache_dir is not None:
+        Path(cache_dir).mkdir(exist_ok=True)
+        for t in dates:
+            paths[t] = Path(cache_dir) / f'{label}_{_window_key(t, P)}.pkl'
+            if paths[t].exists():
+                done[t] = pd.read_pickle(paths[t])
+    todo = [t for t in dates if t not in done]
+    print(f"  {len(dates)} windows ({len(done)} cached, {len(todo)} to fit)")
+
+    if todo:
+        if n_workers == 1:
+            _init_worker(P)
+            fitted = list(map(_window_task, todo))
+        else:
+            with mp.Pool(min(n_workers or os.cpu_count(), len(todo)),
+                         initializer=_init_worker, initargs=(P,)) as pool:
+                fitted = pool.map(_window_task, todo)
+        for t, rows in fitted:
+            done[t] = rows
+            if cache_dir is not None:
+                pd.to_pickle(rows, paths[t])
 
-        t += pd.DateOffset(years=step_years)
+    panels = {fy: [] for fy in forward_years_list}
+    for t in dates:
+        for row in done[t]:
+            panels[row['fwd_years']].append(row)
 
     result = {}
     for fy in forward_years_list:
@@ -502,8 +722,83 @@ def build_gp_panel(all_factors, portfolios, label='industry',
 
 # ── CRRA parameter estimation ─────────────────────────────────────────────────
 
+def pack_sys_returns(series):
+    """
+    Pack ragged systematic-return lists into a zero-padded (rows × T_max)
+    array plus a length vector (non-finite entries dropped per row).
+    """
+    clean   = [np.asarray(x, dtype=float) for x in series]
+    clean   = [x[np.isfinite(x)] for x in clean]
+    lengths = np.array([len(x) for x in clean], dtype=int)
+    padded  = np.zeros((len(clean), max(lengths.max(initial=0), 1)))
+    for i, x in enumerate(clean):
+        padded[i, :len(x)] = x
+    return padded, lengths
+
+
+def bootstrap_log_terminal_wealth(padded, lengths, n_bootstrap=200,
+                                  seed=0, chunk=256):
+    """
+    Vectorised bootstrap behind compute_terminal_shape_disutility: for
+    each row, draw n_bootstrap i.i.d. paths of its demeaned systematic
+    returns, T_i = length_i months long, and return log terminal wealth
+    (rows × n_bootstrap; NaN for rows with < 12 months).
+
+    This is γ-independent, so it is drawn once per panel and reused for
+    every γ evaluated (common random numbers — the objective is smooth).
+    """
+    rng  = np.random.default_rng(seed)
+    n, T = padded.shape
+    out  = np.full((n, n_bootstrap), np.nan)
+    L    = np.maximum(lengths, 1)
+    mean = padded.sum(axis=1) / L
+    zero = padded - mean[:, None]
+    steps = np.arange(T)
+    for lo in range(0, n, chunk):
+        rows = slice(lo, lo + chunk)
+        Lc   = L[rows]
+        idx  = (rng.random((len(Lc), n_bootstrap, T)) *
+                Lc[:, None, None]).astype(int)
+        path = zero[rows][np.arange(len(Lc))[:, None, None], idx]
+        live = steps[None, None, :] < Lc[:, None, None]
+        out[rows] = np.sum(np.where(live, np.log1p(path), 0.0), axis=2)
+    out = np.maximum(out, np.log(1e-8))
+    out[lengths < 12] = np.nan
+    return out
+
+
+def terminal_shape_disutility_vec(log_tw, lengths, gamma_eff):
+    """
+    compute_terminal_shape_disutility for every row at once, from
+    bootstrap_log_terminal_wealth output, plus its derivative in γ.
+
+    With a = 1-γ the CE terminal wealth is log W_ce = log mean exp(a·L) / a
+    (log-sum-exp, so no overflow at large γ), and
+    d log W_ce / dγ = -(a·E_w[L] - log W_ce·a) / a², E_w the softmax mean.
+    Returns (sd, dsd_dgamma), both (rows,).
+    """
+    a = 1.0 - gamma_eff
+    T = np.maximum(lengths, 1).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        if abs(a) < 1e-6:
+            log_wce  = np.mean(log_tw, axis=1)
+            dlw_da   = 0.5 * np.var(log_tw, axis=1)
+        else:
+            z     = a * log_tw
+            zmax  = np.max(z, axis=1, keepdims=True)
+            ez    = np.exp(z - zmax)
+            F     = np.log(np.mean(ez, axis=1)) + zmax[:, 0]
+            Ew_L  = np.sum(ez * log_tw, axis=1) / np.sum(ez, axis=1)
+            log_wce = F / a
+            dlw_da  = (a * Ew_L - F) / a**2
+        growth = np.exp(log_wce / T)
+        sd     = 1.0 - growth                          # = -r_ce
+        dsd_dg = growth / T * dlw_da                   # d/dγ = -d/da
+    return sd, dsd_dg
+
+
 def fit_crra_parameters(panel_df, use_wealth_scaling=True,
-                        gamma_bounds=(0.5, 200.0)):
+                        gamma_bounds=(0.5, 200.0), n_bootstrap=200, seed=0):
     """
     Estimate CRRA parameter γ (and optionally wealth scaling) by minimising
     cross-sectional pricing errors:
@@ -520,6 +815,12 @@ def fit_crra_parameters(panel_df, use_wealth_scaling=True,
     gamma_bounds : tuple
         Search bounds for γ.
 
+    The systematic returns are packed once into a padded array and the
+    bootstrap terminal-wealth paths drawn once (seeded); each objective
+    evaluation is then a single vectorised expression with an analytic
+    γ-gradient.  CRRA is homothetic, so the terminal-wealth CE return does
+    not depend on W (its gradient is zero).
+
     Returns
     -------
     dict with gamma, W_base, R2, pricing_errors
@@ -530,42 +831,34 @@ def fit_crra_parameters(panel_df, use_wealth_scaling=True,
     if n < 20:
         return None
 
-    def compute_rp_vector(params):
-        if use_wealth_scaling:
-            gamma, W_base = params
-        else:
-            gamma = params[0]
-            W_base = 1.0
-
-        gamma = float(np.clip(gamma, 0.2, 300.0))
-        W_base = float(np.clip(W_base, 0.1, 10.0))
-
-        rp_vec = np.full(n, np.nan)
-        for i, (_, row) in enumerate(df.iterrows()):
-            sys_r = np.array(row.get('_sys_ret', []), dtype=float)
-            n_months = len(sys_r)
-            sd = compute_terminal_shape_disutility(
-                sys_r, gamma_eff=gamma,
-                W0=1.0, n_bootstrap=200, T_periods=n_months)
-            rp_vec[i] = sd * 12 if np.isfinite(sd) else np.nan
-        return rp_vec
+    padded, lengths = pack_sys_returns(df['_sys_ret'])
+    log_tw = bootstrap_log_terminal_wealth(padded, lengths,
+                                           n_bootstrap=n_bootstrap, seed=seed)
+    excess = df['fwd_mean_exc'].values - df['rf_ann'].values
+
+    def compute_rp_vector(params, with_grad=False):
+        gamma = float(np.clip(params[0], 0.2, 300.0))
+        sd, dsd = terminal_shape_disutility_vec(log_tw, lengths, gamma)
+        rp, drp = sd * 12, dsd * 12
+        return (rp, drp) if with_grad else rp
 
     def objective(params):
-        sd_vec = compute_rp_vector(params)
+        rp, drp = compute_rp_vector(params, with_grad=True)
         # Model: excess_return_i = shape_disutility_i(gamma) + error
         # Shape disutility of demeaned dist should equal excess return at true gamma
-        excess = df['fwd_mean_exc'].values - df['rf_ann'].values
-        errors = excess - sd_vec
-        valid  = np.isfinite(errors)
+        errors = excess - rp
+        valid  = np.isfinite(errors) & np.isfinite(drp)
+        grad   = np.zeros(len(params))
         if valid.sum() < 10:
-            return 1e10
-        return float(np.sum(errors[valid]**2))
+            return 1e10, grad
+        grad[0] = float(-2 * np.sum(errors[valid] * drp[valid]))
+        return float(np.sum(errors[valid]**2)), grad
 
     # Grid search for starting value of γ
     best_obj = np.inf
     best_gamma = 2.0
     for g0 in [1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0]:
-        obj = objective([g0, 1.0] if use_wealth_scaling else [g0])
+        obj, _ = objective([g0, 1.0] if use_wealth_scaling else [g0])
         if obj < best_obj:
             best_obj = obj
             best_gamma = g0
@@ -580,7 +873,7 @@ def fit_crra_parameters(panel_df, use_wealth_scaling=True,
 
     try:
         res = optimize.minimize(objective, x0, method='L-BFGS-B',
-                                bounds=bounds,
+                                jac=True, bounds=bounds,
                                 options={'maxiter': 200, 'ftol': 1e-10})
         opt_params = res.x
     except Exception as e:
@@ -694,23 +987,17 @@ def compute_terminal_shape_disutility(sys_returns_monthly, gamma_eff,
     return float(-r_ce)
 
 
-def add_crra_rp(panel_df, gamma, W_base=1.0, use_wealth=True):
+def add_crra_rp(panel_df, gamma, W_base=1.0, use_wealth=True,
+                n_bootstrap=300, seed=0):
     """Add CRRA risk premium column to panel using estimated parameters."""
-    rp_list = []
-    for _, row in panel_df.iterrows():
-        sys_r = row.get('_sys_ret', [])
-        rm_r  = row.get('_rm_ret', None)
-        if not isinstance(sys_r, (list, np.ndarray)) or len(sys_r) < 5:
-            rp_list.append(np.nan)
-            continue
-        n_months = len(sys_r)
-        sd = compute_terminal_shape_disutility(
-            np.array(sys_r), gamma_eff=gamma,
-            W0=1.0, n_bootstrap=300, T_periods=n_months,
-            rm_returns_monthly=np.array(rm_r) if rm_r is not None else None)
-        rp_list.append(sd * 12 if np.isfinite(sd) else np.nan)
+    sys_lists = [x if isinstance(x, (list, np.ndarray)) else []
+                 for x in panel_df['_sys_ret']]
+    padded, lengths = pack_sys_returns(sys_lists)
+    log_tw = bootstrap_log_terminal_wealth(padded, lengths,
+                                           n_bootstrap=n_bootstrap, seed=seed)
+    sd, _ = terminal_shape_disutility_vec(log_tw, lengths, gamma)
     panel_df = panel_df.copy()
-    panel_df['crra_rp'] = rp_list
+    panel_df['crra_rp'] = np.where(np.isfinite(sd), sd * 12, np.nan)
     return panel_df
 
 
@@ -6,9 +6,11 @@ Scales the per-period correlation map to the FULL universe by landmark
 (out-of-sample) MDS:
 
   1. Choose ~250 "landmark" stocks present in most windows.
-  2. In each window, run full MDS on the landmark distance matrix
-     (proper metric d = sqrt(2(1-corr))), Procrustes-aligned to the
-     previous frame for smooth playback.
+  2. In each window, embed the landmark distance matrix (proper metric
+     d = sqrt(2(1-corr))) by classical MDS with a warm-started top-2
+     eigensolver, refined by SMACOF only when stress is high, and
+     Procrustes-aligned to the previous frame for smooth playback
+     (see cluster_embedding_engine).
   3. Place EVERY other stock present in that window by its distances to
      the landmarks (out-of-sample projection). O(n * L), scales to thousands.
 
@@ -18,14 +20,19 @@ so names enter/leave as they list and delist.
 Output: cluster_embedding_timeseries.json
   { tickers:[all], frames:[{date, idx:[present indices], xy:[[x,y]...]}],
     clusters:{ticker:cid}, cluster_stats:{cid:{within_corr,mean_exc}} }
+and/or cluster_embedding_timeseries.bin (EXPORT_FORMAT): the same content
+with int16 coordinates and a frame index for lazy loading
+(see cluster_frame_format).
 """
 
 import json
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from sklearn.manifold import MDS
 from sklearn.cluster import AgglomerativeClustering
+from cluster_embedding_engine import (corr_to_dist, winsor_columns,
+                                      new_tracker, embed_window)
+from cluster_frame_format import write_frames_binary
 
 WINDOW           = 36
 STEP             = 3
@@ -34,6 +41,7 @@ LANDMARK_FRAC    = 0.80
 WINSOR           = 0.01
 N_PERSISTENT     = 30
 MIN_COMEMBERSHIP = 12
+EXPORT_FORMAT    = 'both'   # 'json', 'binary' or 'both'
 
 
 def norm_idx(df):
@@ -51,27 +59,6 @@ def load_returns():
     raise FileNotFoundError("stock_returns_stooq.csv not found")
 
 
-def winsor(a, pct=WINSOR):
-    lo, hi = np.nanpercentile(a, pct*100), np.nanpercentile(a, (1-pct)*100)
-    return np.clip(a, lo, hi)
-
-
-def procrustes_align(X, ref):
-    Xc = X - X.mean(0); Rc = ref - ref.mean(0)
-    U, _, Vt = np.linalg.svd(Xc.T @ Rc)
-    return Xc @ (U @ Vt) + ref.mean(0)
-
-
-def corr_to_dist(M):
-    C = np.corrcoef(M, rowvar=False)
-    C = np.nan_to_num(C, nan=0.0)
-    np.clip(C, -0.999, 0.999, out=C)
-    np.fill_diagonal(C, 1.0)
-    D = np.sqrt(2.0*(1.0-C))
-    np.fill_diagonal(D, 0.0)
-    return C, D
-
-
 def place_by_landmarks(M_all, land_cols_idx, land_xy):
     Tn, n = M_all.shape
     Z = (M_all - M_all.mean(0)) / (M_all.std(0) + 1e-9)
@@ -123,15 +110,12 @@ def main():
     nW = len(dates)
     print(f"{nW} windows {dates[0].date()} to {dates[-1].date()}")
 
-    present = pd.Series(0, index=SR.columns)
-    slices = []
-    for t in dates:
-        tp = SR.index.get_loc(t)
-        blk = SR.iloc[tp-WINDOW:tp]
-        ok = blk.columns[blk.notna().all(axis=0)]
-        present[ok] += 1
-        slices.append((t, tp))
-    frac = present/nW
+    # full-data flags per window from cumulative valid counts
+    cnt = np.vstack([np.zeros(SR.shape[1], int),
+                     np.cumsum(SR.notna().values, axis=0)])
+    slices = [(t, SR.index.get_loc(t)) for t in dates]
+    full = np.array([cnt[tp] - cnt[tp-WINDOW] == WINDOW for _, tp in slices])
+    frac = pd.Series(full.sum(axis=0), index=SR.columns) / nW
 
     land = frac[frac >= LANDMARK_FRAC].sort_values(ascending=False)
     landmarks = land.head(N_LANDMARKS).index.tolist()
@@ -142,55 +126,58 @@ def main():
     all_tickers = list(SR.columns)
     tk_clean = [t.replace('.us','').replace('.US','').upper() for t in all_tickers]
     tk_to_i = {t: i for i, t in enumerate(all_tickers)}
+    land_gidx = np.array([tk_to_i[c] for c in landmarks])
 
-    mds = MDS(n_components=2, dissimilarity='precomputed', random_state=0,
-              n_init=1, max_iter=300, normalized_stress='auto')
     frames = []
-    prev_land_xy = None
+    tracker = new_tracker(len(all_tickers))
+    n_smacof = 0
 
     for fi, (t, tp) in enumerate(slices):
-        blk = SR.iloc[tp-WINDOW:tp]
-        present_cols = blk.columns[blk.notna().all(axis=0)]
-        present_set = set(present_cols)
-        land_here = [c for c in landmarks if c in present_set]
+        ok = full[fi]
+        land_here = land_gidx[ok[land_gidx]]
         if len(land_here) < 20:
             continue
-        Ml = np.column_stack([winsor(blk[c].values) for c in land_here])
-        _, Dl = corr_to_dist(Ml)
-        lxy = mds.fit_transform(Dl)
-        if prev_land_xy is not None and prev_land_xy.shape == lxy.shape:
-            lxy = procrustes_align(lxy, prev_land_xy)
-        prev_land_xy = lxy
-
-        cols = list(present_cols)
-        Mall = np.column_stack([winsor(blk[c].values) for c in cols])
-        land_local_idx = [cols.index(c) for c in land_here]
+        cols_i = np.flatnonzero(ok)
+        Mall = winsor_columns(SR.values[tp-WINDOW:tp, cols_i], WINSOR)
+        land_local_idx = np.searchsorted(cols_i, land_here)
+
+        _, Dl = corr_to_dist(Mall[:, land_local_idx])
+        lxy, info = embed_window(Dl, land_here, tracker)
+        n_smacof += info['smacof']
+
         xy = place_by_landmarks(Mall, land_local_idx, lxy)
-        for li, c in enumerate(land_here):
-            xy[cols.index(c)] = lxy[li]
+        xy[land_local_idx] = lxy
 
-        idx = [tk_to_i[c] for c in cols]
-        frames.append({'date': str(t.date()), 'idx': idx,
+        frames.append({'date': str(t.date()), 'idx': cols_i.tolist(),
                        'xy': xy.astype(np.float32)})
         if (fi+1) % 20 == 0:
-            print(f"  {fi+1}/{nW} frames, {len(cols)} stocks this window...")
+            print(f"  {fi+1}/{nW} frames, {len(cols_i)} stocks this window, "
+                  f"stress={info['stress']:.3f}...")
+    print(f"  SMACOF refinement used in {n_smacof}/{len(frames)} frames")
 
     allxy = np.vstack([f['xy'] for f in frames])
     ctr = allxy.mean(0); span = np.abs(allxy-ctr).max() or 1.0
     for f in frames:
-        f['xy'] = ((f['xy']-ctr)/span).round(4).tolist()
+        f['xy'] = (f['xy']-ctr)/span
 
     cmap, stats = load_persistent_clusters()
     clusters = {tk_clean[i]: cmap.get(tk_clean[i], -1)
                 for i in range(len(tk_clean))}
 
-    out = {'tickers': tk_clean, 'frames': frames, 'clusters': clusters,
+    out = {'tickers': tk_clean, 'clusters': clusters,
            'cluster_stats': stats, 'window': WINDOW,
            'n_frames': len(frames), 'n_landmarks': len(landmarks)}
-    with open('cluster_embedding_timeseries.json','w') as f:
-        json.dump(out, f)
+    if EXPORT_FORMAT in ('binary', 'both'):
+        nb = write_frames_binary('cluster_embedding_timeseries.bin',
+                                 frames, out)
+        print(f"Wrote cluster_embedding_timeseries.bin ({nb/1e6:.1f} MB)")
+    if EXPORT_FORMAT in ('json', 'both'):
+        for f in frames:
+            f['xy'] = f['xy'].round(4).tolist()
+        with open('cluster_embedding_timeseries.json','w') as f:
+            json.dump(dict(out, frames=frames), f)
+        print(f"Wrote cluster_embedding_timeseries.json")
     sizes = [len(f['idx']) for f in frames]
-    print(f"Wrote cluster_embedding_timeseries.json")
     print(f"  {len(frames)} frames, {min(sizes)}-{max(sizes)} stocks/frame, "
           f"{len(tk_clean)} total tickers")
 
@@ -0,0 +1,148 @@
+"""
+Binary Frame Container for Cluster Exports
+==========================================
+
+Compact alternative to the *_timeseries.json files written by
+cluster_embedding_export and cluster_pca_export.  A viewer reads a small
+JSON header first, then fetches frames lazily with HTTP Range requests
+(or slices one ArrayBuffer when the server ignores Range).
+
+Layout (all little-endian):
+
+  bytes 0-3    magic b'CLFR'
+  bytes 4-5    uint16 format version
+  bytes 6-7    reserved
+  bytes 8-11   uint32 header length in bytes
+  bytes 12-    UTF-8 JSON header, space-padded to a multiple of 8
+  then         one chunk per frame
+
+Header = the JSON export's top-level fields (tickers, window, ...) with
+'frames' replaced by an index:
+  frames: [{date, offset, nbytes, n, ...scalar fields e.g. K}]
+offset is absolute from the start of the file.
+
+Each chunk holds, each part padded to a 4-byte boundary so it can be
+viewed as a typed array in place:
+  idx    uint16 or uint32 (header 'idx_dtype')   [n]
+  xy     int16, coord * XY_SCALE                 [n, 2]
+  fracs  uint8,  frac * FRAC_SCALE (optional)    [n, n_fracs]
+n_fracs is stored per frame.  Fraction rows are rounded by largest
+remainder so each row still sums to exactly FRAC_SCALE.
+"""
+
+import json
+import struct
+import numpy as np
+
+MAGIC      = b'CLFR'
+VERSION    = 1
+XY_SCALE   = 32767    # coords are normalised to [-1, 1] before export
+FRAC_SCALE = 255
+
+
+def _pad(b, m=4, fill=b'\0'):
+    return b + fill * (-len(b) % m)
+
+
+def quantize_xy(xy):
+    return np.round(np.clip(np.asarray(xy, float), -1, 1) * XY_SCALE
+                    ).astype('<i2')
+
+
+def quantize_fracs(F):
+    """Rows of fractions -> uint8 rows summing to FRAC_SCALE."""
+    F = np.clip(np.asarray(F, float), 0, None)
+    tot = F.sum(1, keepdims=True)
+    S = np.divide(F, tot, out=np.zeros_like(F), where=tot > 0) * FRAC_SCALE
+    Q = np.floor(S)
+    short = (FRAC_SCALE - Q.sum(1)).astype(int)
+    short[tot[:, 0] <= 0] = 0
+    rank = np.argsort(np.argsort(-(S - Q), axis=1, kind='stable'), axis=1)
+    Q += rank < short[:, None]
+    return Q.astype('u1')
+
+
+def write_frames_binary(path, frames, header):
+    """
+    frames: list of dicts with 'date', 'idx', 'xy' (normalised coords),
+            optional 'fracs' (n x n_fracs); any other scalar entries
+            (e.g. 'K') are copied into the frame index.
+    header: top-level fields to store alongside the index.
+    Returns the file size in bytes.
+    """
+    n_tk = len(header.get('tickers', [])) or \
+        1 + max((int(np.max(f['idx'])) for f in frames if len(f['idx'])),
+                default=0)
+    idx_dtype = '<u2' if n_tk <= 0xFFFF else '<u4'
+
+    chunks, index = [], []
+    for f in frames:
+        idx = np.asarray(f['idx'], dtype=idx_dtype)
+        body = _pad(idx.tobytes()) + _pad(quantize_xy(f['xy']).tobytes())
+        entry = {'date': f['date'], 'n': len(idx)}
+        if f.get('fracs') is not None:
+            Fq = quantize_fracs(f['fracs'])
+            body += _pad(Fq.tobytes())
+            entry['n_fracs'] = int(Fq.shape[1])
+        for k, v in f.items():
+            if k not in ('date', 'idx', 'xy', 'fracs') and np.isscalar(v):
+                entry[k] = v.item() if isinstance(v, np.generic) else v
+        entry['nbytes'] = len(body)
+        chunks.append(body); index.append(entry)
+
+    meta = dict(header, format='CLFR', version=VERSION,
+                idx_dtype='uint16' if idx_dtype == '<u2' else 'uint32',
+                xy_scale=XY_SCALE, frac_scale=FRAC_SCALE,
+                n_frames=len(frames), frames=index)
+    # offsets depend on the header length, which depends on the offsets'
+    # digits; iterate until the padded length settles
+    hlen = 0
+    while True:
+        pos = 12 + hlen
+        for e, c in zip(index, chunks):
+            e['offset'] = pos; pos += len(c)
+        hb = _pad(json.dumps(meta, separators=(',', ':')).encode(), 8, b' ')
+        if len(hb) == hlen:
+            break
+        hlen = len(hb)
+
+    with open(path, 'wb') as fh:
+        fh.write(MAGIC + struct.pack('<HHI', VERSION, 0, len(hb)))
+        fh.write(hb)
+        for c in chunks:
+            fh.write(c)
+    return pos
+
+
+def read_frames_binary(path, which=None):
+    """
+    Read a CLFR file back.  which: optional iterable of frame numbers.
+    Returns (header, frames) with frames dequantised to float arrays.
+    """
+    with open(path, 'rb') as fh:
+        pre = fh.read(12)
+        if pre[:4] != MAGIC:
+            raise ValueError(f"{path}: not a CLFR frame file")
+        _, _, hlen = struct.unpack('<HHI', pre[4:])
+        header = json.loads(fh.read(hlen))
+        idx_dt = '<u2' if header['idx_dtype'] == 'uint16' else '<u4'
+        sel = range(len(header['frames'])) if which is None else which
+        frames = []
+        for i in sel:
+            e = header['frames'][i]
+            fh.seek(e['offset'])
+            buf = fh.read(e['nbytes'])
+            n = e['n']
+            o = 0
+            idx = np.frombuffer(buf, idx_dt, n, o); o += -(-idx.nbytes // 4) * 4
+            xy = np.frombuffer(buf, '<i2', 2*n, o).reshape(n, 2)
+            o += -(-xy.nbytes // 4) * 4
+            f = {k: v for k, v in e.items()
+                 if k not in ('offset', 'nbytes', 'n', 'n_fracs')}
+            f['idx'] = idx.astype(np.int64)
+            f['xy'] = xy / header['xy_scale']
+            if 'n_fracs' in e:
+                F = np.frombuffer(buf, 'u1', n*e['n_fracs'], o)
+                f['fracs'] = F.reshape(n, e['n_fracs']) / header['frac_scale']
+            frames.append(f)
+    return header, frames
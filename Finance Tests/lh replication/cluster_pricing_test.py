@@ -50,6 +50,7 @@ warnings.filterwarnings('ignore')
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from scipy import sparse
 from sklearn.cluster import SpectralClustering
 import statsmodels.api as sm
 import requests, zipfile, io
@@ -149,9 +150,47 @@ def load_stock_returns():
 
 
 # ── Cluster characterisation ────────────────────────────────────────────────
-def winsorize(a, pct=WINSOR):
-    lo, hi = np.nanpercentile(a, pct * 100), np.nanpercentile(a, (1 - pct) * 100)
-    return np.clip(a, lo, hi)
+def winsorize_columns(A, pct=WINSOR):
+    """Per-column winsorisation of a (T x n) matrix."""
+    # nanpercentile loops over columns in Python; windows are complete, so
+    # the plain percentile is one vectorised sort
+    pctl = np.percentile if not np.isnan(A).any() else np.nanpercentile
+    lo, hi = pctl(A, [pct * 100, (1 - pct) * 100], axis=0)
+    return np.clip(A, lo, hi)
+
+
+def membership_sums(corr, L):
+    """
+    Mean pairwise correlation within and between the stock groups given
+    by the columns of the (N x k) 0/1 membership matrix L (sparse; groups
+    may overlap).
+
+    Everything comes from M = L'C (k x N) and the (k x k) G = L'CL:
+      within[c]  = sum_{i<j in c} C_ij    = (G_cc - tr_c(C)) / 2
+      between[c] = sum_{i in c, j not} C_ij = (M 1)_c - G_cc
+    divided by the pair counts s(s-1)/2 and s(N-s), so no submatrix is
+    copied.  `corr` must be symmetric; NaN entries are skipped as in
+    nanmean.  Returns (within, between), NaN where a group has no pairs.
+    """
+    L = sparse.csr_matrix(L)
+    N = corr.shape[0]
+    finite = np.isfinite(corr)
+
+    def pair_sums(A):
+        M = L.T @ A                               # (k x N)
+        G = (L.T @ M.T).T                         # (k x k) = L'AL
+        g = np.diag(G)
+        return (g - L.T @ np.diag(A)) / 2, M.sum(axis=1) - g
+
+    if finite.all():
+        w_sum, b_sum = pair_sums(corr)
+        s = np.asarray(L.sum(axis=0)).ravel()
+        w_n, b_n = s * (s - 1) / 2, s * (N - s)
+    else:
+        w_sum, b_sum = pair_sums(np.where(finite, corr, 0.0))
+        w_n, b_n = pair_sums(finite.astype(float))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return w_sum / w_n, b_sum / b_n
 
 
 def cluster_stats(corr, labels, market_corr):
@@ -163,32 +202,31 @@ def cluster_stats(corr, labels, market_corr):
       market_corr  : mean correlation of members with the market proxy
     `corr` is the NxN correlation matrix, `labels` is length-N cluster ids,
     `market_corr` is length-N correlation of each stock with the EW market.
+    All clusters are handled at once through a one-hot membership matrix
+    (see membership_sums).
     """
+    ids, lab, size = np.unique(labels, return_inverse=True,
+                               return_counts=True)
+    N = len(lab)
+    L = sparse.csr_matrix((np.ones(N), (np.arange(N), lab)),
+                          shape=(N, len(ids)))
+    within, between = membership_sums(corr, L)
+
+    ok = np.isfinite(market_corr)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mkt = (L.T @ np.where(ok, market_corr, 0.0)) / (L.T @ ok.astype(float))
+    members = np.split(np.argsort(lab, kind='stable'), np.cumsum(size)[:-1])
+
     stats = {}
-    N = corr.shape[0]
-    for c in np.unique(labels):
-        members = np.where(labels == c)[0]
-        if len(members) < MIN_CLUSTER_SIZE:
+    for i, c in enumerate(ids):
+        if size[i] < MIN_CLUSTER_SIZE:
             continue
-        others = np.where(labels != c)[0]
-
-        # within: upper triangle of submatrix
-        sub = corr[np.ix_(members, members)]
-        iu = np.triu_indices(len(members), k=1)
-        within = np.nanmean(sub[iu]) if len(iu[0]) > 0 else np.nan
-
-        # between: members vs others
-        if len(others) > 0:
-            between = np.nanmean(corr[np.ix_(members, others)])
-        else:
-            between = np.nan
-
         stats[c] = {
-            'size':        len(members),
-            'within_corr': within,
-            'between_corr': between,
-            'market_corr': float(np.nanmean(market_corr[members])),
-            'members':     members,
+            'size':        int(size[i]),
+            'within_corr': within[i],
+            'between_corr': between[i],
+            'market_corr': float(mkt[i]),
+            'members':     members[i],
         }
     return stats
 
@@ -257,7 +295,7 @@ def cluster_pricing_test(SR, ff):
         n = W.shape[1]
 
         # winsorise each stock's returns for robust correlation
-        Ww = np.column_stack([winsorize(W[:, j]) for j in range(n)])
+        Ww = winsorize_columns(W)
 
         # correlation matrix
         C = np.corrcoef(Ww, rowvar=False)
@@ -266,8 +304,9 @@ def cluster_pricing_test(SR, ff):
 
         # market proxy = equal-weighted average of window stocks
         mkt_win = Ww.mean(axis=1)
-        market_corr = np.array([
-            np.corrcoef(Ww[:, j], mkt_win)[0, 1] for j in range(n)])
+        Wc, mc = Ww - Ww.mean(axis=0), mkt_win - mkt_win.mean()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            market_corr = (mc @ Wc) / np.sqrt((Wc**2).sum(axis=0) * (mc @ mc))
         market_corr = np.nan_to_num(market_corr, nan=0.0)
 
         # spectral clustering on the affinity = |corr| (must be non-negative)
@@ -485,11 +524,8 @@ def factor_clustering_test(SR, ff):
         if len(valid) < MIN_STOCKS_PER_WIN:
             continue
         W = win[valid]
-        Ww = np.column_stack([winsorize(W.values[:, j])
-                              for j in range(W.shape[1])])
+        Ww = winsorize_columns(W.values)
         C = np.nan_to_num(np.corrcoef(Ww, rowvar=False), nan=0.0)
-        iu = np.triu_indices(C.shape[0], k=1)
-        avg_pair = np.nanmean(C[iu])
 
         next_ret = SR.iloc[t_pos][valid].values
         rf_t = rf.iloc[t_pos]
@@ -505,22 +541,33 @@ def factor_clustering_test(SR, ff):
         # beta: covariance with mkt over window / var(mkt)
         mkt_win = mkt.iloc[t_pos - WINDOW:t_pos].values
         vm = np.var(mkt_win)
-        betas = np.array([np.cov(W.values[:, j], mkt_win)[0, 1] / vm
-                          for j in range(W.shape[1])])
-        chars['beta'] = betas
-
-        for fname, cvals in chars.items():
-            if fname not in results:
-                continue
-            order = np.argsort(cvals)
+        Wc = W.values - W.values.mean(axis=0)
+        chars['beta'] = ((mkt_win - mkt_win.mean()) @ Wc
+                         / (len(mkt_win) - 1) / vm)
+
+        # top/bottom deciles per factor; the high deciles (the "factor
+        # clusters") and the whole cross-section are the columns of one
+        # membership matrix, so every within-correlation, including the
+        # average pair, comes from a single membership_sums call
+        names = [f for f in chars if f in results]
+        n = C.shape[0]
+        deciles = {}
+        for fname in names:
+            order = np.argsort(chars[fname])
             d = max(MIN_CLUSTER_SIZE, len(order) // 10)
-            low_idx = order[:d]
-            high_idx = order[-d:]
-
-            # within-correlation of the high decile (the "factor cluster")
-            sub = C[np.ix_(high_idx, high_idx)]
-            iu2 = np.triu_indices(len(high_idx), k=1)
-            within_high = np.nanmean(sub[iu2]) if len(iu2[0]) else np.nan
+            deciles[fname] = (order[:d], order[-d:])
+        rows = np.concatenate([np.arange(n)] +
+                              [deciles[f][1] for f in names])
+        cols = np.repeat(np.arange(len(names) + 1),
+                         [n] + [len(deciles[f][1]) for f in names])
+        L = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                              shape=(n, len(names) + 1))
+        within, _ = membership_sums(C, L)
+        avg_pair = within[0]
+
+        for i, fname in enumerate(names):
+            low_idx, high_idx = deciles[fname]
+            within_high = within[i + 1]
 
             # realised long-short premium (high - low), equal weighted
             r_high = np.nanmean(next_ret[high_idx]) - rf_t
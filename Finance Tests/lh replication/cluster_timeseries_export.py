@@ -8,9 +8,16 @@ Clusters stocks based on their FACTOR-RESIDUAL correlations each window:
      dominant common factors so residual correlations reflect genuine
      sector/style co-movement ABOVE the known factors
   3. Classical MDS on residual distances
-  4. DBSCAN on MDS coordinates to find dense clusters
+  4. DBSCAN on the residual correlation distances to find dense clusters
   5. Temporal linking by Jaccard overlap
 
+All stocks share the window's factor design, so the residuals come from
+one least-squares solve.  d = sqrt(2(1-corr)) is the Euclidean distance
+between standardised residual series, so DBSCAN runs on those vectors
+with a ball-tree neighbour index instead of a dense distance matrix, and
+Jaccard overlaps between consecutive windows are one sparse product of
+cluster-membership matrices.  Cheap enough for a monthly STEP.
+
 Why 3-factor residuals work where cross-sectional demeaning didn't:
   Cross-sectional mean only removes the equal-weighted market factor.
   SMB and HML are also massive common factors — after removing only the
@@ -23,15 +30,19 @@ import json
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from scipy import sparse
+from cluster_embedding_engine import new_tracker, embed_window, winsor_columns
 from sklearn.cluster import DBSCAN
 
 WINDOW        = 36
-STEP          = 6
+STEP          = 1
 EPS           = 0.55    # DBSCAN neighbourhood radius in MDS distance units
                         # eps=0.55 -> residual corr >= 0.85 to be neighbours
 MIN_SAMPLES   = 8       # min stocks to form a core point / cluster
 WINSOR        = 0.01
 JACCARD_MIN   = 0.35    # min membership overlap to link clusters across windows
+MDS_STRESS_MAX = None   # classical MDS only; e.g. 0.45 refines high-stress
+                        # frames with SMACOF
 
 
 def norm_idx(df):
@@ -71,29 +82,76 @@ def load_industries():
     return {}
 
 
-def winsor(a, pct=WINSOR):
-    lo, hi = np.nanpercentile(a, pct*100), np.nanpercentile(a, (1-pct)*100)
-    return np.clip(a, lo, hi)
-
-
-def classical_mds(D, prev=None):
-    n = D.shape[0]
-    D2 = D**2
-    J = np.eye(n) - np.ones((n,n))/n
-    B = -0.5 * J @ D2 @ J
-    vals, vecs = np.linalg.eigh(B)
-    order = np.argsort(vals)[::-1][:2]
-    L = np.sqrt(np.clip(vals[order], 0, None))
-    xy = vecs[:, order] * L
-    if prev is not None and prev.shape == xy.shape:
-        xy = procrustes_align(xy, prev)
-    return xy
-
-
-def procrustes_align(X, ref):
-    Xc = X - X.mean(0); Rc = ref - ref.mean(0)
-    U, _, Vt = np.linalg.svd(Xc.T @ Rc)
-    return Xc @ (U @ Vt) + ref.mean(0)
+def factor_residuals(M, Xf):
+    """
+    Residuals of every column of M (T x n) on the shared design Xf
+    (T x k, intercept included) in one least-squares solve.  Rows with
+    missing factors get a zero residual; with too few usable rows the
+    cross-sectional mean is removed instead.
+    """
+    if Xf is None:
+        return M - M.mean(axis=1, keepdims=True)
+    valid_rows = np.all(np.isfinite(Xf), axis=1)
+    if valid_rows.sum() <= Xf.shape[1]:
+        return M - M.mean(axis=1, keepdims=True)
+    Xv = Xf[valid_rows]
+    Mr = np.zeros_like(M)
+    beta = np.linalg.lstsq(Xv, M[valid_rows], rcond=None)[0]
+    Mr[valid_rows] = M[valid_rows] - Xv @ beta
+    return Mr
+
+
+def unit_columns(Mr):
+    """
+    Standardised residual series as unit vectors (n x T): the Euclidean
+    distance between rows is sqrt(2(1-corr)).
+    """
+    Z = Mr - Mr.mean(0)
+    nrm = np.linalg.norm(Z, axis=0)
+    return np.divide(Z, nrm, out=np.zeros_like(Z), where=nrm > 0).T
+
+
+def membership_matrix(labels, gidx, n_total):
+    """
+    Sparse (n_clusters x n_total) 0/1 matrix from DBSCAN labels.  Labels
+    are renumbered in order of first appearance in place, which fixes
+    the tie order between equal-sized clusters when linking.
+    """
+    keep = labels >= 0
+    _, first = np.unique(labels[keep], return_index=True)
+    rank = np.empty(len(first), int); rank[np.argsort(first)] = np.arange(len(first))
+    labels[keep] = rank[labels[keep]]
+    n_cl = labels.max() + 1 if keep.any() else 0
+    return sparse.csr_matrix(
+        (np.ones(keep.sum()), (labels[keep], gidx[keep])),
+        shape=(n_cl, n_total))
+
+
+def link_clusters(curr, prev, prev_ids, next_id, jmin=JACCARD_MIN):
+    """
+    Map this window's clusters to persistent ids by Jaccard overlap with
+    the previous window.  Largest clusters choose first; each previous id
+    is used at most once; unmatched clusters get fresh ids.
+    Returns (ids per current cluster, next free id).
+    """
+    sz_c = np.asarray(curr.sum(1)).ravel()
+    ids = np.full(curr.shape[0], -1)
+    if prev is not None and prev.shape[0]:
+        inter = (curr @ prev.T).toarray()
+        sz_p = np.asarray(prev.sum(1)).ravel()
+        J = inter / (sz_c[:, None] + sz_p[None, :] - inter)
+        J[inter == 0] = 0.0
+    else:
+        J = np.zeros((curr.shape[0], 0))
+    used = np.zeros(J.shape[1], bool)
+    for c in np.argsort(-sz_c, kind='stable'):
+        row = np.where(used | (J[c] < jmin), -1.0, J[c])
+        if J.shape[1] and row.max() >= 0:
+            k = len(row) - 1 - int(np.argmax(row[::-1]))  # last best, as before
+            ids[c] = prev_ids[k]; used[k] = True
+        else:
+            ids[c] = next_id; next_id += 1
+    return ids, next_id
 
 
 def main():
@@ -108,138 +166,82 @@ def main():
 
     all_tickers = list(SR.columns)
     tk_clean = [t.replace('.us','').replace('.US','').upper() for t in all_tickers]
-    tk_to_i = {t: i for i, t in enumerate(all_tickers)}
+
+    # full-data flags from cumulative valid counts; FF design per month
+    cnt = np.vstack([np.zeros(SR.shape[1], int),
+                     np.cumsum(SR.notna().values, axis=0)])
+    X_all = None
+    if FF is not None:
+        f_cols = [c for c in ['Mkt-RF', 'SMB', 'HML'] if c in FF.columns]
+        if f_cols:
+            F = FF[f_cols].reindex(SR.index).values
+            X_all = np.column_stack([np.ones(len(F)), F])
 
     frames = []
-    prev_xy_by_ticker = {}
-    prev_members = {}
+    tracker = new_tracker(len(all_tickers))
+    prev_mem, prev_ids = None, None
     next_cluster_id = 0
 
     for fi, t in enumerate(dates):
         tp = SR.index.get_loc(t)
-        blk = SR.iloc[tp-WINDOW:tp]
-        cols = list(blk.columns[blk.notna().all(axis=0)])
-        if len(cols) < MIN_SAMPLES * 2:
+        gidx = np.flatnonzero(cnt[tp] - cnt[tp-WINDOW] == WINDOW)
+        if len(gidx) < MIN_SAMPLES * 2:
             continue
-        M = np.column_stack([winsor(blk[c].values) for c in cols])
-
-        # FF3 factor residualisation
-        # Regress each stock on Mkt-RF, SMB, HML in the window
-        # and use residuals for correlation
-        if FF is not None:
-            ff_blk = FF.loc[FF.index.intersection(blk.index)]
-            ff_blk = ff_blk.reindex(blk.index)
-            factors = []
-            for f_col in ['Mkt-RF', 'SMB', 'HML']:
-                if f_col in ff_blk.columns:
-                    factors.append(ff_blk[f_col].values)
-            if len(factors) >= 1:
-                Xf = np.column_stack(factors)
-                # add intercept
-                Xf = np.column_stack([np.ones(len(Xf)), Xf])
-                valid_rows = np.all(np.isfinite(Xf), axis=1)
-                Mr = np.zeros_like(M)
-                if valid_rows.sum() > len(factors) + 1:
-                    try:
-                        # OLS: beta = (X'X)^-1 X'Y, residual = Y - X*beta
-                        Xv = Xf[valid_rows]
-                        beta = np.linalg.lstsq(Xv, M[valid_rows], rcond=None)[0]
-                        Mr[valid_rows] = M[valid_rows] - Xv @ beta
-                        Mr[~valid_rows] = 0.0
-                    except Exception:
-                        Mr = M - M.mean(axis=1, keepdims=True)
-                else:
-                    Mr = M - M.mean(axis=1, keepdims=True)
-            else:
-                Mr = M - M.mean(axis=1, keepdims=True)
-        else:
-            # fallback: market demeaning only
-            Mr = M - M.mean(axis=1, keepdims=True)
+        M = winsor_columns(SR.values[tp-WINDOW:tp, gidx], WINSOR)
+
+        # FF3 factor residualisation: regress every stock on Mkt-RF,
+        # SMB, HML in the window and use residuals for correlation
+        Xf = X_all[tp-WINDOW:tp] if X_all is not None else None
+        U = unit_columns(factor_residuals(M, Xf))
 
-        C = np.corrcoef(Mr, rowvar=False)
-        C = np.nan_to_num(C, nan=0.0)
+        C = U @ U.T
         np.clip(C, -0.999, 0.999, out=C)
-        np.fill_diagonal(C, 1.0)
 
         # proper metric distance matrix (high-dimensional)
         D_mat = np.sqrt(2.0*(1.0-C)); np.fill_diagonal(D_mat, 0.0)
 
         # MDS embedding — for VISUALISATION only
-        gidx = [tk_to_i[c] for c in cols]
-        prev_arr = None
-        if prev_xy_by_ticker:
-            tmp = np.zeros((len(cols),2)); have = 0
-            for k,gi in enumerate(gidx):
-                if gi in prev_xy_by_ticker:
-                    tmp[k] = prev_xy_by_ticker[gi]; have += 1
-            if have > len(cols)*0.4:
-                prev_arr = tmp
-        xy = classical_mds(D_mat, prev_arr)
-        for k,gi in enumerate(gidx):
-            prev_xy_by_ticker[gi] = xy[k]
-
-        # DBSCAN on TRUE precomputed distances (not 2D projection)
+        xy, _ = embed_window(D_mat, gidx, tracker, stress_max=MDS_STRESS_MAX)
+
+        # DBSCAN on TRUE correlation distances (not 2D projection)
         # This avoids the 2D compression artefact where MDS squashes
         # dissimilar points together, making everything look close.
         # eps here is a true correlation-distance: eps=0.55 means
-        # residual corr >= 0.85 in actual correlation space.
-        db = DBSCAN(eps=EPS, min_samples=MIN_SAMPLES,
-                    metric='precomputed')
-        raw_labels = db.fit_predict(D_mat)
-
-        # this window's clusters as sets of global ticker idx
-        this_members = {}
-        for li, lab in enumerate(raw_labels):
-            if lab >= 0:
-                this_members.setdefault(lab, set()).add(gidx[li])
-
-        # temporal linking via Jaccard
-        assigned = {}
-        used_prev = set()
-        for comp, mem in sorted(this_members.items(),
-                                key=lambda kv: -len(kv[1])):
-            best_id, best_j = None, JACCARD_MIN
-            for gid, pmem in prev_members.items():
-                if gid in used_prev: continue
-                inter = len(mem & pmem)
-                if inter == 0: continue
-                j = inter / len(mem | pmem)
-                if j >= best_j:
-                    best_j, best_id = j, gid
-            if best_id is not None:
-                assigned[comp] = best_id
-                used_prev.add(best_id)
-            else:
-                assigned[comp] = next_cluster_id
-                next_cluster_id += 1
-
-        prev_members = {assigned[comp]: mem
-                        for comp, mem in this_members.items()}
-
-        cl_global = [assigned.get(lab, -1) if lab >= 0 else -1
-                     for lab in raw_labels]
+        # residual corr >= 0.85 in actual correlation space.  The rows
+        # of U are unit vectors whose Euclidean distance is exactly that,
+        # so a ball tree finds the eps-neighbourhoods.
+        db = DBSCAN(eps=EPS, min_samples=MIN_SAMPLES, algorithm='ball_tree')
+        raw_labels = db.fit_predict(U)
+
+        # temporal linking via Jaccard on sparse membership matrices
+        mem = membership_matrix(raw_labels, gidx, len(all_tickers))
+        ids, next_cluster_id = link_clusters(mem, prev_mem, prev_ids,
+                                             next_cluster_id)
+        prev_mem, prev_ids = mem, ids
+
+        cl_global = np.append(ids, -1)[raw_labels]     # noise (-1) -> -1
 
         # per-stock return this month (monthly %)
         if tp < len(SR):
-            r_this = SR.iloc[tp][cols].values * 100
+            r_this = SR.values[tp, gidx] * 100
         else:
-            r_this = np.full(len(cols), np.nan)
+            r_this = np.full(len(gidx), np.nan)
 
         frames.append({
             'date': str(t.date()),
-            'idx': gidx,
+            'idx': gidx.tolist(),
             'xy': xy.astype(np.float32),
-            'cl': [int(x) for x in cl_global],
+            'cl': cl_global.tolist(),
             'ret': [round(float(x),2) if np.isfinite(x) else None
                     for x in r_this],
         })
 
         if (fi+1) % 20 == 0:
             ncl = len(set(c for c in cl_global if c>=0))
-            nclustered = sum(1 for c in cl_global if c>=0)
-            print(f"  {fi+1}/{nW}: {len(cols)} stocks, {ncl} clusters, "
+            nclustered = int((cl_global >= 0).sum())
+            print(f"  {fi+1}/{nW}: {len(gidx)} stocks, {ncl} clusters, "
                   f"{nclustered} clustered "
-                  f"({100*nclustered/len(cols):.0f}%)")
+                  f"({100*nclustered/len(gidx):.0f}%)")
 
     # normalise coordinates
     allxy = np.vstack([f['xy'] for f in frames])
@@ -22,9 +22,21 @@ To keep file size manageable:
   - Raw scatter: max 200 points (sampled uniformly by market percentile)
   - Only stocks present in eu_h1m.csv are included
   - Tickers sorted alphabetically for the dropdown
+
+Each ticker (all its horizons) is one task for a process pool (N_WORKERS)
+and each ticker's block is written to disk as soon as it is ready, so memory
+stays flat however many tickers there are.
+
+With SHARDED = True the output is instead
+  loess_curves/<TICKER>.json   the ticker's full block, as above
+  loess_curves_index.json      { tickers, horizons, shard_dir,
+                                 summary: { AAPL: { '1': {curve_y, eu} } } }
+The summary holds what the viewer needs to draw every curve; the raw
+scatter for a stock is fetched from its shard when it is selected.
 """
 
-import json, warnings
+import json, os, warnings
+import multiprocessing as mp
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -36,6 +48,9 @@ N_GRID     = 100
 MAX_RAW    = 200
 LOESS_FRAC = {1:0.30, 6:0.35, 12:0.40, 36:0.50, 60:0.55, 120:0.65}
 WINSOR     = 0.005
+N_WORKERS  = None     # process pool size (None = all cores, 1 = serial)
+SHARDED    = False    # one file per ticker + index instead of one JSON
+SHARD_DIR  = 'loess_curves'
 
 SPECS = [
     ('CRRA_g2',    lambda x: np.exp((1-2)*np.log1p(np.clip(1+x,1e-6,None)))/(1-2)),
@@ -111,6 +126,73 @@ def process_stock(mkt_comp, stk_comp, h, frac):
     }
 
 
+# ── Parallel export ──
+
+_MKT_COMP = {}
+
+
+def _init_worker(mkt_comp_h):
+    _MKT_COMP.update(mkt_comp_h)
+
+
+def export_ticker(task):
+    """(ticker, monthly returns) -> (ticker, {horizon: block}) in a worker."""
+    tk, r = task
+    stk_data = {}
+    for h in HORIZONS:
+        mc = _MKT_COMP[h]
+        sc = compound(r, h)
+        n  = min(len(mc), len(sc))
+        res = process_stock(mc[:n], sc[:n], h, LOESS_FRAC[h])
+        if res is not None:
+            stk_data[str(h)] = res
+    return tk, stk_data
+
+
+def run_export(tasks, mkt_comp_h, n_workers=N_WORKERS):
+    """Yield (ticker, block) in task order, computed by a process pool."""
+    if n_workers == 1:
+        _init_worker(mkt_comp_h)
+        yield from map(export_ticker, tasks)
+        return
+    with mp.Pool(n_workers or os.cpu_count(), initializer=_init_worker,
+                 initargs=(mkt_comp_h,)) as pool:
+        yield from pool.imap(export_ticker, tasks, chunksize=4)
+
+
+def stream_json(path, head, items, key='data'):
+    """
+    Write {**head, key: {k: v, ...}} with items (k, v) serialised one at
+    a time.  Returns the number of items written.
+    """
+    n = 0
+    with open(path, 'w') as f:
+        f.write(json.dumps(head)[:-1])
+        f.write((', ' if head else '') + json.dumps(key) + ': {')
+        for k, v in items:
+            f.write((', ' if n else '') + json.dumps(k) + ': ' + json.dumps(v))
+            n += 1
+        f.write('}}')
+    return n
+
+
+def _progress(results, total):
+    for ti, (tk, stk_data) in enumerate(results):
+        if (ti+1) % 200 == 0:
+            print(f"  {ti+1}/{total} tickers...")
+        if stk_data:
+            yield tk, stk_data
+
+
+def _write_shards(results, shard_dir):
+    """Write each ticker's block to its own file; yield its summary."""
+    for tk, stk_data in results:
+        with open(shard_dir / f'{tk}.json', 'w') as f:
+            json.dump(stk_data, f)
+        yield tk, {h: {'curve_y': d['curve_y'], 'eu': d['eu']}
+                   for h, d in stk_data.items()}
+
+
 def main():
     # load returns
     SR = None
@@ -161,32 +243,27 @@ def main():
     for h in HORIZONS:
         mkt_comp_h[h] = compound(mkt.values, h)
 
-    out = {'tickers': tickers_sorted,
-           'horizons': HORIZONS,
-           'data': {}}
-
-    for ti, tk in enumerate(tickers_sorted):
-        col = tk_map[tk]
-        stk_data = {}
-        for h in HORIZONS:
-            mc = mkt_comp_h[h]
-            sc = compound(SR[col].values, h)
-            n  = min(len(mc), len(sc))
-            res = process_stock(mc[:n], sc[:n], h, LOESS_FRAC[h])
-            if res is not None:
-                stk_data[str(h)] = res
-        if stk_data:
-            out['data'][tk] = stk_data
-        if (ti+1) % 200 == 0:
-            print(f"  {ti+1}/{len(tickers_sorted)} tickers...")
-
-    # save
-    outpath = Path('loess_curves.json')
-    with open(outpath, 'w') as f:
-        json.dump(out, f)
+    head = {'tickers': tickers_sorted, 'horizons': HORIZONS}
+    tasks = ((tk, SR[tk_map[tk]].values) for tk in tickers_sorted)
+    results = _progress(run_export(tasks, mkt_comp_h),
+                        len(tickers_sorted))
+
+    # save, streaming one ticker at a time
+    if SHARDED:
+        shard_dir = Path(SHARD_DIR)
+        shard_dir.mkdir(exist_ok=True)
+        outpath = Path('loess_curves_index.json')
+        n_out = stream_json(outpath, dict(head, shard_dir=SHARD_DIR),
+                            _write_shards(results, shard_dir), key='summary')
+    else:
+        outpath = Path('loess_curves.json')
+        n_out = stream_json(outpath, head, results)
+        # the viewer prefers an index, so drop one left by a sharded run
+        Path('loess_curves_index.json').unlink(missing_ok=True)
     size_mb = outpath.stat().st_size / 1e6
-    print(f"\nWrote loess_curves.json ({size_mb:.1f} MB)")
-    print(f"{len(out['data'])} tickers, {len(HORIZONS)} horizons each")
+    print(f"\nWrote {outpath} ({size_mb:.1f} MB)"
+          + (f" + {n_out} shards in {SHARD_DIR}/" if SHARDED else ""))
+    print(f"{n_out} tickers, {len(HORIZONS)} horizons each")
 
 
 if __name__ == '__main__':
@@ -420,19 +420,93 @@ def estimate_comoments_stock(ri_exc, rm_exc):
         }
     except: return None
 
+def estimate_comoments_batch(R_exc, rm_exc, min_obs=36):
+    """
+    estimate_comoments_stock for every column of R_exc (window x n_stocks).
+
+    The market return is standardised over each stock's own valid months,
+    as in the single-stock version, and the cubic regressions are solved
+    through per-stock normal equations.
+    Returns (beta, coskew, cokurt) arrays, NaN where n < min_obs.
+    """
+    R  = np.asarray(R_exc, dtype=float)
+    rm = np.asarray(rm_exc, dtype=float)
+    W  = (np.isfinite(R) & np.isfinite(rm)[:, None]).astype(float)
+    n  = W.sum(axis=0)
+    rm0 = np.where(np.isfinite(rm), rm, 0.0)[:, None]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu = (W * rm0).sum(axis=0) / n
+        sd = np.sqrt((W * (rm0 - mu)**2).sum(axis=0) / n)
+        rm_s = (rm0 - mu) / (sd + 1e-10)
+    X = np.stack([np.ones_like(rm_s), rm_s, rm_s**2, rm_s**3], axis=2)
+    X = np.nan_to_num(X)
+
+    XtX = np.einsum('tnk,tn,tnl->nkl', X, W, X)
+    Xty = np.einsum('tnk,tn->nk', X, W * np.where(W > 0, R, 0.0))
+    params = np.einsum('nkl,nl->nk', np.linalg.pinv(XtX), Xty)
+    params[n < min_obs] = np.nan
+    return params[:, 1], params[:, 2], params[:, 3]
+
 # ── Comoment-sorted portfolio construction ───────────────────────────────────
 
+def _sort_groups(values, n_groups):
+    """
+    Group label (0..n_groups-1, -1 = unsorted) from an ascending sort:
+    equal-sized groups of n // n_groups, remainder in the top group.
+    """
+    labels = np.full(len(values), -1)
+    idx = np.flatnonzero(np.isfinite(values))
+    order = idx[np.argsort(values[idx], kind='stable')]
+    gs = len(order) // n_groups
+    labels[order] = np.minimum(np.arange(len(order)) // gs, n_groups - 1)
+    return labels
+
+
+def _cohort_returns(R, positions, labels, forward, n_groups, chunk=64):
+    """
+    Monthly equal-weighted returns of every sorted cohort over its holding
+    window: (n_cohorts x forward x n_groups), NaN for empty groups.
+
+    A stock is held only if it has returns for the whole window.  Forward
+    returns are gathered for a block of cohorts at once and grouped with a
+    one-hot membership tensor instead of re-slicing per cohort.
+    """
+    offsets = np.arange(forward)
+    out = np.full((len(positions), forward, n_groups), np.nan)
+    for s in range(0, len(positions), chunk):
+        pos = positions[s:s+chunk]
+        Rf  = R[pos[:, None] + offsets]                       # c x F x N
+        held = np.isfinite(Rf).all(axis=1)                    # c x N
+        lab = np.where(held, labels[s:s+chunk], -1)
+        onehot = (lab[:, None, :] == np.arange(n_groups)[None, :, None])
+        cnt = onehot.sum(axis=2)                              # c x g
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[s:s+chunk] = (np.einsum('cfn,cgn->cfg',
+                                        np.nan_to_num(Rf), onehot)
+                              / cnt[:, None, :])
+    return out
+
+
 def construct_comoment_portfolios(stock_returns, ff_factors,
                                   lookback=LOOKBACK_MONTHS,
                                   forward=FORWARD_MONTHS,
                                   step=STEP_MONTHS,
-                                  n_groups=N_SORT_DECILES):
+                                  n_groups=N_SORT_DECILES,
+                                  overlapping=False):
     """
     At each rebalance date:
     1. Estimate coskewness and cokurtosis for each stock from lookback window
     2. Sort stocks into n_groups portfolios by coskewness and cokurtosis
     3. Record equal-weighted portfolio returns over forward window
 
+    overlapping=True forms a new cohort every month (step is ignored) and
+    combines the live cohorts Jegadeesh-Titman style: the return of each
+    portfolio in month m is the average month-m return of the cohorts
+    formed in (m-forward, m].  Series are then MONTHLY returns indexed by
+    the return month instead of annualised holding-period returns
+    indexed by the rebalance date.
+
     Returns:
       coskew_factor: long bottom / short top coskewness quintile return series
       cokurt_factor: long bottom / short top cokurtosis quintile return series
@@ -472,106 +546,67 @@ def construct_comoment_portfolios(stock_returns, ff_factors,
     rf = rf.loc[common_idx]
     ff_factors = ff_factors_aligned  # update reference
 
-    start_idx = lookback
-    dates = SR.index[start_idx:-forward:step]
+    R  = SR.values.astype(float)
+    rm_v = rm.values; rf_v = rf.values
+    if overlapping:
+        step = 1
+    positions = np.arange(lookback, len(SR) - forward, step)
+    dates = SR.index[positions]
     print(f"  Rebalance dates: {len(dates)} "
           f"({dates[0].date() if len(dates) else 'none'} "
           f"to {dates[-1].date() if len(dates) else 'none'})")
 
-    coskew_port_returns  = {g: [] for g in range(1, n_groups+1)}
-    cokurt_port_returns  = {g: [] for g in range(1, n_groups+1)}
-    coskew_factor_rets   = []
-    cokurt_factor_rets   = []
-    factor_dates         = []
-
     print(f"\n  Constructing comoment portfolios ({len(dates)} rebalance dates)...")
 
-    for t_idx, t in enumerate(dates):
-        # Lookback window
-        t_pos    = SR.index.get_loc(t)
-        lb_start = t_pos - lookback
-        lb_end   = t_pos
-        fwd_end  = min(t_pos + forward, len(SR))
-
-        SR_lb = SR.iloc[lb_start:lb_end]
-        rm_lb = rm.iloc[lb_start:lb_end]
-        SR_fwd = SR.iloc[lb_end:fwd_end]
-        rf_fwd = rf.iloc[lb_end:fwd_end]
-
-        # Estimate comoments for each stock
-        comoments = {}
-        for ticker in SR.columns:
-            ri_exc = SR_lb[ticker].values - rf.iloc[lb_start:lb_end].values
-            rm_exc = rm_lb.values
-            cm = estimate_comoments_stock(ri_exc, rm_exc)
-            if cm is not None and np.isfinite(cm['coskew']):
-                comoments[ticker] = cm
-
-        if len(comoments) < n_groups * 3:
-            continue
-
-        tickers_sorted_coskew = sorted(comoments.keys(),
-                                        key=lambda t: comoments[t]['coskew'])
-        tickers_sorted_cokurt = sorted(comoments.keys(),
-                                        key=lambda t: comoments[t]['cokurt'])
-
-        n = len(tickers_sorted_coskew)
-        group_size = n // n_groups
-
-        def port_return(tickers_in_port, SR_fwd, rf_fwd):
-            """Equal-weighted forward return for a set of tickers."""
-            valid = [t for t in tickers_in_port
-                     if t in SR_fwd.columns and SR_fwd[t].notna().all()]
-            if not valid: return np.nan
-            ew_ret = SR_fwd[valid].mean(axis=1)
-            # Annualise monthly returns
-            return float((1 + ew_ret).prod()**(12/len(ew_ret)) - 1)
-
-        # Coskewness portfolios
-        for g in range(1, n_groups+1):
-            lo = (g-1) * group_size
-            hi = g * group_size if g < n_groups else n
-            port_tickers = tickers_sorted_coskew[lo:hi]
-            r = port_return(port_tickers, SR_fwd, rf_fwd)
-            coskew_port_returns[g].append((t, r))
-
-        # Cokurtosis portfolios
-        for g in range(1, n_groups+1):
-            lo = (g-1) * group_size
-            hi = g * group_size if g < n_groups else n
-            port_tickers = tickers_sorted_cokurt[lo:hi]
-            r = port_return(port_tickers, SR_fwd, rf_fwd)
-            cokurt_port_returns[g].append((t, r))
-
-        # Factor returns: long bottom quintile / short top quintile
-        # Compute directly from current iteration's port_return calls
-        # rather than indexing the accumulated list
-        def get_quintile_ret(tickers_sorted, SR_fwd, rf_fwd, quintile, n_g):
-            n = len(tickers_sorted)
-            gs = n // n_g
-            lo = (quintile-1)*gs
-            hi = quintile*gs if quintile < n_g else n
-            return port_return(tickers_sorted[lo:hi], SR_fwd, rf_fwd)
-
-        r_low_cs  = get_quintile_ret(tickers_sorted_coskew, SR_fwd, rf_fwd,
-                                      1, n_groups)
-        r_high_cs = get_quintile_ret(tickers_sorted_coskew, SR_fwd, rf_fwd,
-                                      n_groups, n_groups)
-        r_low_ck  = get_quintile_ret(tickers_sorted_cokurt, SR_fwd, rf_fwd,
-                                      1, n_groups)
-        r_high_ck = get_quintile_ret(tickers_sorted_cokurt, SR_fwd, rf_fwd,
-                                      n_groups, n_groups)
-
-        cs_spread = r_low_cs - r_high_cs                     if np.isfinite(r_low_cs) and np.isfinite(r_high_cs)                     else np.nan
-        ck_spread = r_low_ck - r_high_ck                     if np.isfinite(r_low_ck) and np.isfinite(r_high_ck)                     else np.nan
-
-        coskew_factor_rets.append(cs_spread)
-        cokurt_factor_rets.append(ck_spread)
-        factor_dates.append(t)
-
-        if (t_idx+1) % 5 == 0:
+    # Per-date comoment estimates → sort labels for each cohort
+    cs_labels = []; ck_labels = []; kept = []
+    for t_idx, t_pos in enumerate(positions):
+        _, coskew, cokurt = estimate_comoments_batch(
+            R[t_pos-lookback:t_pos] - rf_v[t_pos-lookback:t_pos, None],
+            rm_v[t_pos-lookback:t_pos])
+        ok = np.isfinite(coskew)
+        if ok.sum() >= n_groups * 3:
+            cs_labels.append(_sort_groups(coskew, n_groups))
+            ck_labels.append(_sort_groups(np.where(ok, cokurt, np.nan),
+                                          n_groups))
+            kept.append(t_pos)
+        if (t_idx+1) % 60 == 0:
             print(f"    {t_idx+1}/{len(dates)} dates processed...")
 
+    kept = np.array(kept, dtype=int)
+    shape = (len(kept), R.shape[1])
+    cs_month = _cohort_returns(R, kept, np.reshape(cs_labels, shape),
+                               forward, n_groups)
+    ck_month = _cohort_returns(R, kept, np.reshape(ck_labels, shape),
+                               forward, n_groups)
+
+    if overlapping:
+        # Average the live cohorts' returns in each calendar month
+        months = (kept[:, None] + np.arange(forward)).ravel()
+
+        def combine(cohort_rets):
+            flat = cohort_rets.reshape(-1, n_groups)
+            ok = np.isfinite(flat)
+            tot = np.zeros((len(SR), n_groups)); cnt = np.zeros_like(tot)
+            np.add.at(tot, months, np.where(ok, flat, 0.0))
+            np.add.at(cnt, months, ok)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out = tot / cnt
+            live = cnt.sum(axis=1) > 0
+            return out[live], SR.index[live]
+
+        cs_rets, port_idx = combine(cs_month)
+        ck_rets, _        = combine(ck_month)
+    else:
+        # Annualised holding-period return of each cohort
+        cs_rets = np.prod(1 + cs_month, axis=1)**(12/forward) - 1
+        ck_rets = np.prod(1 + ck_month, axis=1)**(12/forward) - 1
+        port_idx = SR.index[kept]
+
+    coskew_factor_rets = list(cs_rets[:, 0] - cs_rets[:, -1])
+    cokurt_factor_rets = list(ck_rets[:, 0] - ck_rets[:, -1])
+    factor_dates       = list(port_idx)
+
     # Build time series
     # Normalise factor dates to month-end to match FF factors index
     factor_idx = pd.DatetimeIndex(factor_dates).to_period('M').to_timestamp('M')
@@ -587,16 +622,12 @@ def construct_comoment_portfolios(stock_returns, ff_factors,
     print(f"  Overlapping dates: {len(overlap)}")
 
     # Build portfolio return DataFrames
-    def build_port_df(port_rets_dict):
-        df = {}
-        for g, rets in port_rets_dict.items():
-            dates_g = [r[0] for r in rets]
-            vals_g  = [r[1] for r in rets]
-            df[f'Q{g}'] = pd.Series(vals_g, index=pd.DatetimeIndex(dates_g))
-        return pd.DataFrame(df)
-
-    cs_ports = build_port_df(coskew_port_returns)
-    ck_ports = build_port_df(cokurt_port_returns)
+    def build_port_df(rets):
+        return pd.DataFrame(rets, index=pd.DatetimeIndex(port_idx),
+                            columns=[f'Q{g}' for g in range(1, n_groups+1)])
+
+    cs_ports = build_port_df(cs_rets)
+    ck_ports = build_port_df(ck_rets)
 
     print(f"\n  Factor construction summary:")
     print(f"  factor_dates: {len(factor_dates)} entries")
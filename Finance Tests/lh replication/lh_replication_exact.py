@@ -212,6 +212,30 @@ def estimate_comoments_lh(ri_exc, rm_exc, rm_bar_36):
     except:
         return None
 
+def estimate_comoments_batch(R_exc, rm_exc, rm_bar):
+    """
+    Eq. (1) for every column of R_exc (window x n_stocks) at once.
+
+    Same regression as estimate_comoments_lh, solved through per-stock
+    normal equations so that each stock keeps its own missing-data mask.
+    Returns (beta, coskew, cokurt) arrays of length n_stocks, NaN where
+    fewer than MIN_OBS valid months are available.
+    """
+    R  = np.asarray(R_exc, dtype=float)
+    rm = np.asarray(rm_exc, dtype=float)
+    W  = (np.isfinite(R) & np.isfinite(rm)[:, None]).astype(float)
+    n_obs = W.sum(axis=0)
+
+    rm_f = np.where(np.isfinite(rm), rm, 0.0)
+    rm_dm = rm_f - float(rm_bar)
+    X = np.column_stack([np.ones_like(rm_f), rm_f, rm_dm**2, rm_dm**3])
+
+    XtX = np.einsum('tk,tn,tl->nkl', X, W, X)
+    Xty = np.einsum('tk,tn->nk', X, W * np.where(W > 0, R, 0.0))
+    params = np.einsum('nkl,nl->nk', np.linalg.pinv(XtX), Xty)
+    params[n_obs < MIN_OBS] = np.nan
+    return params[:, 1], params[:, 2], params[:, 3]
+
 # ── Step 2: Triple sequential sort → 27 portfolios → factor ──────────────────
 
 def triple_sort_factor(stock_rets_t, comoments_t, dim_order,
@@ -902,6 +926,162 @@ def build_forward_comoments(stock_returns, ff_factors,
     return df
 
 
+# ── Cross-sectional sort backtester ──────────────────────────────────────────
+
+def _row_quantiles(X, qs):
+    """Per-row linear-interpolation quantiles of X, ignoring NaN."""
+    S = np.sort(X, axis=1)
+    n = np.isfinite(X).sum(axis=1)
+    pos = np.asarray(qs)[None, :] * np.maximum(n - 1, 0)[:, None]
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, np.maximum(n - 1, 0)[:, None])
+    frac = pos - lo
+    a = np.take_along_axis(S, lo, axis=1)
+    b = np.take_along_axis(S, hi, axis=1)
+    return a + (b - a) * frac
+
+
+def _row_qcut(X, n_q):
+    """pd.qcut(x, n_q, labels=False) applied to every row of X (NaN → -1)."""
+    edges = _row_quantiles(X, np.linspace(0, 1, n_q+1)[1:-1])
+    q = (X[:, :, None] > edges[:, None, :]).sum(axis=2)
+    return np.where(np.isfinite(X), q, -1)
+
+
+def _row_corr(A, B, mask):
+    """Pearson correlation of A and B along each row over `mask`."""
+    n = mask.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.where(mask, A, 0.0); b = np.where(mask, B, 0.0)
+        a = np.where(mask, a - (a.sum(1) / n)[:, None], 0.0)
+        b = np.where(mask, b - (b.sum(1) / n)[:, None], 0.0)
+        return (a*b).sum(1) / np.sqrt((a*a).sum(1) * (b*b).sum(1))
+
+
+def _panel_matrix(panel, col, dates, tickers):
+    """Pivot one column of a long (date, ticker) panel to a dense matrix."""
+    M = np.full((len(dates), len(tickers)), np.nan)
+    M[dates.get_indexer(panel['date']),
+      tickers.get_indexer(panel['ticker'])] = panel[col].values
+    return M
+
+
+def _mean_t(x):
+    x = np.asarray(x, dtype=float); x = x[np.isfinite(x)]
+    if len(x) < 3:
+        return np.nan, np.nan, np.nan, len(x)
+    sd = np.std(x, ddof=1)
+    return x.mean(), sd, x.mean() / (sd / np.sqrt(len(x))), len(x)
+
+
+def sort_backtest(panel, signals, returns, n_quantiles=(5,), holdings=(1,),
+                  weightings=('equal',), size_col=None, min_stocks=50,
+                  universe=None):
+    """
+    Cross-sectional quantile sort backtest for one or more signals.
+
+    panel:    long DataFrame with 'date', 'ticker' and the signal columns
+    returns:  column of `panel`, or a wide (date x ticker) DataFrame, with
+              the return earned AFTER forming the portfolio at each date
+    holdings: number of panel dates each cohort is held; overlapping
+              cohorts are averaged (Jegadeesh-Titman)
+    weightings: 'equal', 'rank' (weight ∝ distance of the cross-sectional
+              rank from the median) and 'value' (requires size_col)
+    universe: list of columns that must all be finite for a stock to
+              enter any sort (default: each signal on its own)
+
+    Every signal is pivoted once to a dense matrix and all quantile
+    counts, holdings and weightings are computed from it.
+    Returns dict keyed by signal with 'ic' and 'slope' (per-date
+    cross-sectional correlation / OLS slope with the return) and
+    'sorts', keyed by (n_q, hold, weighting), each holding the quantile
+    return DataFrame, the top-minus-bottom 'spread' and its
+    mean/std/t/n, and mean one-way 'turnover' per quantile and spread.
+    """
+    dates = pd.DatetimeIndex(sorted(panel['date'].unique()))
+    tickers = pd.Index(sorted(panel['ticker'].unique()))
+    if isinstance(returns, str):
+        R = _panel_matrix(panel, returns, dates, tickers)
+    else:
+        R = returns.reindex(index=dates, columns=tickers).values.astype(float)
+    base = np.isfinite(R)
+    if universe is not None:
+        for col in universe:
+            base &= np.isfinite(_panel_matrix(panel, col, dates, tickers))
+    size = None
+    if size_col is not None and size_col in panel.columns:
+        size = _panel_matrix(panel, size_col, dates, tickers)
+    R0 = np.where(base, R, 0.0)
+
+    out = {}
+    for sig in signals:
+        S = _panel_matrix(panel, sig, dates, tickers)
+        valid = base & np.isfinite(S)
+        valid &= (valid.sum(axis=1) >= min_stocks)[:, None]
+        Sv = np.where(valid, S, np.nan)
+
+        ic = _row_corr(S, R, valid)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = ic * np.sqrt(np.nanvar(np.where(valid, R, np.nan), axis=1)
+                                 / np.nanvar(Sv, axis=1))
+        res = {'ic': pd.Series(ic, index=dates),
+               'slope': pd.Series(slope, index=dates), 'sorts': {}}
+
+        n = valid.sum(axis=1, keepdims=True)
+        u = (np.argsort(np.argsort(np.where(valid, S, np.inf), axis=1), axis=1)
+             + 1) / (n + 1)
+        base_w = {'equal': valid.astype(float),
+                  'rank':  np.where(valid, np.abs(u - 0.5), 0.0)}
+        if size is not None:
+            base_w['value'] = np.where(valid & (size > 0), size, 0.0)
+
+        for n_q in n_quantiles:
+            Q = _row_qcut(Sv, n_q)
+            for wname in weightings:
+                if wname not in base_w: continue
+                W = (Q[:, None, :] == np.arange(n_q)[None, :, None]) \
+                    * base_w[wname][:, None, :]                # D x q x N
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    W = W / W.sum(axis=2, keepdims=True)
+                W = np.nan_to_num(W)
+                formed = W.sum(axis=2) > 0                      # D x q
+                for hold in holdings:
+                    if hold > 1:
+                        cs = np.cumsum(W, axis=0)
+                        Wh = cs.copy(); Wh[hold:] -= cs[:-hold]
+                        ch = np.cumsum(formed, axis=0).astype(float)
+                        k = ch.copy(); k[hold:] -= ch[:-hold]
+                        with np.errstate(invalid='ignore', divide='ignore'):
+                            Wh = Wh / k[:, :, None]
+                        Wh = np.nan_to_num(Wh)
+                        live = k > 0
+                    else:
+                        Wh, live = W, formed
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        cover = np.einsum('dqn,dn->dq', Wh, base)
+                        P = np.einsum('dqn,dn->dq', Wh, R0) / cover
+                    P[~live | (cover <= 0)] = np.nan
+                    spread = P[:, -1] - P[:, 0]
+                    to = 0.5 * np.abs(np.diff(Wh, axis=0)).sum(axis=2)
+                    to[~(live[1:] & live[:-1])] = np.nan
+                    mean, sd, t, n_obs = _mean_t(spread)
+                    res['sorts'][(n_q, hold, wname)] = {
+                        'returns':  pd.DataFrame(
+                            P, index=dates,
+                            columns=[f'Q{i+1}' for i in range(n_q)]),
+                        'spread':   pd.Series(spread, index=dates),
+                        'mean': mean, 'std': sd, 't': t, 'n': n_obs,
+                        'turnover': np.nanmean(to, axis=0)
+                                    if np.isfinite(to).any()
+                                    else np.full(n_q, np.nan),
+                        'spread_turnover': np.nanmean(
+                            (to[:, 0] + to[:, -1]) / 2)
+                            if np.isfinite(to).any() else np.nan,
+                    }
+        out[sig] = res
+    return out
+
+
 def compare_forward_backward(panel_df, label=''):
     """
     Compare predictive power of forward vs backward demeaned comoments.
@@ -937,17 +1117,14 @@ def compare_forward_backward(panel_df, label=''):
         ('beta_fwd_dm',   'Forward demeaned beta'),
     ]
 
+    bt = sort_backtest(df, [c for c, _ in measures if c in df.columns],
+                       'fwd_mean_exc', min_stocks=20)
+
     for col, label_m in measures:
-        if col not in df.columns: continue
+        if col not in bt: continue
         # Fama-MacBeth style: mean of cross-sectional correlations
-        cs_corrs = []
-        for d, grp in df.groupby('date'):
-            if len(grp) < 20: continue
-            c = grp[[col,'fwd_mean_exc']].dropna()
-            if len(c) < 20: continue
-            corr = np.corrcoef(c[col], c['fwd_mean_exc'])[0,1]
-            cs_corrs.append(corr)
-        if not cs_corrs: continue
+        cs_corrs = bt[col]['ic'].dropna().values
+        if not len(cs_corrs): continue
         mean_corr = np.mean(cs_corrs)
         t = mean_corr / (np.std(cs_corrs,ddof=1)/np.sqrt(len(cs_corrs)))
         sig = ('***' if abs(t)>2.58 else ('**' if abs(t)>1.96
@@ -961,17 +1138,8 @@ def compare_forward_backward(panel_df, label=''):
     print("  " + "-"*52)
 
     for col, label_m in measures:
-        if col not in df.columns: continue
-        slopes = []
-        for d, grp in df.groupby('date'):
-            if len(grp) < 20: continue
-            c = grp[[col,'fwd_mean_exc']].dropna()
-            if len(c) < 20: continue
-            try:
-                X = sm.add_constant(c[[col]].values)
-                reg = sm.OLS(c['fwd_mean_exc'].values, X).fit()
-                slopes.append(float(reg.params[1]))
-            except: pass
+        if col not in bt: continue
+        slopes = bt[col]['slope'].dropna().values
         if len(slopes) < 3: continue
         m = np.mean(slopes)
         t = m / (np.std(slopes,ddof=1)/np.sqrt(len(slopes)))
@@ -995,11 +1163,18 @@ def compare_forward_backward(panel_df, label=''):
 
 
 
-def persistence_analysis(stock_returns, ff_factors, label=""):
-    print(f"\n{'='*65}")
-    print(f"Comoment Persistence Analysis: {label}")
-    print(f"{'='*65}")
+def build_comoment_matrix(stock_returns, ff_factors,
+                          window=LOOKBACK_MONTHS, step=3):
+    """
+    Dense (date x ticker) comoment panel for the persistence analysis.
+
+    Comoments are estimated every `step` months from the backward
+    `window`, exactly as in build_comoment_panel, but stored as float32
+    matrices with NaN marking stocks that lack MIN_OBS valid months.
 
+    Returns dict with 'dates', 'tickers', 'coskew', 'cokurt' and the
+    boolean validity matrix 'valid'.
+    """
     rm = ff_factors["Mkt-RF"] / 100
     rf = ff_factors["RF"]     / 100
 
@@ -1007,135 +1182,154 @@ def persistence_analysis(stock_returns, ff_factors, label=""):
     SR = stock_returns.copy(); SR.index = sr_idx
     common = SR.index.intersection(ff_factors.index)
     SR = SR.loc[common]; rm = rm.loc[common]; rf = rf.loc[common]
-    T = len(common)
-    window = 36
-
-    print(f"  Estimating stock-level comoments at quarterly intervals...")
-    coskew_panel = {}
-    cokurt_panel = {}
-    dates_est = SR.index[window:]
-    sample_dates = dates_est[::3]  # every 3 months
 
-    for i, t in enumerate(sample_dates):
-        t_pos = SR.index.get_loc(t)
-        rm_lb = rm.iloc[t_pos-window:t_pos].values
-        rf_lb = rf.iloc[t_pos-window:t_pos].values
-        rm_bar = float(rm_lb.mean())
-        cs_t = {}; ck_t = {}
-        for ticker in SR.columns:
-            ri = SR[ticker].iloc[t_pos-window:t_pos].values - rf_lb
-            rm_exc = rm_lb - rf_lb.mean()
-            cm = estimate_comoments_lh(ri, rm_exc, rm_bar)
-            if cm is not None:
-                cs_t[ticker] = cm["coskew"]
-                ck_t[ticker] = cm["cokurt"]
-        coskew_panel[t] = cs_t
-        cokurt_panel[t] = ck_t
+    R  = SR.values.astype(float)
+    rm = rm.values; rf = rf.values
+    positions = np.arange(window, len(common), step)
+
+    cs = np.full((len(positions), R.shape[1]), np.nan, dtype=np.float32)
+    ck = np.full_like(cs, np.nan)
+    for i, t_pos in enumerate(positions):
+        rm_lb = rm[t_pos-window:t_pos]
+        rf_lb = rf[t_pos-window:t_pos]
+        _, cs[i], ck[i] = estimate_comoments_batch(
+            R[t_pos-window:t_pos] - rf_lb[:, None],
+            rm_lb - rf_lb.mean(), rm_lb.mean())
         if (i+1) % 20 == 0:
-            print(f"    {i+1}/{len(sample_dates)} dates...")
+            print(f"    {i+1}/{len(positions)} dates...")
+
+    valid = np.isfinite(cs) & np.isfinite(ck)
+    cs[~valid] = np.nan; ck[~valid] = np.nan
+    return {'dates': SR.index[positions], 'tickers': SR.columns,
+            'coskew': cs, 'cokurt': ck, 'valid': valid}
+
 
-    sorted_dates = sorted(coskew_panel.keys())
-    cs_df = pd.DataFrame(coskew_panel).T.sort_index()
-    ck_df = pd.DataFrame(cokurt_panel).T.sort_index()
-    date_idx = cs_df.index.tolist()
-    step = 3
+def _trim_mask(A, B, common, pct=1):
+    """Pairs inside the [pct, 100-pct] percentiles of both A and B."""
+    qs = [pct / 100, 1 - pct / 100]
+    ea = _row_quantiles(np.where(common, A, np.nan), qs)
+    eb = _row_quantiles(np.where(common, B, np.nan), qs)
+    return (common & (A >= ea[:, :1]) & (A <= ea[:, 1:])
+                   & (B >= eb[:, :1]) & (B <= eb[:, 1:]))
 
-    def trim_outliers(a, b, pct=1):
-        lo = np.percentile(a, pct); hi = np.percentile(a, 100-pct)
-        lo2 = np.percentile(b, pct); hi2 = np.percentile(b, 100-pct)
-        mask = (a>=lo)&(a<=hi)&(b>=lo2)&(b<=hi2)
-        return a[mask], b[mask]
+
+def persistence_report(panel, step=3, lags=(3, 6, 12, 24, 36),
+                       min_stocks=50):
+    """
+    Persistence statistics from a build_comoment_matrix panel.
+
+    Every lag is handled on shifted views of the (date x ticker)
+    matrices: row t of the lead view is paired with row t+h of the lag
+    view, and the validity masks are intersected once per lag.
+    Returns dict keyed by lag (months) with mean stock-level
+    correlations, quintile stay-rate, 5x5 coskewness quintile transition
+    matrix and mean portfolio-level correlation.
+    """
+    CS = panel['coskew'].astype(float)
+    CK = panel['cokurt'].astype(float)
+    valid = panel['valid']
+    D = len(CS)
+
+    # Portfolio-level panel: quintile means of each date's cross-section
+    counts = valid.sum(axis=1)
+    Q = _row_qcut(CS, 5)
+    onehot = Q[:, :, None] == np.arange(5)
+    n_q = onehot.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        port_cs = np.einsum('dn,dnq->dq', np.nan_to_num(CS), onehot) / n_q
+    port_ok = (counts >= min_stocks) & (n_q > 0).all(axis=1)
+    port_cs = port_cs[port_ok]
+
+    results = {}
+    for lag_months in lags:
+        lag_steps = lag_months // step
+        if lag_steps >= D: continue
+        cs0, cs1 = CS[:-lag_steps], CS[lag_steps:]
+        ck0, ck1 = CK[:-lag_steps], CK[lag_steps:]
+        common = valid[:-lag_steps] & valid[lag_steps:]
+        rows = common.sum(axis=1) >= min_stocks
+
+        m_cs = _trim_mask(cs0, cs1, common)
+        m_ck = _trim_mask(ck0, ck1, common)
+        ok_cs = rows & (m_cs.sum(axis=1) > 30)
+        ok_ck = rows & (m_ck.sum(axis=1) > 30)
+        cs_corr = _row_corr(cs0, cs1, m_cs)[ok_cs]
+        ck_corr = _row_corr(ck0, ck1, m_ck)[ok_ck]
+
+        # Quintiles are re-formed on the stocks present at both dates
+        q0 = _row_qcut(np.where(common, cs0, np.nan), 5)[rows]
+        q1 = _row_qcut(np.where(common, cs1, np.nan), 5)[rows]
+        c = common[rows]
+        stay = ((q0 == q1) & c).sum(axis=1) / c.sum(axis=1)
+        trans = np.bincount((q0*5 + q1)[c], minlength=25).reshape(5, 5)
+        trans = trans / np.maximum(trans.sum(axis=1, keepdims=True), 1)
+
+        port_corr = np.array([])
+        if lag_steps < len(port_cs):
+            port_corr = _row_corr(port_cs[:-lag_steps], port_cs[lag_steps:],
+                                  np.ones((len(port_cs)-lag_steps, 5), bool))
+            port_corr = port_corr[np.isfinite(port_corr)]
+
+        results[lag_months] = {
+            'cs_corr':   cs_corr.mean() if len(cs_corr) else np.nan,
+            'ck_corr':   ck_corr.mean() if len(ck_corr) else np.nan,
+            'n_pairs':   len(cs_corr),
+            'stay_rate': stay.mean() if len(stay) else np.nan,
+            'transition': trans,
+            'port_corr': port_corr.mean() if len(port_corr) else np.nan,
+        }
+    return results
+
+
+def persistence_analysis(stock_returns, ff_factors, label="", panel=None):
+    print(f"\n{'='*65}")
+    print(f"Comoment Persistence Analysis: {label}")
+    print(f"{'='*65}")
+
+    if panel is None:
+        print(f"  Estimating stock-level comoments at quarterly intervals...")
+        panel = build_comoment_matrix(stock_returns, ff_factors,
+                                      window=36, step=3)
+    res = persistence_report(panel, step=3)
 
     # Stock-level autocorrelations
     print(f"\n-- Stock-level Comoment Persistence --")
     print(f"  corr(comoment_t, comoment_t+h) across all stocks")
     print(f"  Horizon    CS corr    CK corr   n_pairs")
     print("  " + "-"*42)
-
-    for lag_months in [3, 6, 12, 24, 36]:
-        lag_steps = lag_months // step
-        if lag_steps >= len(date_idx): continue
-        cs_corrs = []; ck_corrs = []
-        for i in range(len(date_idx) - lag_steps):
-            t0 = date_idx[i]; t1 = date_idx[i+lag_steps]
-            tickers = list(set(coskew_panel[t0].keys()) &
-                           set(coskew_panel[t1].keys()))
-            if len(tickers) < 50: continue
-            cs0 = np.array([coskew_panel[t0][tk] for tk in tickers])
-            cs1 = np.array([coskew_panel[t1][tk] for tk in tickers])
-            ck0 = np.array([cokurt_panel[t0][tk] for tk in tickers])
-            ck1 = np.array([cokurt_panel[t1][tk] for tk in tickers])
-            a,b = trim_outliers(cs0,cs1); c,d = trim_outliers(ck0,ck1)
-            if len(a)>30: cs_corrs.append(np.corrcoef(a,b)[0,1])
-            if len(c)>30: ck_corrs.append(np.corrcoef(c,d)[0,1])
-        cs_m = np.mean(cs_corrs) if cs_corrs else np.nan
-        ck_m = np.mean(ck_corrs) if ck_corrs else np.nan
-        print(f"  {lag_months:>6}m   {cs_m:>+9.4f}  {ck_m:>+9.4f}  {len(cs_corrs):>8}")
+    for lag_months, r in res.items():
+        print(f"  {lag_months:>6}m   {r['cs_corr']:>+9.4f}  "
+              f"{r['ck_corr']:>+9.4f}  {r['n_pairs']:>8}")
 
     # Rank stability
     print(f"\n-- Cross-sectional Rank Stability --")
     print(f"  Fraction of stocks staying in same coskewness quintile")
     print(f"  Horizon   Stay rate   vs random(20%)")
     print("  " + "-"*36)
-
-    for lag_months in [3, 6, 12, 24, 36]:
-        lag_steps = lag_months // step
-        if lag_steps >= len(date_idx): continue
-        stay_rates = []
-        for i in range(len(date_idx)-lag_steps):
-            t0 = date_idx[i]; t1 = date_idx[i+lag_steps]
-            tickers = list(set(coskew_panel[t0].keys()) &
-                           set(coskew_panel[t1].keys()))
-            if len(tickers)<50: continue
-            cs0 = np.array([coskew_panel[t0][tk] for tk in tickers])
-            cs1 = np.array([coskew_panel[t1][tk] for tk in tickers])
-            try:
-                q0 = pd.qcut(cs0, 5, labels=False, duplicates="drop")
-                q1 = pd.qcut(cs1, 5, labels=False, duplicates="drop")
-                valid = ~(pd.isna(q0)|pd.isna(q1))
-                if valid.sum()<20: continue
-                stay_rates.append(np.mean(
-                    np.array(q0)[valid]==np.array(q1)[valid]))
-            except: continue
-        if stay_rates:
-            m = np.mean(stay_rates)
+    for lag_months, r in res.items():
+        if np.isfinite(r['stay_rate']):
+            m = r['stay_rate']
             print(f"  {lag_months:>6}m   {m:>9.3f}   {m-0.20:>+12.3f}")
 
+    if 12 in res:
+        print(f"\n  Coskewness quintile transition matrix (12m, row = from)")
+        print(f"  {'':<4}" + "".join(f"{'Q'+str(j+1):>8}" for j in range(5)))
+        for i, row in enumerate(res[12]['transition']):
+            print(f"  Q{i+1:<3}" + "".join(f"{p:>8.3f}" for p in row))
+
     # Portfolio-level persistence
     print(f"\n-- Portfolio-level Persistence --")
     print(f"  Corr of quintile-portfolio coskews across dates")
     print(f"  Horizon   Port rank corr")
     print("  " + "-"*26)
-
-    port_cs_panel = {}
-    for t in sorted_dates:
-        tickers = list(coskew_panel[t].keys())
-        if len(tickers)<50: continue
-        cs_vals = np.array([coskew_panel[t][tk] for tk in tickers])
-        try:
-            q = pd.qcut(cs_vals, 5, labels=False, duplicates="drop")
-            port_cs = [np.mean(cs_vals[np.array(q)==i])
-                       if (np.array(q)==i).sum()>0 else np.nan
-                       for i in range(5)]
-            if not any(np.isnan(port_cs)):
-                port_cs_panel[t] = port_cs
-        except: continue
-
-    port_dates = sorted(port_cs_panel.keys())
-    for lag_months in [3, 6, 12, 24, 36]:
-        lag_steps = lag_months // step
-        if lag_steps >= len(port_dates): continue
-        corrs = []
-        for i in range(len(port_dates)-lag_steps):
-            t0 = port_dates[i]; t1 = port_dates[i+lag_steps]
-            corr = np.corrcoef(port_cs_panel[t0], port_cs_panel[t1])[0,1]
-            if np.isfinite(corr): corrs.append(corr)
-        if corrs:
-            print(f"  {lag_months:>6}m   {np.mean(corrs):>+14.4f}")
+    for lag_months, r in res.items():
+        if np.isfinite(r['port_corr']):
+            print(f"  {lag_months:>6}m   {r['port_corr']:>+14.4f}")
 
     print(f"\n  If stock-level persistence is near zero but portfolio-level")
     print(f"  is higher, the premium reflects systematic sector/industry")
     print(f"  coskewness persisting at the aggregate level.")
+    return res
 
 
 # ── Forward triple sort factor ───────────────────────────────────────────────
@@ -1368,42 +1562,20 @@ def portfolio_sort_comparison(fwd_panel, ff_factors, label=''):
     dates = sorted(df['date'].unique())
     print(f"\n  N = {len(df)} obs, {len(dates)} dates")
 
-    # For each date, sort stocks into quintiles on each measure
-    # compute Q1 - Q5 equal-weighted spread return
-
-    results = {
-        'coskew_back': [], 'coskew_fwd': [],
-        'cokurt_back': [], 'cokurt_fwd': [],
-    }
-
-    for d in dates:
-        grp = df[df['date'] == d].dropna(
-            subset=['coskew_back','coskew_fwd',
-                    'cokurt_back','cokurt_fwd','fwd_mean_exc'])
-        if len(grp) < 50:
-            continue
-
-        ret = grp['fwd_mean_exc'].values
-
-        for col in results.keys():
-            vals = grp[col].values
-            try:
-                q = pd.qcut(vals, 5, labels=False, duplicates='drop')
-                q = np.array(q, dtype=float)
-                valid = np.isfinite(q)
-                if valid.sum() < 20:
-                    continue
-                r_q1 = np.mean(ret[valid][q[valid] == 0])   # lowest
-                r_q5 = np.mean(ret[valid][q[valid] == 4])   # highest
-                if np.isfinite(r_q1) and np.isfinite(r_q5):
-                    # For coskewness: low earns more → spread = Q1 - Q5
-                    # For cokurtosis: high earns more → spread = Q5 - Q1
-                    if 'coskew' in col:
-                        results[col].append(r_q1 - r_q5)
-                    else:
-                        results[col].append(r_q5 - r_q1)
-            except:
-                continue
+    # Quantile sorts on each measure, equal-weighted Q1..Q5 returns;
+    # extra quantile counts / weightings feed the robustness table below
+    measures = ['coskew_back', 'coskew_fwd', 'cokurt_back', 'cokurt_fwd']
+    weightings = ('equal', 'rank') + (('value',) if 'size' in df.columns
+                                      else ())
+    bt = sort_backtest(df, measures, 'fwd_mean_exc',
+                       n_quantiles=(3, 5, 10), weightings=weightings,
+                       size_col='size', min_stocks=50)
+
+    # For coskewness: low earns more → spread = Q1 - Q5
+    # For cokurtosis: high earns more → spread = Q5 - Q1
+    sign = {col: (-1 if 'coskew' in col else 1) for col in measures}
+    results = {col: sign[col] * bt[col]['sorts'][(5, 1, 'equal')]['spread']
+               for col in measures}
 
     print(f"\n  Return spread (annualised %) for each sort:")
     print(f"  Prediction: backward spread > 0 and significant")
@@ -1414,7 +1586,7 @@ def portfolio_sort_comparison(fwd_panel, ff_factors, label=''):
     print("  " + "-"*62)
 
     for col, spreads in results.items():
-        s = np.array(spreads)
+        s = spreads.values
         s = s[np.isfinite(s)]
         if len(s) < 3:
             continue
@@ -1436,25 +1608,9 @@ def portfolio_sort_comparison(fwd_panel, ff_factors, label=''):
     print("  " + "-"*62)
 
     for col in results.keys():
-        quint_rets = {q: [] for q in range(5)}
-        for d in dates:
-            grp = df[df['date'] == d].dropna(
-                subset=[col, 'fwd_mean_exc'])
-            if len(grp) < 50: continue
-            vals = grp[col].values
-            ret  = grp['fwd_mean_exc'].values
-            try:
-                q = pd.qcut(vals, 5, labels=False, duplicates='drop')
-                q = np.array(q, dtype=float)
-                valid = np.isfinite(q)
-                for qi in range(5):
-                    mask = valid & (q == qi)
-                    if mask.sum() > 0:
-                        quint_rets[qi].append(np.mean(ret[mask]))
-            except: continue
-
-        means = [np.mean(quint_rets[qi])*100 if quint_rets[qi] else np.nan
-                 for qi in range(5)]
+        P = bt[col]['sorts'][(5, 1, 'equal')]['returns']
+        means = [P[f'Q{qi+1}'].mean()*100 if P[f'Q{qi+1}'].notna().any()
+                 else np.nan for qi in range(5)]
         window = 'back' if 'back' in col else 'fwd '
         moment = 'CS' if 'coskew' in col else 'CK'
         lbl = f"{moment} {window}"
@@ -1462,6 +1618,21 @@ def portfolio_sort_comparison(fwd_panel, ff_factors, label=''):
               " ".join(f"{m:>+8.3f}" if np.isfinite(m) else f"{'nan':>8}"
                        for m in means))
 
+    # Robustness: quantile count × weighting, with turnover
+    print(f"\n  Spread robustness (annualised %, sign as above; TO = mean")
+    print(f"  one-way turnover of the two extreme legs per rebalance):")
+    print(f"  {'Sort':<10} {'nQ':>3} {'Weight':<6} {'Mean%':>8} {'t':>7} "
+          f"{'TO':>6} {'N':>5}")
+    print("  " + "-"*50)
+    for col in measures:
+        window = 'back' if 'back' in col else 'fwd '
+        moment = 'CS' if 'coskew' in col else 'CK'
+        for (n_q, hold, w), r in bt[col]['sorts'].items():
+            if not np.isfinite(r['t']): continue
+            print(f"  {moment + ' ' + window:<10} {n_q:>3} {w:<6} "
+                  f"{sign[col]*r['mean']*100:>+8.3f} {sign[col]*r['t']:>+7.2f} "
+                  f"{r['spread_turnover']:>6.2f} {r['n']:>5}")
+
     print(f"\n  Interpretation:")
     print(f"  Monotone pattern in backward sort → comoment is priced")
     print(f"  Flat/random pattern in forward sort → confirms forward")
@@ -1548,7 +1719,7 @@ def main():
                         label="100 Size/BTM Portfolios (LH Table 5)")
 
     # ── Persistence analysis ─────────────────────────────────────────────
-    print("\nRunning persistence analysis (~5 minutes)...")
+    print("\nRunning persistence analysis...")
     persistence_analysis(SR, ff, label="Stooq universe")
 
     # ── Forward vs backward window comparison ────────────────────────────
@@ -17,7 +17,8 @@ Key difference from gp_crra_test.py:
 - Follows LH's exact methodology for direct comparison
 """
 
-import sys, warnings
+import sys, warnings, hashlib
+from pathlib import Path
 warnings.filterwarnings('ignore')
 
 import numpy as np
@@ -164,9 +165,27 @@ def estimate_ff_loadings(ri_exc, factors_window):
 
 # ── Panel building ────────────────────────────────────────────────────────────
 
+PANEL_CACHE_DIR = 'panel_cache'    # parameter-keyed panel cache (None = off)
+
+def _panel_key(all_factors, port_series, **params):
+    """
+    Cache key for a panel build: hashes the factor and portfolio data,
+    the build parameters and this script's source, so a change to any of
+    them invalidates the cached panel.
+    """
+    h = hashlib.sha1(Path(__file__).read_bytes())
+    h.update(repr(sorted(params.items())).encode())
+    h.update(repr(list(all_factors.columns)).encode())
+    for name, s in [('factors', all_factors), *port_series.items()]:
+        h.update(name.encode())
+        h.update(s.index.asi8.tobytes())
+        h.update(np.ascontiguousarray(s.values, dtype=float).tobytes())
+    return h.hexdigest()[:16]
+
+
 def build_panel(all_factors, portfolios, label='industry',
                 lookback_years=5, forward_years_list=(1, 3, 5),
-                step_months=12):
+                step_months=12, cache_dir=PANEL_CACHE_DIR):
     """
     Build panel with:
     - Comoments estimated from LOOKBACK window (no look-ahead)
@@ -174,6 +193,9 @@ def build_panel(all_factors, portfolios, label='industry',
     - FF factor loadings from lookback window
 
     step_months=12 → annual rebalancing (Fama-MacBeth style)
+
+    Panels are cached in cache_dir under _panel_key (input data, window
+    parameters, code version); an unchanged rebuild loads the pickle.
     """
     print(f"\nBuilding panel [{label}] "
           f"(lookback={lookback_years}y, forward={forward_years_list}, "
@@ -193,6 +215,18 @@ def build_panel(all_factors, portfolios, label='industry',
         for col in portfolios.columns:
             port_series[col] = portfolios[col]
 
+    if cache_dir is not None:
+        key  = _panel_key(all_factors, port_series, label=label,
+                          lookback_years=lookback_years,
+                          forward_years_list=tuple(forward_years_list),
+                          step_months=step_months)
+        path = Path(cache_dir) / f'lh_panel_{label}_{key}.pkl'
+        if path.exists():
+            result = pd.read_pickle(path)
+            print(f"  Loaded cached panel {path.name}: " +
+                  ", ".join(f"{fy}y={len(df)} obs" for fy, df in result.items()))
+            return result
+
     start = (all_factors.index.min()
              + pd.DateOffset(years=lookback_years))
     end   = (all_factors.index.max()
@@ -261,6 +295,9 @@ def build_panel(all_factors, portfolios, label='industry',
         np2 = df['portfolio'].nunique() if n else 0
         print(f"  {fy}-year forward: {n} obs "
               f"({np2} portfolios × {nd} dates)")
+    if cache_dir is not None:
+        path.parent.mkdir(exist_ok=True)
+        pd.to_pickle(result, path)
     return result
 
 # ── Fama-MacBeth test ─────────────────────────────────────────────────────────
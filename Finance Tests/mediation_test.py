@@ -30,7 +30,8 @@ Usage:
     python mediation_test.py
 """
 
-import sys, warnings
+import sys, warnings, hashlib
+from pathlib import Path
 warnings.filterwarnings('ignore')
 
 try:
@@ -152,16 +153,47 @@ def estimate_factor_loadings(r_exc, factors_window):
             for k in ['Mkt-RF','SMB','HML','RMW','CMA','MOM']}
 
 
+def _student_t_nll_grad(theta, r):
+    """
+    Negative log-likelihood of t(ν, 0, σ) and its gradient in
+    θ = (log ν, log σ).
+    """
+    from scipy.special import gammaln, digamma
+    nu, sig = np.exp(theta)
+    u   = (r / sig)**2 / nu
+    L   = np.log1p(u)
+    n   = len(r)
+    nll = -(n*(gammaln((nu+1)/2) - gammaln(nu/2) - 0.5*np.log(nu*np.pi)
+               - np.log(sig)) - (nu+1)/2 * L.sum())
+    w   = (nu+1) / (1 + u)
+    d_nu  = -(n*(0.5*digamma((nu+1)/2) - 0.5*digamma(nu/2) - 0.5/nu)
+              - 0.5*L.sum() + 0.5*np.sum(w*u)/nu)
+    d_sig = -(-n/sig + np.sum(w*u)/sig)
+    return nll, np.array([d_nu*nu, d_sig*sig])
+
+
 def fit_student_t_simple(returns, min_obs=15):
-    """Fit Student-t by MLE, return (nu, sigma) or (nan, nan)."""
+    """
+    Fit Student-t (loc=0) by MLE, return (nu, sigma) or (nan, nan).
+    L-BFGS-B with analytic gradients; ν is bounded to [1.5, 200], the
+    range the result was previously clipped to.
+    """
     r = np.asarray(returns, dtype=float)
     r = r[~np.isnan(r)]
     if len(r) < min_obs:
         return np.nan, np.nan
+    s0 = float(np.sqrt(np.mean(r**2)))
+    if s0 < 1e-12:
+        return np.nan, np.nan
     try:
-        df, loc, scale = stats.t.fit(r, floc=0)
-        df = float(np.clip(df, 1.5, 200))
-        return df, float(abs(scale))
+        res = optimize.minimize(_student_t_nll_grad, [np.log(5.0), np.log(s0)],
+                                args=(r,), jac=True, method='L-BFGS-B',
+                                bounds=[(np.log(1.5), np.log(200)),
+                                        (np.log(s0) - 10, np.log(s0) + 5)])
+        if not np.isfinite(res.fun):
+            return np.nan, np.nan
+        nu, sig = np.exp(res.x)
+        return float(nu), float(sig)
     except Exception:
         return np.nan, np.nan
 
@@ -187,50 +219,232 @@ def _hansen_st_logpdf(x, nu, lam):
     return lp
 
 
-def fit_skewed_t(returns, min_obs=20, nu_cap=50):
+def _hansen_st_nll_grad(theta, z, mask=None):
     """
-    Fit Hansen (1994) skewed-t by MLE.
-    Returns (sigma, nu, lambda):
-      sigma:  scale — proxy for systematic variance
-      nu:     degrees of freedom — tail thickness (lower = fatter)
-      lambda: skewness in (-1,1) — negative = left-skewed
-    Returns (nan, nan, nan) on failure.
+    Negative log-likelihood of the Hansen (1994) skewed-t and its analytic
+    gradient, for S series at once.
+
+    theta: (S, 2) unconstrained params — ν = 2.01 + exp(θ₀), λ = tanh(θ₁)
+    z:     (S, T) standardised returns (padded); mask (S, T) marks valid obs
+    Returns (nll (S,), grad (S, 2)).  Series with an invalid density get
+    nll = 1e10 and zero gradient, matching the Nelder-Mead objective.
+    """
+    from scipy.special import gammaln, digamma
+    theta = np.atleast_2d(theta)
+    z     = np.atleast_2d(z)
+    m     = np.ones(z.shape) if mask is None else np.asarray(mask, dtype=float)
+
+    e_nu = np.exp(theta[:, 0])
+    nu   = 2.01 + e_nu
+    lam  = np.tanh(theta[:, 1])
+
+    logc  = gammaln((nu+1)/2) - gammaln(nu/2) - 0.5*np.log(np.pi*(nu-2))
+    c     = np.exp(logc)
+    dlogc = 0.5*(digamma((nu+1)/2) - digamma(nu/2)) - 0.5/(nu-2)
+    k, dk = (nu-2)/(nu-1), 1/(nu-1)**2
+    a       = 4*lam*c*k
+    da_dnu  = 4*lam*c*(dlogc*k + dk)
+    da_dlam = 4*c*k
+    b2  = 1 + 3*lam**2 - a**2
+    bad = ~(np.isfinite(b2) & (b2 > 0))
+    b   = np.sqrt(np.where(bad, 1.0, b2))
+    db_dnu  = -a*da_dnu / b
+    db_dlam = (3*lam - a*da_dlam) / b
+
+    col = lambda v: v[:, None]
+    sgn = np.where(z < col(-a/b), -1.0, 1.0)      # left / right branch
+    d   = 1 + sgn*col(lam)
+    q   = (col(b)*z + col(a)) / d
+    dq_dnu  = (z*col(db_dnu) + col(da_dnu)) / d
+    dq_dlam = (z*col(db_dlam) + col(da_dlam)) / d - q*sgn/d
+
+    m2 = col(nu - 2)
+    K  = q**2 / m2
+    L  = np.log1p(K)
+    w  = col(nu + 1) / (2*(1 + K))
+    lp = col(np.log(b) + logc) - col(nu + 1)/2 * L
+    dlp_dnu  = col(db_dnu/b + dlogc) - 0.5*L - w*(2*q*dq_dnu/m2 - q**2/m2**2)
+    dlp_dlam = col(db_dlam/b) - w*2*q*dq_dlam/m2
+
+    nll  = -np.sum(lp*m, axis=1)
+    grad = np.column_stack([-np.sum(dlp_dnu*m, axis=1) * e_nu,
+                            -np.sum(dlp_dlam*m, axis=1) * (1 - lam**2)])
+    bad |= ~np.isfinite(nll) | ~np.all(np.isfinite(grad), axis=1)
+    nll[bad], grad[bad] = 1e10, 0.0
+    return nll, grad
+
+
+def _batched_bfgs(fun, x0, upper=None, max_iter=200, gtol=1e-6, ftol=1e-10):
+    """
+    Minimise S independent objectives at once with per-series BFGS.
+    fun(x) → (f (S,), grad (S, k)); each series keeps its own inverse
+    Hessian and Armijo backtracking step, so they never interact.
+    upper (k,) optionally caps the parameters (trial points are projected).
     """
+    x = np.array(x0, dtype=float)
+    if upper is not None:
+        upper = np.asarray(upper, dtype=float)
+        x = np.minimum(x, upper)
+    f, g = fun(x)
+    S, k = x.shape
+    H = np.broadcast_to(np.eye(k), (S, k, k)).copy()
+    active = np.ones(S, dtype=bool)
+    for _ in range(max_iter):
+        pg = g if upper is None else np.where((x >= upper) & (g < 0), 0.0, g)
+        active &= np.abs(pg).max(axis=1) > gtol
+        if not active.any():
+            break
+        p = -np.einsum('sij,sj->si', H, g)
+        slope = np.sum(g*p, axis=1)
+        reset = slope >= 0                            # not a descent direction
+        H[reset] = np.eye(k)
+        p[reset] = -g[reset]
+        slope[reset] = -np.sum(g[reset]**2, axis=1)
+        p[~active] = 0.0
+
+        step = np.ones(S)
+        todo = active.copy()
+        x_new, f_new, g_new = x.copy(), f.copy(), g.copy()
+        for _ in range(30):
+            xt = x + step[:, None]*p
+            if upper is not None:
+                xt = np.minimum(xt, upper)
+            ft, gt = fun(xt)
+            ok = todo & (ft <= f + 1e-4*np.minimum(np.sum(g*(xt - x), axis=1),
+                                                   0.5*step*slope))
+            x_new[ok], f_new[ok], g_new[ok] = xt[ok], ft[ok], gt[ok]
+            todo &= ~ok
+            if not todo.any():
+                break
+            step[todo] *= 0.5
+        active &= ~todo                               # line search failed
+
+        sv, yv = x_new - x, g_new - g
+        sy = np.sum(sv*yv, axis=1)
+        upd = active & (sy > 1e-12)
+        if upd.any():
+            rho = 1.0 / sy[upd]
+            I   = np.eye(k)
+            V   = I - rho[:, None, None]*np.einsum('si,sj->sij', sv[upd], yv[upd])
+            H[upd] = (np.einsum('sij,sjk,slk->sil', V, H[upd], V) +
+                      rho[:, None, None]*np.einsum('si,sj->sij', sv[upd], sv[upd]))
+        active &= np.abs(f - f_new) > ftol*np.maximum(1.0, np.abs(f))
+        x, f, g = x_new, f_new, g_new
+    return x, f
+
+
+_ST_STARTS = [(4, None), (5, 0.0), (8, None), (3, -0.1)]   # None → skew-based λ₀
+
+
+def _st_theta(nu, lam):
+    return [np.log(max(nu-2.01, 0.01)), np.arctanh(np.clip(lam, -0.9, 0.9))]
+
+
+def _standardise_st(returns, min_obs):
     r = np.asarray(returns, dtype=float)
     r = r[~np.isnan(r)]
     if len(r) < min_obs:
-        return np.nan, np.nan, np.nan
+        return None
     mu    = float(np.mean(r))
     sigma = float(np.std(r))
     if sigma < 1e-10:
+        return None
+    r_s  = (r - mu) / sigma
+    lam0 = float(np.clip(stats.skew(r_s) * 0.1, -0.5, 0.5))
+    return r_s, sigma, lam0
+
+
+def _st_params(theta, nu_cap):
+    nu_fit  = float(np.clip(2.01+np.exp(theta[0]), 2.01, nu_cap))
+    lam_fit = float(np.clip(np.tanh(theta[1]), -0.99, 0.99))
+    return nu_fit, lam_fit
+
+
+def fit_skewed_t(returns, min_obs=20, nu_cap=50, x0=None):
+    """
+    Fit Hansen (1994) skewed-t by MLE.
+    Returns (sigma, nu, lambda):
+      sigma:  scale — proxy for systematic variance
+      nu:     degrees of freedom — tail thickness (lower = fatter)
+      lambda: skewness in (-1,1) — negative = left-skewed
+    Returns (nan, nan, nan) on failure.
+
+    Uses L-BFGS-B with the analytic log-likelihood gradient, with ν bounded
+    by nu_cap so λ is estimated at the reported ν.  x0 = (nu, lam)
+    warm-starts from a previous estimate (e.g. the same portfolio's last
+    window); the usual four-start search is only run if that fails.
+    """
+    prep = _standardise_st(returns, min_obs)
+    if prep is None:
         return np.nan, np.nan, np.nan
-    r_s   = (r - mu) / sigma
-    sk    = float(stats.skew(r_s))
-    lam0  = float(np.clip(sk * 0.1, -0.5, 0.5))
-
-    def neg_ll(params):
-        nu  = 2.01 + np.exp(params[0])
-        lam = np.tanh(params[1])
-        lp  = _hansen_st_logpdf(r_s, nu, lam)
-        return -float(np.sum(lp)) if np.all(np.isfinite(lp)) else 1e10
-
-    best_val, best_res = np.inf, None
-    for nu0, l0 in [(4,lam0),(5,0),(8,lam0),(3,-0.1)]:
-        x0 = [np.log(max(nu0-2, 0.01)),
-               np.arctanh(np.clip(l0, -0.9, 0.9))]
-        try:
-            res = optimize.minimize(neg_ll, x0, method='Nelder-Mead',
-                                    options={'maxiter':3000,'xatol':1e-6})
-            if res.fun < best_val:
-                best_val, best_res = res.fun, res
-        except Exception:
-            continue
+    r_s, sigma, lam0 = prep
+
+    def nll(theta):
+        f, g = _hansen_st_nll_grad(theta[None, :], r_s[None, :])
+        return float(f[0]), g[0]
 
-    if best_res is None:
+    bounds = [(None, np.log(nu_cap - 2.01)), (None, None)]
+
+    def run(starts):
+        best = None
+        for nu0, l0 in starts:
+            try:
+                res = optimize.minimize(nll, _st_theta(min(nu0, nu_cap), l0),
+                                        jac=True, method='L-BFGS-B',
+                                        bounds=bounds)
+            except Exception:
+                continue
+            if res.fun < 1e10 and (best is None or res.fun < best.fun):
+                best = res
+        return best
+
+    best = None
+    if x0 is not None and np.all(np.isfinite(x0)):
+        best = run([tuple(x0)])
+        if best is not None and not best.success:
+            best = None
+    if best is None:
+        best = run([(nu0, lam0 if l0 is None else l0)
+                    for nu0, l0 in _ST_STARTS])
+    if best is None:
         return np.nan, np.nan, np.nan
-    nu_fit  = float(np.clip(2.01+np.exp(best_res.x[0]), 2.01, nu_cap))
-    lam_fit = float(np.clip(np.tanh(best_res.x[1]), -0.99, 0.99))
-    return float(sigma), nu_fit, lam_fit
+    return (float(sigma),) + _st_params(best.x, nu_cap)
+
+
+def fit_skewed_t_batch(series, min_obs=20, nu_cap=50):
+    """
+    Batched version of fit_skewed_t: fits many return series in one
+    vectorised BFGS run per starting point (series padded to a common
+    length with a mask).  Returns an (n_series, 3) array of
+    (sigma, nu, lambda), NaN rows where a fit is not possible.
+    """
+    out  = np.full((len(series), 3), np.nan)
+    prep = [_standardise_st(r, min_obs) for r in series]
+    keep = [i for i, p in enumerate(prep) if p is not None]
+    if not keep:
+        return out
+    T    = max(len(prep[i][0]) for i in keep)
+    z    = np.zeros((len(keep), T))
+    mask = np.zeros((len(keep), T), dtype=bool)
+    for j, i in enumerate(keep):
+        n = len(prep[i][0])
+        z[j, :n], mask[j, :n] = prep[i][0], True
+    lam0 = np.array([prep[i][2] for i in keep])
+
+    fun = lambda th: _hansen_st_nll_grad(th, z, mask)
+    best_f = np.full(len(keep), np.inf)
+    best_x = np.zeros((len(keep), 2))
+    for nu0, l0 in _ST_STARTS:
+        lams = lam0 if l0 is None else np.full(len(keep), l0)
+        x0 = np.array([_st_theta(nu0, l) for l in lams])
+        x, f = _batched_bfgs(fun, x0, upper=[np.log(nu_cap - 2.01), np.inf])
+        better = f < best_f
+        best_f[better], best_x[better] = f[better], x[better]
+
+    for j, i in enumerate(keep):
+        if best_f[j] < 1e10:
+            out[i] = (prep[i][1],) + _st_params(best_x[j], nu_cap)
+    return out
 
 
 def skewed_t_moments(sigma, nu, lam):
@@ -291,7 +505,36 @@ def skewed_t_moments(sigma, nu, lam):
     return actual_var, float(skew_z), float(kurt_z)
 
 
-def estimate_forward_distribution(r_exc, factors_fwd, tail_q=0.20):
+def skewed_t_fields(st_sigma, st_nu, st_lam):
+    """Panel columns derived from a skewed-t fit (raw params + implied moments)."""
+    st_inv_nu  = 1.0/st_nu if not np.isnan(st_nu)  else np.nan
+    st_neg_lam = -st_lam   if not np.isnan(st_lam)  else np.nan
+
+    # ── Implied moments from skewed-t fit ─────────────────────────────────────
+    # These are economically interpretable and less correlated than raw params:
+    #   st_var:      actual variance (σ² adjusted for ν and λ)
+    #   st_skew:     standardised skewness (negative = left-skewed = risky)
+    #   st_exkurt:   excess kurtosis (positive = fat tails = risky)
+    # We use neg_skew so that positive coefficient = theory-consistent
+    st_var, st_skew, st_exkurt = skewed_t_moments(st_sigma, st_nu, st_lam)
+    st_neg_skew = -st_skew if not np.isnan(st_skew) else np.nan
+    return {
+        # ── Skewed-t parameters (raw MLE) ─────────────────────────────────────
+        'fwd_st_sigma':           st_sigma,
+        'fwd_st_nu':              st_nu,
+        'fwd_st_inv_nu':          st_inv_nu,
+        'fwd_st_lam':             st_lam,
+        'fwd_st_neg_lam':         st_neg_lam,
+        # ── Implied moments (economically orthogonal) ─────────────────────────
+        'fwd_st_var':             st_var,      # actual variance
+        'fwd_st_skew':            st_skew,     # skewness (neg = left-skewed)
+        'fwd_st_neg_skew':        st_neg_skew, # -skew (pos = left-skewed = risky)
+        'fwd_st_exkurt':          st_exkurt,   # excess kurtosis (pos = fat tails)
+    }
+
+
+def estimate_forward_distribution(r_exc, factors_fwd, tail_q=0.20,
+                                  st_x0=None, fit_st=True):
     """
     Full distribution characterisation using regime-conditional betas.
 
@@ -318,6 +561,10 @@ def estimate_forward_distribution(r_exc, factors_fwd, tail_q=0.20):
       boom_beta_excess: ? (higher boom beta = beneficial or risky?)
       beta_asym:        + (crashes amplify more than booms = costly)
       beta_extreme:     + (large beta deviation in either direction)
+
+    st_x0 warm-starts the skewed-t fit from a previous (ν, λ).  With
+    fit_st=False the skewed-t columns are omitted (the caller fits them in
+    batch via fit_skewed_t_batch + skewed_t_fields).
     """
     mkt = factors_fwd['Mkt-RF'] / 100
     rf  = factors_fwd['RF']     / 100
@@ -390,18 +637,8 @@ def estimate_forward_distribution(r_exc, factors_fwd, tail_q=0.20):
     # Fits Hansen (1994) skewed-t to portfolio excess returns
     # At portfolio level idiosyncratic variance is small so distribution
     # is predominantly systematic
-    st_sigma, st_nu, st_lam = fit_skewed_t(r_exc_.values, min_obs=20)
-    st_inv_nu  = 1.0/st_nu if not np.isnan(st_nu)  else np.nan
-    st_neg_lam = -st_lam   if not np.isnan(st_lam)  else np.nan
-
-    # ── Implied moments from skewed-t fit ─────────────────────────────────────
-    # These are economically interpretable and less correlated than raw params:
-    #   st_var:      actual variance (σ² adjusted for ν and λ)
-    #   st_skew:     standardised skewness (negative = left-skewed = risky)
-    #   st_exkurt:   excess kurtosis (positive = fat tails = risky)
-    # We use neg_skew so that positive coefficient = theory-consistent
-    st_var, st_skew, st_exkurt = skewed_t_moments(st_sigma, st_nu, st_lam)
-    st_neg_skew = -st_skew if not np.isnan(st_skew) else np.nan
+    st = (skewed_t_fields(*fit_skewed_t(r_exc_.values, min_obs=20, x0=st_x0))
+          if fit_st else {})
 
     return {
         'fwd_beta':               beta_avg,
@@ -422,17 +659,7 @@ def estimate_forward_distribution(r_exc, factors_fwd, tail_q=0.20):
         'fwd_body_var':           body_var,
         # ── Tail shape ────────────────────────────────────────────────────────
         'fwd_inv_nu_low':         inv_nu_low,
-        # ── Skewed-t parameters (raw MLE) ─────────────────────────────────────
-        'fwd_st_sigma':           st_sigma,
-        'fwd_st_nu':              st_nu,
-        'fwd_st_inv_nu':          st_inv_nu,
-        'fwd_st_lam':             st_lam,
-        'fwd_st_neg_lam':         st_neg_lam,
-        # ── Implied moments (economically orthogonal) ─────────────────────────
-        'fwd_st_var':             st_var,      # actual variance
-        'fwd_st_skew':            st_skew,     # skewness (neg = left-skewed)
-        'fwd_st_neg_skew':        st_neg_skew, # -skew (pos = left-skewed = risky)
-        'fwd_st_exkurt':          st_exkurt,   # excess kurtosis (pos = fat tails)
+        **st,
         # ── Comparison ────────────────────────────────────────────────────────
         'fwd_sys_boom':           sys_boom,
         'fwd_idio_var':           idio_var,
@@ -442,15 +669,43 @@ def estimate_forward_distribution(r_exc, factors_fwd, tail_q=0.20):
     }
 
 
+PANEL_CACHE_DIR = 'panel_cache'    # parameter-keyed panel cache (None = off)
+
+def _panel_key(all_factors, port_series, **params):
+    """
+    Cache key for a panel build: hashes the factor and portfolio data,
+    the build parameters and this script's source, so a change to any of
+    them invalidates the cached panel.
+    """
+    h = hashlib.sha1(Path(__file__).read_bytes())
+    h.update(repr(sorted(params.items())).encode())
+    h.update(repr(list(all_factors.columns)).encode())
+    for name, s in [('factors', all_factors), *port_series.items()]:
+        h.update(name.encode())
+        h.update(s.index.asi8.tobytes())
+        h.update(np.ascontiguousarray(s.values, dtype=float).tobytes())
+    return h.hexdigest()[:16]
+
+
 def build_panel(all_factors, portfolios, label='industry',
                 lookback_years=5,
                 forward_years_list=(3, 5),
                 step_years=None,   # None = non-overlapping (step = fwd window)
-                tail_q=0.10):
+                tail_q=0.10,
+                batched_st=False,
+                cache_dir=PANEL_CACHE_DIR):
     """
     Build a panel dataset: one row per (portfolio, time point).
     portfolios: dict of {name: DataFrame} for deciles, or single DataFrame for industries
     label: 'industry' or 'decile'
+
+    Skewed-t fits warm-start from the same portfolio's previous window.
+    batched_st=True instead defers them and fits every (portfolio, window)
+    series in one fit_skewed_t_batch call per forward horizon.
+
+    Panels are cached in cache_dir under _panel_key (input data, window
+    lengths, step, tail_q, code version); an unchanged rebuild loads the
+    pickle instead of refitting.
     """
     # Normalise input: always work with a flat dict of series
     port_series = {}
@@ -477,7 +732,22 @@ def build_panel(all_factors, portfolios, label='industry',
               f"forward={forward_years_list}, step={step_years}y, "
               f"n_portfolios={len(port_series)})...")
 
-    panels = {fwd: [] for fwd in forward_years_list}
+    if cache_dir is not None:
+        key  = _panel_key(all_factors, port_series, label=label,
+                          lookback_years=lookback_years,
+                          forward_years_list=tuple(forward_years_list),
+                          step_years=step_years, tail_q=tail_q,
+                          batched_st=batched_st)
+        path = Path(cache_dir) / f'mediation_panel_{label}_{key}.pkl'
+        if path.exists():
+            result = pd.read_pickle(path)
+            print(f"  Loaded cached panel {path.name}: " +
+                  ", ".join(f"{fwd}y={len(df)} obs" for fwd, df in result.items()))
+            return result
+
+    panels   = {fwd: [] for fwd in forward_years_list}
+    st_prev  = {}                                   # (port, fwd) → (ν, λ)
+    st_queue = {fwd: [] for fwd in forward_years_list}
 
     start = all_factors.index.min() + pd.DateOffset(years=lookback_years)
     end   = all_factors.index.max() - pd.DateOffset(years=max(forward_years_list))
@@ -522,9 +792,18 @@ def build_panel(all_factors, portfolios, label='industry',
                     continue
 
                 dist = estimate_forward_distribution(
-                    s.loc[r_fwd_idx], f_fwd.loc[r_fwd_idx], tail_q=tail_q)
+                    s.loc[r_fwd_idx], f_fwd.loc[r_fwd_idx], tail_q=tail_q,
+                    st_x0=st_prev.get((port_name, fwd_years)),
+                    fit_st=not batched_st)
                 if dist is None:
                     continue
+                if batched_st:
+                    st_queue[fwd_years].append(
+                        (s.loc[r_fwd_idx]
+                         - f_fwd.loc[r_fwd_idx, 'RF'] / 100).values)
+                elif not np.isnan(dist['fwd_st_nu']):
+                    st_prev[(port_name, fwd_years)] = (dist['fwd_st_nu'],
+                                                       dist['fwd_st_lam'])
 
                 row = {
                     'date':         t,
@@ -540,6 +819,12 @@ def build_panel(all_factors, portfolios, label='industry',
 
         t += pd.DateOffset(years=step_years)
 
+    if batched_st:
+        for fwd in forward_years_list:
+            fits = fit_skewed_t_batch(st_queue[fwd], min_obs=20)
+            for row, fit in zip(panels[fwd], fits):
+                row.update(skewed_t_fields(*fit))
+
     result = {}
     for fwd in forward_years_list:
         df = pd.DataFrame(panels[fwd])
@@ -549,6 +834,9 @@ def build_panel(all_factors, portfolios, label='industry',
         print(f"  {fwd}-year forward: {len(df)} observations "
               f"({n_ports} portfolios × {n_times} time points)")
 
+    if cache_dir is not None:
+        path.parent.mkdir(exist_ok=True)
+        pd.to_pickle(result, path)
     return result
 
 
@@ -14,15 +14,21 @@ Method:
 4. Compare SML slope using true beta vs market cap beta
 5. Test whether true beta is more predictive of returns than market beta
 
-Uses Ken French 49 industry portfolios as the stock universe.
+Uses Ken French 49 industry portfolios as the stock universe, and, when
+stock_returns_stooq.csv is available, repeats the construction monthly on
+every individual stock (rolling_true_beta).  Betas and idiosyncratic
+variances are computed for all assets at once (missing months allowed),
+and the long-only MIV portfolio is solved through its two KKT multipliers
+because D is diagonal, so thousands of stocks cost O(N) per iteration.
 """
 
 import sys, warnings
+from pathlib import Path
 warnings.filterwarnings('ignore')
 
 import numpy as np
 import pandas as pd
-from scipy import stats, optimize
+from scipy import stats
 from scipy.linalg import inv
 import statsmodels.api as sm
 from sklearn.decomposition import PCA
@@ -92,8 +98,40 @@ def fetch_data():
 
     return factors, mom, industries
 
+STOCK_PATHS = ['stock_returns_stooq.csv',
+               'lh replication/stock_returns_stooq.csv',
+               '/mnt/user-data/outputs/stock_returns_stooq.csv']
+
+def load_stock_returns():
+    """Monthly stock returns (decimal, NaN = not listed), or None."""
+    for p in STOCK_PATHS:
+        if Path(p).exists():
+            sr = pd.read_csv(p, index_col=0, parse_dates=True)
+            sr.index = pd.to_datetime(sr.index).to_period('M').to_timestamp()
+            print(f"  ✓ {sr.shape[1]} stocks from {p}")
+            return sr
+    return None
+
 # ── Step 1: Estimate systematic factor via PCA ────────────────────────────────
 
+def factor_loadings(R, f):
+    """
+    Beta and idiosyncratic variance of every column of R (T x N, NaN =
+    missing) on the factor f (T,), each over the months that column is
+    observed:  beta = cov(r, f) / var(f),  idio = var(r - beta f).
+    Same conventions as np.cov (ddof=1) / np.var (ddof=0).
+    """
+    M = np.isfinite(R)
+    n = M.sum(axis=0).astype(float)
+    fM = np.where(M, f[:, None], 0.0)
+    Rc = np.where(M, R - np.nansum(R, axis=0) / n, 0.0)
+    Fc = np.where(M, fM - fM.sum(axis=0) / n, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        beta = ((Rc * Fc).sum(axis=0) / (n - 1)) / ((Fc**2).sum(axis=0) / n)
+        E = np.where(M, R - beta * fM, np.nan)
+        idio_var = np.nanvar(E, axis=0)
+    return beta, idio_var
+
 def estimate_systematic_factor(R_exc, n_factors=1, method='pca'):
     """
     Estimate systematic factor(s) from the equal-weighted covariance matrix.
@@ -102,48 +140,37 @@ def estimate_systematic_factor(R_exc, n_factors=1, method='pca'):
     method='pca': first principal component(s) of return matrix
     method='equal_weight': equal-weighted average of all assets
 
+    R_exc may contain NaN (unlisted months): the equal-weighted average
+    uses the assets present each month and PCA runs on standardised
+    returns with missing entries set to zero.
+
     Returns:
       F: (T,) systematic factor time series
       betas: (N,) loadings of each asset on the systematic factor
       idio_var: (N,) idiosyncratic variance of each asset
     """
-    R = R_exc.values  # T x N
-    T, N = R.shape
+    R = np.asarray(R_exc, dtype=float)  # T x N
 
     if method == 'equal_weight':
-        F = R.mean(axis=1)
-        # Regress each asset on F to get beta and idio variance
-        betas = np.zeros(N)
-        idio_var = np.zeros(N)
-        for i in range(N):
-            b = np.cov(R[:,i], F)[0,1] / np.var(F)
-            betas[i] = b
-            resid = R[:,i] - b * F
-            idio_var[i] = np.var(resid)
-        F_var = np.var(F)
+        F = np.nanmean(R, axis=1)
 
     elif method == 'pca':
         # Standardise returns before PCA to avoid scale issues
-        R_std = (R - R.mean(axis=0)) / (R.std(axis=0) + 1e-10)
+        R_std = (R - np.nanmean(R, axis=0)) / (np.nanstd(R, axis=0) + 1e-10)
         pca = PCA(n_components=n_factors)
-        scores = pca.fit_transform(R_std)  # T x n_factors
+        scores = pca.fit_transform(np.nan_to_num(R_std))  # T x n_factors
         F = scores[:, 0]  # first PC
 
         # Rescale F to have same variance as equal-weighted index
-        ew = R.mean(axis=1)
+        ew = np.nanmean(R, axis=1)
         F = F * (np.std(ew) / np.std(F))
         # Align sign: correlate with EW to ensure positive loading
         if np.corrcoef(F, ew)[0,1] < 0:
             F = -F
 
-        betas = np.zeros(N)
-        idio_var = np.zeros(N)
-        for i in range(N):
-            b = np.cov(R[:,i], F)[0,1] / np.var(F)
-            betas[i] = b
-            resid = R[:,i] - b * F
-            idio_var[i] = np.var(resid)
-        F_var = np.var(F)
+    # Regress each asset on F to get beta and idio variance
+    betas, idio_var = factor_loadings(R, F)
+    F_var = np.var(F)
 
     return F, betas, idio_var, F_var
 
@@ -199,33 +226,64 @@ def compute_miv_portfolio(R_exc, betas, idio_var, F_var,
             method = 'qp'
 
     if method == 'qp':
-        # Numerical QP with long-only constraint
-        from scipy.optimize import minimize
-
-        def objective(w):
-            return float(w @ (idio_var * w))  # w'Dw
-
-        def objective_grad(w):
-            return 2 * idio_var * w
-
-        constraints = [
-            {'type': 'eq', 'fun': lambda w: w @ betas - target_beta},
-            {'type': 'eq', 'fun': lambda w: w.sum() - 1.0},
-        ]
-        bounds = [(0, None)] * N  # long only
-
-        w0 = np.ones(N) / N
-        res = optimize.minimize(
-            objective, w0, jac=objective_grad,
-            method='SLSQP', bounds=bounds, constraints=constraints,
-            options={'ftol': 1e-10, 'maxiter': 1000})
-        w = res.x
+        w = solve_miv_long_only(betas, idio_var, target_beta)
 
     return w
 
+def solve_miv_long_only(betas, idio_var, target_beta=1.0,
+                        tol=1e-12, max_iter=100):
+    """
+    Long-only MIV weights:
+      min w'Dw  s.t.  w'beta = target_beta,  w'1 = 1,  w >= 0
+    with D = diag(idio_var).
+
+    Because D is diagonal the KKT conditions give
+      w_i = max(0, lam*beta_i + mu) / d_i
+    so only the two multipliers are unknown.  They maximise the concave
+    dual  g = lam*target + mu - 0.5 * sum max(0, lam*beta_i + mu)^2 / d_i,
+    solved by Newton steps on the active set (assets with positive weight)
+    with backtracking — O(N) per iteration, a handful of iterations,
+    started from the unconstrained solution's multipliers.
+    """
+    b = np.asarray(betas, dtype=float)
+    d = np.asarray(idio_var, dtype=float) + 1e-10
+    if not b.min() <= target_beta <= b.max():
+        raise ValueError(f"target beta {target_beta} outside "
+                         f"[{b.min():.3f}, {b.max():.3f}]: no long-only "
+                         f"portfolio attains it")
+    rhs = np.array([target_beta, 1.0])
+
+    def dual(z):
+        s = np.maximum(z[0]*b + z[1], 0.0)
+        return z @ rhs - 0.5 * np.sum(s*s / d), s
+
+    def hess(act):
+        bd, od = b[act] / d[act], 1.0 / d[act]
+        return np.array([[bd @ b[act], bd.sum()], [bd.sum(), od.sum()]])
+
+    z = np.linalg.lstsq(hess(np.ones(len(b), bool)), rhs, rcond=None)[0]
+    g, s = dual(z)
+    scale = np.abs(rhs).max()
+    for _ in range(max_iter):
+        w = s / d
+        grad = rhs - np.array([b @ w, w.sum()])
+        if np.abs(grad).max() < tol * scale:
+            break
+        step = np.linalg.lstsq(hess(s > 0), grad, rcond=None)[0]
+        if not np.any(s > 0):
+            step = grad
+        t = 1.0
+        while True:
+            g_new, s_new = dual(z + t*step)
+            if g_new >= g + 1e-4 * t * (grad @ step) or t < 1e-12:
+                break
+            t *= 0.5
+        z, g, s = z + t*step, g_new, s_new
+    return s / d
+
 def compute_portfolio_return(R_exc, weights):
     """Compute portfolio return time series."""
-    return R_exc.values @ weights
+    return np.asarray(R_exc, dtype=float) @ weights
 
 # ── Step 3: Compute true beta ─────────────────────────────────────────────────
 
@@ -234,23 +292,12 @@ def compute_true_beta(R_exc, miv_returns):
     True beta: covariance of each asset with MIV portfolio,
     normalised by MIV variance.
     """
-    N = R_exc.shape[1]
-    miv_var = np.var(miv_returns)
-    true_betas = np.zeros(N)
-    for i in range(N):
-        cov = np.cov(R_exc.values[:,i], miv_returns)[0,1]
-        true_betas[i] = cov / miv_var
-    return true_betas
+    return factor_loadings(np.asarray(R_exc, dtype=float), miv_returns)[0]
 
 def compute_market_beta(R_exc, market_returns):
     """Standard CAPM beta against market cap weighted index."""
-    N = R_exc.shape[1]
-    mkt_var = np.var(market_returns)
-    betas = np.zeros(N)
-    for i in range(N):
-        cov = np.cov(R_exc.values[:,i], market_returns)[0,1]
-        betas[i] = cov / mkt_var
-    return betas
+    return factor_loadings(np.asarray(R_exc, dtype=float),
+                           np.asarray(market_returns, dtype=float))[0]
 
 # ── Step 4: SML test ──────────────────────────────────────────────────────────
 
@@ -275,6 +322,112 @@ def run_sml_test(betas, mean_returns, label, rf_mean=0.0):
         'r2': r2,
     }
 
+# ── Step 5: Rolling true beta for individual stocks ──────────────────────────
+
+def rolling_true_beta(R_exc, mkt, window=60, step=1, method='pca',
+                      long_only=True, min_obs=36, target_beta=1.0):
+    """
+    Re-estimate the systematic factor, MIV portfolio and every asset's
+    true beta on a rolling window (monthly with step=1).
+
+    Handles an unbalanced stock panel: assets with >= min_obs months in
+    the window get betas, while the MIV portfolio only holds assets
+    observed in every month of the window.  long_only=True solves the
+    constrained MIV (solve_miv_long_only), else the analytical one.
+
+    Returns a dict indexed by the last month of each window:
+      true_beta, mkt_beta: DataFrames (dates x assets), NaN if not estimated
+      n_assets, n_held:    Series (assets with betas, assets held by MIV)
+    """
+    R = np.asarray(R_exc, dtype=float)
+    m = np.asarray(mkt, dtype=float)
+    T, N = R.shape
+    ends = np.arange(window, T + 1, step)
+    TB = np.full((len(ends), N), np.nan)
+    MB = np.full((len(ends), N), np.nan)
+    n_assets = np.zeros(len(ends), dtype=int)
+    n_held = np.zeros(len(ends), dtype=int)
+
+    for k, t in enumerate(ends):
+        blk = R[t-window:t]
+        obs = np.isfinite(blk).sum(axis=0)
+        cols = np.flatnonzero(obs >= min_obs)
+        if len(cols) < 10:
+            continue
+        sub = blk[:, cols]
+        F, b, iv, Fv = estimate_systematic_factor(sub, method=method)
+        inv_ok = (obs[cols] == window) & np.isfinite(b) & (iv > 0)
+        try:
+            w = compute_miv_portfolio(
+                None, b[inv_ok], iv[inv_ok], Fv, target_beta=target_beta,
+                method='qp' if long_only else 'analytical')
+        except ValueError:
+            continue
+        miv = sub[:, inv_ok] @ w
+        TB[k, cols] = compute_true_beta(sub, miv)
+        MB[k, cols] = compute_market_beta(sub, m[t-window:t])
+        n_assets[k] = len(cols)
+        n_held[k] = int((w > 1e-8).sum())
+
+    idx = R_exc.index[ends - 1]
+    return {
+        'true_beta': pd.DataFrame(TB, index=idx, columns=R_exc.columns),
+        'mkt_beta':  pd.DataFrame(MB, index=idx, columns=R_exc.columns),
+        'n_assets':  pd.Series(n_assets, index=idx),
+        'n_held':    pd.Series(n_held, index=idx),
+    }
+
+def cs_slopes(B, Y, min_assets=30):
+    """Per-date cross-sectional OLS slope of Y on B (dates x assets, NaN-aware)."""
+    M = np.isfinite(B) & np.isfinite(Y)
+    n = M.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Bc = np.where(M, B - (np.where(M, B, 0).sum(1) / n)[:, None], 0.0)
+        Yc = np.where(M, Y - (np.where(M, Y, 0).sum(1) / n)[:, None], 0.0)
+        slope = (Bc * Yc).sum(1) / (Bc**2).sum(1)
+    slope[n < min_assets] = np.nan
+    return slope
+
+def stock_true_beta_test(SR, factors, window=60, method='pca'):
+    """Monthly true vs market beta on individual stocks, Fama-MacBeth style."""
+    print(f"\n{'='*60}")
+    print(f"Step 5: Rolling MIV True Beta on Individual Stocks [{method}]")
+    print(f"{'='*60}")
+
+    common = SR.index.intersection(factors.index)
+    rf  = factors['RF'].loc[common] / 100
+    mkt = factors['Mkt-RF'].loc[common] / 100
+    R = SR.loc[common].sub(rf, axis=0)
+    R = R.loc[:, R.notna().sum() >= window]
+    print(f"  {R.shape[1]} stocks, {len(R)} months, {window}m window, "
+          f"monthly re-estimation, long-only MIV")
+
+    rb = rolling_true_beta(R, mkt, window=window, step=1, method=method,
+                           long_only=True)
+    tb, mb = rb['true_beta'], rb['mkt_beta']
+    done = rb['n_assets'] > 0
+    print(f"  {done.sum()} monthly estimates; stocks per month: median "
+          f"{int(rb['n_assets'][done].median())}, MIV holdings median "
+          f"{int(rb['n_held'][done].median())}")
+
+    # next-month excess return for each estimation month
+    Y = R.shift(-1).loc[tb.index].values
+    fm_true = cs_slopes(tb.values, Y)
+    fm_mkt  = cs_slopes(mb.values, Y)
+    rho = [np.corrcoef(a[np.isfinite(a) & np.isfinite(b)],
+                       b[np.isfinite(a) & np.isfinite(b)])[0, 1]
+           for a, b in zip(tb.values[done.values], mb.values[done.values])]
+    print(f"  Mean cross-sectional corr(true, market beta): {np.nanmean(rho):.3f}")
+
+    print(f"\n  {'Beta':<14} {'Mean slope':>11} {'t-stat':>8} {'Months':>7}")
+    print("  " + "-"*44)
+    for label, sl in [('Market beta', fm_mkt), ('True beta', fm_true)]:
+        v = sl[np.isfinite(sl)]
+        t = v.mean() / (v.std(ddof=1) / np.sqrt(len(v))) if len(v) > 2 else np.nan
+        print(f"  {label:<14} {v.mean()*12:>+11.4f} {t:>+8.2f} {len(v):>7}")
+    print(f"  (annualised slope of next-month excess return on beta)")
+    return rb
+
 # ── Main analysis ─────────────────────────────────────────────────────────────
 
 def main():
@@ -314,11 +467,10 @@ def main():
     print(f"  First 3 PCs: {evr[:3].sum()*100:.1f}% of total variance")
 
     # Compare: how much variance does market cap proxy explain?
-    mkt_r2s = []
-    for i in range(N):
-        X = sm.add_constant(mkt.values)
-        reg = sm.OLS(R_exc.values[:,i], X).fit()
-        mkt_r2s.append(reg.rsquared)
+    # OLS R² with a constant is the squared correlation
+    Rc = R_exc.values - R_exc.values.mean(axis=0)
+    mc = mkt.values - mkt.values.mean()
+    mkt_r2s = (Rc.T @ mc)**2 / ((Rc**2).sum(axis=0) * (mc @ mc))
     print(f"\nMarket cap index R² for industry returns:")
     print(f"  Mean: {np.mean(mkt_r2s):.3f}  "
           f"Min: {np.min(mkt_r2s):.3f}  Max: {np.max(mkt_r2s):.3f}")
@@ -622,6 +774,13 @@ def main():
     print("  Saved: miv_true_beta_test.png")
     plt.close()
 
+    # ── Individual stocks: monthly true beta ───────────────────────────────
+    SR = load_stock_returns()
+    if SR is not None:
+        stock_true_beta_test(SR, factors)
+    else:
+        print("\n(stock_returns_stooq.csv not found — skipping stock-level test)")
+
     print("\nDone.")
 
 if __name__ == '__main__':
@@ -114,152 +114,216 @@ def fetch_data():
 # 2.  HILL ESTIMATOR
 # ══════════════════════════════════════════════════════════════════════════════
 
+HILL_K_FRAC = 0.5     # share of positive tail losses used as the Hill k
+TAIL_QS     = [(0.05,'q5'),(0.10,'q10'),(0.20,'q20')]
+N_BOOT      = 200     # subsample-bootstrap replicates for α SEs (0 = off)
+BOOT_FRAC   = 0.5     # subsample size as a share of the tail months
+BOOT_SEED   = 0
+
 def hill_estimator(losses, k_fraction=0.10, min_k=10):
     """
     Hill estimator for tail index α.
     Applied to portfolio losses in market tail months.
     Lower α = fatter systematic tail = riskier.
+
+    losses: (n x P) matrix, one portfolio per column, NaN-padded below
+    each column's own observations.  min_k: scalar or one per column.
+    Positive losses are sorted descending along axis 0 for all columns at
+    once, and the k log spacings sum_{i<k} log(x_i/x_k) come from the
+    cumulative log sums as S_k - k·log x_k.
+    Returns (α, k) arrays; (NaN, 0) where a column has fewer than min_k
+    positive losses.
+    """
+    L = np.asarray(losses, dtype=float)
+    X = -np.sort(-np.where(L > 0, L, np.nan), axis=0)     # descending, NaN last
+    n = (L > 0).sum(axis=0)
+    min_k = np.broadcast_to(min_k, n.shape)
+    k  = np.minimum(np.maximum(min_k, (n * k_fraction).astype(int)), n - 1)
+    ok = n >= min_k
+    k  = np.where(ok, k, 0)
+
+    logs = np.log(np.where(np.isnan(X), 1.0, X))
+    S    = np.zeros((len(X) + 1, X.shape[1]))
+    np.cumsum(logs, axis=0, out=S[1:])
+    cols = np.arange(X.shape[1])
+    sum_log = S[k, cols] - k * logs[k, cols]
+    # all-tied top k gives a zero sum; allow for rounding in S_k - k·log x_k
+    ok &= sum_log > 1e-12 * np.maximum(k, 1)
+    alpha = np.where(ok, k / np.where(ok, sum_log, 1.0), np.nan)
+    return alpha, np.where(ok, k, 0)
+
+
+def hill_subsample_se(losses, n_tail, k_fraction=HILL_K_FRAC,
+                      n_boot=N_BOOT, frac=BOOT_FRAC, seed=BOOT_SEED):
+    """
+    Subsample-bootstrap standard error of α for every column of a padded
+    loss matrix (as from panel_chars) in one vectorised pass.
+
+    Each replicate keeps a random m = frac·n of a column's n tail months,
+    without replacement, and re-applies the Hill rule used for the full
+    sample (min_k = max(5, m//3)).  All replicates of all portfolios form
+    one (n_max x n_boot·P) matrix for hill_estimator.  SE is
+    sqrt(m/(n-m)) · sd(α*), the delete-d jackknife scaling for subsamples
+    of size m; NaN when fewer than half the replicates give an estimate.
     """
-    losses = np.asarray(losses, dtype=float)
-    losses = losses[losses > 0]
-    losses = np.sort(losses)[::-1]
-    n = len(losses)
-    if n < min_k:
-        return np.nan, 0
-    k = max(min_k, int(n * k_fraction))
-    k = min(k, n - 1)
-    log_ratios = np.log(losses[:k] / losses[k])
-    if np.sum(log_ratios) <= 0:
-        return np.nan, 0
-    return float(k / np.sum(log_ratios)), k
+    N, P = losses.shape
+    n_tail = np.asarray(n_tail)
+    m   = np.maximum((n_tail * frac).astype(int), 1)
+    rng = np.random.default_rng(seed)
+    U   = rng.random((n_boot, N, P))
+    U[:, np.arange(N)[:, None] >= n_tail] = np.inf
+    cut = np.take_along_axis(np.sort(U, axis=1), (m - 1)[None, None, :], axis=1)
+
+    sub = np.where(U <= cut, losses, np.nan).transpose(1, 0, 2).reshape(N, -1)
+    a, _ = hill_estimator(sub, k_fraction,
+                          np.tile(np.maximum(5, m // 3), n_boot))
+    a  = a.reshape(n_boot, P)
+    ok = np.isfinite(a).sum(axis=0) >= n_boot / 2
+    se = np.sqrt(m / np.maximum(n_tail - m, 1)) * np.nanstd(a, axis=0, ddof=1)
+    return np.where(ok, se, np.nan)
 
 
 # ══════════════════════════════════════════════════════════════════════════════
 # 3.  PORTFOLIO CHARACTERISTICS
 # ══════════════════════════════════════════════════════════════════════════════
 
-FACTOR_VARS = ['load_Mkt-RF','load_SMB','load_HML',
-               'load_RMW','load_CMA','load_MOM']
-
-def compute_chars(ret_series, factors_df):
-    """Full-sample characteristics for one portfolio."""
-    idx = ret_series.index.intersection(factors_df.index)
-    ret = ret_series.loc[idx].dropna() / 100
-    idx = ret.index.intersection(factors_df.index)
-    if len(idx) < 60:
-        return None
-
-    r   = ret.loc[idx]
-    rf  = factors_df.loc[idx,'RF']  / 100
-    mkt = factors_df.loc[idx,'Mkt-RF'] / 100
-    smb = factors_df.loc[idx,'SMB'] / 100
-    hml = factors_df.loc[idx,'HML'] / 100
-    rmw = factors_df.loc[idx,'RMW'] / 100
-    cma = factors_df.loc[idx,'CMA'] / 100
-    mom_s = factors_df.loc[idx,'MOM'] / 100 \
-            if 'MOM' in factors_df.columns \
-            else pd.Series(0.0, index=idx)
-
-    r_exc  = r - rf
-    rm_exc = mkt
-
-    # Factor loadings
-    Xf  = sm.add_constant(pd.DataFrame({
-        'Mkt-RF': mkt,'SMB': smb,'HML': hml,
-        'RMW': rmw,'CMA': cma,'MOM': mom_s}))
-    reg  = sm.OLS(r_exc, Xf).fit()
-    beta = float(reg.params['Mkt-RF'])
-    loadings = {f'load_{k}': reg.params[k]
-                for k in ['Mkt-RF','SMB','HML','RMW','CMA','MOM']}
-
-    # Systematic variance
-    sys_var = float(beta**2 * rm_exc.var())
-
-    # Tail measures at multiple thresholds
-    tail_results = {}
-    for q, ql in [(0.05,'q5'),(0.10,'q10'),(0.20,'q20')]:
-        thresh    = float(np.percentile(rm_exc.dropna(), q*100))
-        tail_mask = rm_exc <= thresh
-        r_tail    = r_exc[tail_mask]
-        rm_tail   = rm_exc[tail_mask]
-
-        # sys_tail: mean return in market tail months
-        sys_tail = float(r_tail.mean()) if len(r_tail) > 3 else np.nan
-
-        # Tail index: Hill estimator on losses in market tail months
-        losses   = -r_tail.values
-        alpha, n_used = hill_estimator(losses, k_fraction=0.5,
-                                        min_k=max(5, len(losses)//3))
-
-        # Tail beta
-        if len(r_tail) > 5 and rm_tail.var() > 1e-12:
-            tail_beta = float(np.cov(r_tail, rm_tail)[0,1] / rm_tail.var())
-        else:
-            tail_beta = np.nan
-
-        tail_results[f'sys_tail_{ql}']   = sys_tail
-        tail_results[f'tail_alpha_{ql}'] = alpha
-        tail_results[f'neg_alpha_{ql}']  = -alpha if not np.isnan(alpha) else np.nan
-        tail_results[f'tail_beta_{ql}']  = tail_beta
-        tail_results[f'n_tail_{ql}']     = n_used
-
-    # Standalone moments
-    sigma  = float(r_exc.std())
-    skew   = float(stats.skew(r_exc.dropna()))
-    kurt   = float(stats.kurtosis(r_exc.dropna()))
-    var_5  = float(np.percentile(r_exc.dropna(), 5))
-
-    # Mean excess return (annualised)
-    mean_excess = float(r_exc.mean() * 12)
-
-    return {
-        'mean_excess': mean_excess,
-        'n_obs':       len(idx),
-        **loadings,
-        'beta':        beta,
-        'sys_var':     sys_var,
-        'sigma':       sigma,
-        'skewness':    skew,
-        'kurtosis':    kurt,
-        'var_5':       var_5,
-        **tail_results,
-    }
+FACTOR_NAMES = ['Mkt-RF','SMB','HML','RMW','CMA','MOM']
+FACTOR_VARS  = [f'load_{k}' for k in FACTOR_NAMES]
 
-
-def build_cross_section(all_factors, deciles, industries):
-    print("\nBuilding full-sample cross-section...")
-    rows = []
+def _portfolio_panel(all_factors, deciles, industries):
+    """All decile and industry portfolios as one (months x portfolios) frame."""
+    cols, meta = {}, []
     for fname, ddf in deciles.items():
         for col in ddf.columns:
-            s   = ddf[col].dropna()
-            idx = s.index.intersection(all_factors.index)
-            row = compute_chars(s.loc[idx], all_factors.loc[idx])
-            if row:
-                row['portfolio_type'] = 'decile'
-                row['factor_group']   = fname
-                rows.append(row)
+            key = f'{fname}:{col}'
+            cols[key] = ddf[col]
+            meta.append((key, 'decile', fname))
     for col in industries.columns:
-        s   = industries[col].dropna()
-        idx = s.index.intersection(all_factors.index)
-        row = compute_chars(s.loc[idx], all_factors.loc[idx])
-        if row:
-            row['portfolio_type'] = 'industry'
-            row['factor_group']   = 'industry'
-            rows.append(row)
-    df = pd.DataFrame(rows)
+        key = f'industry:{col}'
+        cols[key] = industries[col]
+        meta.append((key, 'industry', 'industry'))
+    return pd.DataFrame(cols).reindex(all_factors.index), meta
+
+
+def panel_chars(R, factors_df):
+    """
+    Full-sample characteristics for every portfolio (column) of R, percent
+    returns aligned to factors_df.
+
+    Portfolios observed over the same months form one group: a single
+    multi-RHS least-squares fit gives the group's factor loadings and the
+    moments are column reductions.  The losses in each portfolio's market
+    tail months are gathered into one NaN-padded matrix per threshold, so
+    the Hill estimates for all portfolios come from one call.  Portfolios
+    with fewer than 60 months are dropped.
+
+    Returns (chars, losses): chars is a DataFrame indexed by portfolio;
+    losses maps each threshold label to (L, n_tail), L the padded
+    (n_max x P) loss matrix column-aligned with chars and n_tail each
+    column's number of tail months.
+    """
+    F   = factors_df / 100
+    mom = F['MOM'] if 'MOM' in F.columns else pd.Series(0.0, index=F.index)
+    X   = np.column_stack([np.ones(len(F))] +
+                          [F[k].values for k in FACTOR_NAMES[:-1]] +
+                          [mom.values])
+    rf, rm = F['RF'].values, F['Mkt-RF'].values
+    V = R.notna().values
+
+    groups = {}
+    for j in range(R.shape[1]):
+        groups.setdefault(V[:, j].tobytes(), []).append(j)
+
+    parts, blocks = [], {ql: [] for _, ql in TAIL_QS}
+    for cols in groups.values():
+        t = V[:, cols[0]]
+        if t.sum() < 60:
+            continue
+        keys = R.columns[cols]
+        Y    = R.values[t][:, cols] / 100 - rf[t, None]
+        m    = rm[t]
+        B    = np.linalg.lstsq(X[t], Y, rcond=None)[0]
+        c = {'mean_excess': Y.mean(axis=0) * 12,
+             'n_obs':       int(t.sum()),
+             **{f'load_{k}': B[i+1] for i, k in enumerate(FACTOR_NAMES)},
+             'beta':        B[1],
+             'sys_var':     B[1]**2 * m.var(ddof=1),
+             'sigma':       Y.std(axis=0, ddof=1),
+             'skewness':    stats.skew(Y, axis=0),
+             'kurtosis':    stats.kurtosis(Y, axis=0),
+             'var_5':       np.percentile(Y, 5, axis=0)}
+
+        for q, ql in TAIL_QS:
+            tail   = m <= np.percentile(m, q*100)
+            Yt, mt = Y[tail], m[tail]
+            n      = int(tail.sum())
+            vm     = mt.var(ddof=1) if n > 1 else 0.0
+            c[f'sys_tail_{ql}']  = Yt.mean(axis=0) if n > 3 else np.nan
+            c[f'tail_beta_{ql}'] = ((mt - mt.mean()) @ (Yt - Yt.mean(axis=0))
+                                    / (n - 1) / vm
+                                    if n > 5 and vm > 1e-12 else np.nan)
+            blocks[ql].append((keys, -Yt))
+        parts.append(pd.DataFrame(c, index=keys))
+
+    chars = pd.concat(parts)
+    chars = chars.loc[[k for k in R.columns if k in chars.index]]
+    pos   = pd.Series(np.arange(len(chars)), index=chars.index)
+
+    losses = {}
+    for q, ql in TAIL_QS:
+        n_tail = np.zeros(len(chars), int)
+        L = np.full((max(len(b) for _, b in blocks[ql]), len(chars)), np.nan)
+        for keys, block in blocks[ql]:
+            j = pos[keys].values
+            L[:len(block), j] = block
+            n_tail[j] = len(block)
+        alpha, k = hill_estimator(L, HILL_K_FRAC, np.maximum(5, n_tail // 3))
+        chars[f'tail_alpha_{ql}'] = alpha
+        chars[f'neg_alpha_{ql}']  = -alpha
+        chars[f'n_tail_{ql}']     = k
+        losses[ql] = (L, n_tail)
+
+    order = (['mean_excess','n_obs'] + FACTOR_VARS +
+             ['beta','sys_var','sigma','skewness','kurtosis','var_5'] +
+             [f'{v}_{ql}' for _, ql in TAIL_QS
+              for v in ['sys_tail','tail_alpha','neg_alpha',
+                        'tail_beta','n_tail']])
+    return chars[order], losses
+
+
+def build_cross_section(all_factors, deciles, industries, n_boot=N_BOOT):
+    """
+    Cross-section of full-sample characteristics.  With n_boot > 0 each
+    tail index also gets a subsample-bootstrap standard error
+    (tail_alpha_se_q*).
+    """
+    print("\nBuilding full-sample cross-section...")
+    R, meta = _portfolio_panel(all_factors, deciles, industries)
+    chars, losses = panel_chars(R, all_factors)
+    if n_boot:
+        for _, ql in TAIL_QS:
+            L, n_tail = losses[ql]
+            chars[f'tail_alpha_se_{ql}'] = hill_subsample_se(L, n_tail,
+                                                              n_boot=n_boot)
+
+    info = pd.DataFrame(meta, columns=['portfolio','portfolio_type',
+                                       'factor_group']).set_index('portfolio')
+    df = chars.join(info).rename_axis('portfolio').reset_index()
     print(f"  {len(df)} portfolios  "
           f"({(df.portfolio_type=='decile').sum()} decile, "
           f"{(df.portfolio_type=='industry').sum()} industry)")
 
     # Report tail index summary
     print(f"\n  Tail index summary (full sample, ~{int(df.n_obs.mean())} months):")
-    for ql in ['q5','q10','q20']:
+    for _, ql in TAIL_QS:
         col = f'tail_alpha_{ql}'
         v   = df[col].dropna()
         n   = df[f'n_tail_{ql}'].mean()
+        se  = (f"  avg SE={df[f'tail_alpha_se_{ql}'].mean():.2f}"
+               if n_boot else '')
         print(f"    {ql}: α mean={v.mean():.2f}  std={v.std():.2f}  "
               f"min={v.min():.2f}  max={v.max():.2f}  "
-              f"(avg {n:.0f} tail obs)")
+              f"(avg {n:.0f} tail obs){se}")
     return df
 
 
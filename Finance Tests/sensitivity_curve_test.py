@@ -119,162 +119,235 @@ def fetch_data():
 # 2.  SENSITIVITY CURVE ESTIMATION
 # ══════════════════════════════════════════════════════════════════════════════
 
-def regime_beta(r_exc, rm_exc, mask, fallback_beta, min_obs=10):
-    """OLS beta in regime defined by mask, with fallback."""
-    r_, rm_ = r_exc[mask], rm_exc[mask]
-    if len(r_) < min_obs or rm_.var() < 1e-12:
-        return fallback_beta
-    X = sm.add_constant(rm_.rename('x'))
-    return float(sm.OLS(r_, X).fit().params['x'])
-
-
-def compute_characteristics(ret_series, factors_df, n_bins=5):
-    idx = ret_series.index.intersection(factors_df.index)
-    ret_series = ret_series.loc[idx].dropna()
-    idx = ret_series.index.intersection(factors_df.index)
-    if len(idx) < 60:
-        return None
-
-    r   = ret_series.loc[idx] / 100
-    rf  = factors_df.loc[idx, 'RF']  / 100
-    mkt = factors_df.loc[idx, 'Mkt-RF'] / 100
-    smb = factors_df.loc[idx, 'SMB'] / 100
-    hml = factors_df.loc[idx, 'HML'] / 100
-    rmw = factors_df.loc[idx, 'RMW'] / 100
-    cma = factors_df.loc[idx, 'CMA'] / 100
-    mom_s = factors_df.loc[idx, 'MOM'] / 100 \
-            if 'MOM' in factors_df.columns \
-            else pd.Series(0.0, index=idx)
-
-    r_exc  = r - rf
-    rm_exc = mkt
-
-    # ── FF5 + MOM loadings ────────────────────────────────────────────────────
-    Xf = sm.add_constant(pd.DataFrame({
-        'Mkt-RF': mkt, 'SMB': smb, 'HML': hml,
-        'RMW': rmw, 'CMA': cma, 'MOM': mom_s
-    }))
-    reg = sm.OLS(r_exc, Xf).fit()
-    loadings = {f'load_{k}': reg.params[k]
-                for k in ['Mkt-RF','SMB','HML','RMW','CMA','MOM']}
-    beta_avg = float(reg.params['Mkt-RF'])
-
-    # ── Quintile sensitivity curve (5 bins) ───────────────────────────────────
-    quantiles = np.linspace(0, 1, n_bins + 1)
-    edges     = np.quantile(rm_exc.dropna(), quantiles)
-    edges     = np.unique(edges)
-    n_actual  = len(edges) - 1
-
-    bin_betas = []
-    bin_masks = []
-    for i in range(n_actual):
-        lo, hi = edges[i], edges[i+1]
-        mask = (rm_exc >= lo) & (rm_exc <= hi) \
-               if i == n_actual - 1 \
-               else (rm_exc >= lo) & (rm_exc < hi)
-        b = regime_beta(r_exc, rm_exc, mask, beta_avg)
-        bin_betas.append(b)
-        bin_masks.append(mask)
-
-    # Pad to exactly 5 bins if needed
-    while len(bin_betas) < 5:
-        bin_betas.append(beta_avg)
-    bin_betas = bin_betas[:5]
-
-    bq1, bq2, bq3, bq4, bq5 = bin_betas
-
-    # ── Shape measures ────────────────────────────────────────────────────────
-    # Middle bin as reference point for normal market conditions
-    b_mid = bq3
-
-    # How much does the stock amplify in crashes vs normal?
-    tail_sensitivity = bq1 - b_mid
-
-    # How much does the stock amplify in booms vs normal?
-    boom_sensitivity = bq5 - b_mid
-
-    # Pure directional asymmetry: do crashes amplify MORE than booms?
-    # Positive = crash amplification dominates (skewness/loss aversion story)
-    tail_asymmetry = tail_sensitivity - boom_sensitivity
-
-    # Convexity: do BOTH tails amplify relative to the middle?
-    # Positive = U-shaped curve (kurtosis/fat-tail story)
-    curve_convexity = (bq1 + bq5) / 2 - b_mid
-
-    # Overall slope: OLS of bin_beta on bin_rank
-    # Negative = higher beta in worse states overall
-    ranks  = np.array([1,2,3,4,5], dtype=float)
-    betas  = np.array(bin_betas, dtype=float)
-    curve_slope = float(np.polyfit(ranks, betas, 1)[0]) \
-                  if betas.std() > 1e-10 else 0.0
-
-    # Simple bad/good asymmetry (from previous test, for comparison)
-    beta_asym_simple = bq1 - bq5
-
-    # Monotonicity: count of decreasing consecutive pairs (max 4)
-    mono = sum(1 if betas[i] > betas[i+1] else 0
-               for i in range(4))
-
-    # ── Standalone moments ────────────────────────────────────────────────────
-    sigma    = float(r_exc.std())
-    skewness = float(stats.skew(r_exc.dropna()))
-    kurtosis = float(stats.kurtosis(r_exc.dropna()))
-    var_5    = float(np.percentile(r_exc.dropna(), 5))
-
+FACTOR_COLS = ['Mkt-RF','SMB','HML','RMW','CMA','MOM']
+MIN_MONTHS  = 60       # portfolio history needed for a curve
+MIN_BIN_OBS = 10       # months per bin before falling back to beta_avg
+ROLL_WINDOW = 120      # months per window for rolling curves
+ROLL_STEP   = 12
+
+
+def market_bins(rm, n_bins):
+    """
+    Equal-count bins of the market return: bin index (0 .. K-1) per month,
+    -1 where rm is missing.  Bins are [lo, hi) with the top bin closed;
+    duplicate quantile edges are merged, so K <= n_bins.
+    """
+    rm = np.asarray(rm, float)
+    ok = np.isfinite(rm)
+    edges = np.unique(np.quantile(rm[ok], np.linspace(0, 1, n_bins + 1)))
+    bins = np.full(len(rm), -1)
+    bins[ok] = np.searchsorted(edges[1:-1], rm[ok], side='right')
+    return bins, max(len(edges) - 1, 1)
+
+
+def binned_betas(Y, x, bins, K, fallback, min_obs=MIN_BIN_OBS):
+    """
+    OLS slope of every column of Y on x within each bin, from grouped sums
+    of x, y, xy and x^2 (one (T x K)' (T x N) product per moment).
+
+    Y: (T, N) with NaN where missing; x, bins: (T,); fallback: (N,).
+    Returns (K, N); bins with fewer than min_obs months or no market
+    variation take the fallback beta.
+    """
+    ok = bins >= 0
+    G  = np.zeros((len(x), K))
+    G[np.flatnonzero(ok), bins[ok]] = 1.0
+    V  = (np.isfinite(Y) & ok[:, None]).astype(float)
+    x0 = np.where(ok, x, 0.0)[:, None]
+    Y0 = np.where(V > 0, Y, 0.0)
+
+    n   = G.T @ V
+    sx  = G.T @ (V * x0)
+    sxx = G.T @ (V * x0**2)
+    sy  = G.T @ Y0
+    sxy = G.T @ (Y0 * x0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vxx  = sxx - sx**2 / n
+        beta = (sxy - sx * sy / n) / vxx
+        flat = ~(vxx / (n - 1) >= 1e-12)
+    return np.where((n < min_obs) | flat, fallback[None, :], beta)
+
+
+def factor_loadings(Y, X):
+    """OLS coefficients [const, X...] for every column of Y: (1+k, N)."""
+    Xc = np.column_stack([np.ones(len(X)), X])
+    return np.linalg.lstsq(Xc, Y, rcond=None)[0]
+
+
+def curve_shape(B):
+    """
+    Shape measures of sensitivity curves B (K bins x N portfolios):
+    first bin = crashes, middle bin = normal, last bin = booms.
+    """
+    K = B.shape[0]
+    b_lo, b_mid, b_hi = B[0], B[K // 2], B[-1]
+    ranks = np.arange(1, K + 1, dtype=float)
+    rc    = ranks - ranks.mean()
+    slope = rc @ B / (rc @ rc) if K > 1 else np.zeros(B.shape[1])
+    slope = np.where(B.std(axis=0) > 1e-10, slope, 0.0)
     return {
-        'mean_excess':      float(r_exc.mean() * 12),
-        'n_obs':            len(idx),
-        **loadings,
-        'beta_avg':         beta_avg,
-        # Quintile betas
-        'beta_q1':          bq1,
-        'beta_q2':          bq2,
-        'beta_q3':          bq3,
-        'beta_q4':          bq4,
-        'beta_q5':          bq5,
-        # Shape measures
-        'tail_sensitivity': tail_sensitivity,
-        'boom_sensitivity': boom_sensitivity,
-        'tail_asymmetry':   tail_asymmetry,
-        'curve_convexity':  curve_convexity,
-        'curve_slope':      curve_slope,
-        'beta_asym_simple': beta_asym_simple,
-        'mono_score':       float(mono),
-        # Standalone moments
-        'sigma':            sigma,
-        'skewness':         skewness,
-        'kurtosis':         kurtosis,
-        'var_5pct':         var_5,
+        # How much does the stock amplify in crashes / booms vs normal?
+        'tail_sensitivity': b_lo - b_mid,
+        'boom_sensitivity': b_hi - b_mid,
+        # Pure directional asymmetry: do crashes amplify MORE than booms?
+        # Positive = crash amplification dominates (skewness/loss aversion story)
+        'tail_asymmetry':   (b_lo - b_mid) - (b_hi - b_mid),
+        # Convexity: do BOTH tails amplify relative to the middle?
+        # Positive = U-shaped curve (kurtosis/fat-tail story)
+        'curve_convexity':  (b_lo + b_hi) / 2 - b_mid,
+        # Overall slope: OLS of bin_beta on bin_rank
+        # Negative = higher beta in worse states overall
+        'curve_slope':      slope,
+        # Simple bad/good asymmetry (from previous test, for comparison)
+        'beta_asym_simple': b_lo - b_hi,
+        # Monotonicity: count of decreasing consecutive pairs
+        'mono_score':       (B[:-1] > B[1:]).sum(axis=0).astype(float),
     }
 
 
-def build_cross_section(all_factors, deciles, industries, n_bins=5):
-    print(f"\nComputing sensitivity curves ({n_bins} bins)...")
-    rows = []
+def compute_characteristics(R, factors_df, n_bins=5):
+    """
+    Sensitivity curves and shape measures for every portfolio in R
+    (months x portfolios, % returns on factors_df's index).
+
+    Portfolios are grouped by their set of available months; within a
+    group the market bins, FF5 + MOM loadings and all bin betas are
+    computed once for the whole group.  Returns {portfolio: row dict}
+    for portfolios with at least MIN_MONTHS months.
+    """
+    F = factors_df.reindex(R.index)
+    if 'MOM' not in F.columns:
+        F = F.assign(MOM=0.0)
+    Fv = F[FACTOR_COLS].values / 100
+    rf = F['RF'].values / 100
+    V  = R.notna().values & np.isfinite(Fv).all(axis=1)[:, None] \
+         & np.isfinite(rf)[:, None]
+
+    groups = {}
+    for j in range(R.shape[1]):
+        groups.setdefault(V[:, j].tobytes(), []).append(j)
+
+    out = {}
+    for cols in groups.values():
+        rows = V[:, cols[0]]
+        if rows.sum() < MIN_MONTHS:
+            continue
+        r_exc  = R.values[rows][:, cols] / 100 - rf[rows, None]
+        rm_exc = Fv[rows, 0]
+
+        # ── FF5 + MOM loadings ────────────────────────────────────────────────
+        coef = factor_loadings(r_exc, Fv[rows])
+        beta_avg = coef[1]
+
+        # ── Sensitivity curve (n_bins bins) ───────────────────────────────────
+        bins, K = market_bins(rm_exc, n_bins)
+        B = binned_betas(r_exc, rm_exc, bins, K, beta_avg)
+        # Pad to exactly n_bins bins if edges merged
+        if K < n_bins:
+            B = np.vstack([B, np.tile(beta_avg, (n_bins - K, 1))])
+        shape = curve_shape(B)
+
+        # ── Standalone moments ────────────────────────────────────────────────
+        sigma    = r_exc.std(axis=0, ddof=1)
+        skewness = stats.skew(r_exc, axis=0)
+        kurtosis = stats.kurtosis(r_exc, axis=0)
+        var_5    = np.percentile(r_exc, 5, axis=0)
+        mean_exc = r_exc.mean(axis=0) * 12
+
+        for k, j in enumerate(cols):
+            out[R.columns[j]] = {
+                'mean_excess':      float(mean_exc[k]),
+                'n_obs':            int(rows.sum()),
+                **{f'load_{f}': float(coef[1 + i, k])
+                   for i, f in enumerate(FACTOR_COLS)},
+                'beta_avg':         float(beta_avg[k]),
+                # Bin betas
+                **{f'beta_q{i+1}': float(B[i, k]) for i in range(n_bins)},
+                # Shape measures
+                **{m: float(v[k]) for m, v in shape.items()},
+                # Standalone moments
+                'sigma':            float(sigma[k]),
+                'skewness':         float(skewness[k]),
+                'kurtosis':         float(kurtosis[k]),
+                'var_5pct':         float(var_5[k]),
+            }
+    return out
+
+
+def _portfolio_panel(all_factors, deciles, industries):
+    """All decile and industry portfolios as one (months x portfolios) frame."""
+    cols, meta = {}, []
     for fname, ddf in deciles.items():
         for col in ddf.columns:
-            s = ddf[col].dropna()
-            idx = s.index.intersection(all_factors.index)
-            row = compute_characteristics(
-                s.loc[idx], all_factors.loc[idx], n_bins)
-            if row:
-                row['portfolio_type'] = 'decile'
-                row['factor_group']   = fname
-                rows.append(row)
+            key = f'{fname}:{col}'
+            cols[key] = ddf[col]
+            meta.append((key, 'decile', fname))
     for col in industries.columns:
-        s = industries[col].dropna()
-        idx = s.index.intersection(all_factors.index)
-        row = compute_characteristics(
-            s.loc[idx], all_factors.loc[idx], n_bins)
-        if row:
-            row['portfolio_type'] = 'industry'
-            row['factor_group']   = 'industry'
+        key = f'industry:{col}'
+        cols[key] = industries[col]
+        meta.append((key, 'industry', 'industry'))
+    R = pd.DataFrame(cols).reindex(all_factors.index)
+    return R, meta
+
+
+def build_cross_section(all_factors, deciles, industries, n_bins=5):
+    print(f"\nComputing sensitivity curves ({n_bins} bins)...")
+    R, meta = _portfolio_panel(all_factors, deciles, industries)
+    chars = compute_characteristics(R, all_factors, n_bins)
+    rows = []
+    for key, ptype, group in meta:
+        if key in chars:
+            row = dict(chars[key])
+            row['portfolio_type'] = ptype
+            row['factor_group']   = group
             rows.append(row)
     df = pd.DataFrame(rows)
     print(f"  {len(df)} portfolios built")
     return df
 
 
+def rolling_curves(all_factors, deciles, industries, n_bins=5,
+                   window=ROLL_WINDOW, step=ROLL_STEP):
+    """
+    Sensitivity curves and shape measures in rolling windows of `window`
+    months, stepping by `step`.  Bins, loadings and bin betas are
+    re-estimated inside each window.  Returns a long DataFrame indexed by
+    (window end, portfolio).
+    """
+    R, meta = _portfolio_panel(all_factors, deciles, industries)
+    dates = R.index
+    frames = []
+    for e in range(window, len(dates) + 1, step):
+        chars = compute_characteristics(R.iloc[e - window:e], all_factors, n_bins)
+        if chars:
+            f = pd.DataFrame.from_dict(chars, orient='index')
+            f.index = pd.MultiIndex.from_product([[dates[e - 1]], f.index],
+                                                 names=['end', 'portfolio'])
+            frames.append(f)
+    return pd.concat(frames) if frames else pd.DataFrame()
+
+
+def rolling_summary(roll):
+    """Print how stable the curve shape is across rolling windows."""
+    if roll.empty:
+        print("  (insufficient data for rolling windows)")
+        return
+    print(f"\n── Rolling Sensitivity Curves ({ROLL_WINDOW}-month windows) ─────────────")
+    ends = roll.index.get_level_values('end').unique()
+    print(f"  {len(ends)} windows, {ends[0].strftime('%Y-%m')} to {ends[-1].strftime('%Y-%m')}")
+    print(f"  {'Measure':<22} {'Mean':>8} {'Std':>8} {'Rank AC':>8}")
+    print("  " + "-"*50)
+    for col in ['tail_asymmetry', 'curve_convexity', 'curve_slope']:
+        W = roll[col].unstack('portfolio')
+        xs = W.mean(axis=1)
+        rk = W.rank(axis=1)
+        ac = rk.iloc[1:].reset_index(drop=True).corrwith(
+             rk.iloc[:-1].reset_index(drop=True), axis=1).mean()
+        print(f"  {col:<22} {xs.mean():>+8.4f} {xs.std():>8.4f} {ac:>+8.3f}")
+    print("  (Mean/Std: time series of the cross-sectional mean; Rank AC:")
+    print("   mean rank correlation of the measure between adjacent windows)")
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # 3.  SHAPE DIAGNOSTIC
 # ══════════════════════════════════════════════════════════════════════════════
@@ -594,6 +667,8 @@ def main():
 
     shape_diagnostic(df)
 
+    rolling_summary(rolling_curves(all_factors, deciles, industries, n_bins=5))
+
     regs_all, sub_all = run_regressions(df, 'All portfolios')
 
     ind_df = df[df['portfolio_type']=='industry']
@@ -157,41 +157,69 @@ def power_utility(w, gamma):
     return result
 
 
+def expected_utility_matrix(nus, sigmas, rf_means, gammas,
+                            n_std=10, n_points=2000, block=32):
+    """
+    Vectorised E[U(1 + R_sys)] for every portfolio × γ pair.
+
+    Each portfolio p has R_sys ~ t(ν_p, 0, σ_p).  All portfolios share one
+    standardised grid u ∈ [-1, 1]; portfolio p integrates over x = bound_p·u
+    with the same bound as the scalar version, so results are identical.
+    The density and log gross return are evaluated once per portfolio and
+    reused for every γ; utilities are formed as exp((1-γ)·log w)/(1-γ) in
+    blocks of `block` gammas to bound memory at P × block × n_points.
+
+    Returns (eu, util_cost), both arrays of shape (n_portfolios, n_gammas).
+    """
+    nu    = np.atleast_1d(np.asarray(nus,    dtype=float))
+    sigma = np.atleast_1d(np.asarray(sigmas, dtype=float))
+    rf    = np.broadcast_to(np.asarray(rf_means, dtype=float), nu.shape)
+    g     = np.atleast_1d(np.asarray(gammas, dtype=float))
+
+    # Per-portfolio integration bound (fat tails need a wider range)
+    spread = np.where(nu > 2, np.sqrt(nu / np.where(nu > 2, nu - 2, 1.0)), 5.0)
+    bound  = n_std * sigma * np.maximum(1.0, spread)
+    u  = np.linspace(-1.0, 1.0, n_points)
+    x  = bound[:, None] * u[None, :]
+    dx = bound * (u[1] - u[0])
+
+    pdf   = stats.t.pdf(x, df=nu[:, None], loc=0, scale=sigma[:, None])
+    gross = 1.0 + x
+    valid = gross > 0
+    lg    = np.log(np.where(valid, gross, 1.0))
+    wts   = np.where(valid, pdf, 0.0) * dx[:, None]   # quadrature weights
+
+    is_log = np.abs(g - 1.0) < 1e-6
+    expo   = np.where(is_log, 1.0, 1.0 - g)            # 1-γ (dummy for γ=1)
+    eu     = np.empty((len(nu), len(g)))
+    for lo in range(0, len(g), block):
+        e = expo[lo:lo+block]
+        u_vals = np.exp(e[None, :, None] * lg[:, None, :]) / e[None, :, None]
+        eu[:, lo:lo+block] = np.einsum('pgn,pn->pg', u_vals, wts)
+    if is_log.any():
+        eu[:, is_log] = (lg * wts).sum(axis=1)[:, None]
+
+    # Utility of the (certain) risk-free rate
+    lrf  = np.log(1.0 + rf)[:, None]
+    u_rf = np.where(is_log[None, :], lrf,
+                    np.exp(expo[None, :] * lrf) / expo[None, :])
+    return eu, u_rf - eu
+
+
 def expected_utility_student_t(nu, sigma, rf_mean, gamma,
                                 n_std=10, n_points=2000):
     """
     Compute E[U(1 + R_sys)] where R_sys ~ t(ν, 0, σ) and
     U is power utility with risk aversion γ.
 
-    Uses numerical integration over the Student-t density.
+    Uses numerical integration over the Student-t density
+    (single-portfolio, single-γ case of expected_utility_matrix).
     Returns (expected_utility, utility_cost = U(1+rf) - E[U(1+R_sys)])
     Positive utility_cost = portfolio is costly to hold = should earn premium.
     """
-    # Integration range: ±n_std standard deviations
-    # For fat-tailed distributions we need wider range
-    bound = n_std * sigma * max(1.0, (nu/(nu-2))**0.5 if nu > 2 else 5.0)
-    x = np.linspace(-bound, bound, n_points)
-    dx = x[1] - x[0]
-
-    # Student-t density
-    pdf = stats.t.pdf(x, df=nu, loc=0, scale=sigma)
-
-    # Gross returns
-    gross = 1.0 + x   # 1 + excess return
-
-    # Utility at each point
-    u_vals = power_utility(gross, gamma)
-
-    # Mask invalid (gross <= 0)
-    valid = gross > 0
-    eu = float(np.sum(u_vals[valid] * pdf[valid]) * dx)
-
-    # Utility of risk-free rate (certain)
-    u_rf = float(power_utility(np.array([1.0 + rf_mean]), gamma)[0])
-
-    util_cost = u_rf - eu   # positive = portfolio is utility-costly
-
-    return eu, util_cost
+    eu, uc = expected_utility_matrix([nu], [sigma], [rf_mean], [gamma],
+                                     n_std=n_std, n_points=n_points)
+    return float(eu[0, 0]), float(uc[0, 0])
 
 
 def compute_portfolio_chars(ret_series, factors_df,
@@ -268,13 +296,11 @@ def compute_portfolio_chars(ret_series, factors_df,
     nu_tail_20    = fit_tail_20['nu']    if fit_tail_20 else np.nan
     sigma_tail_20 = fit_tail_20['sigma'] if fit_tail_20 else np.nan
 
-    # Expected utility at each γ
-    eu_dict = {}
-    uc_dict = {}
-    for gamma in gammas:
-        eu, uc = expected_utility_student_t(nu, sigma, rf_mean, gamma)
-        eu_dict[f'eu_g{gamma}']  = eu
-        uc_dict[f'uc_g{gamma}']  = uc   # utility cost — should predict return
+    # Expected utility at each γ (one broadcast over the whole γ grid)
+    eu_row, uc_row = expected_utility_matrix([nu], [sigma], [rf_mean], gammas)
+    eu_dict = {f'eu_g{g}': float(v) for g, v in zip(gammas, eu_row[0])}
+    uc_dict = {f'uc_g{g}': float(v)   # utility cost — should predict return
+               for g, v in zip(gammas, uc_row[0])}
 
     # ── Risk measures ────────────────────────────────────────────────────────
     # Full systematic variance (includes tail months — partially redundant)
@@ -310,6 +336,7 @@ def compute_portfolio_chars(ret_series, factors_df,
     return {
         'mean_excess':  mean_excess,
         'n_obs':        len(idx),
+        'rf_mean':      rf_mean,
         **loadings,
         'beta':         beta,
         # Student-t parameters
@@ -397,39 +424,97 @@ def build_cross_section(all_factors, deciles, industries,
 FACTOR_VARS = ['load_Mkt-RF','load_SMB','load_HML',
                'load_RMW','load_CMA','load_MOM']
 
-def find_implied_gamma(df, gammas=(1, 2, 3, 5, 8, 10)):
+def utility_cost_matrix(df, gammas, **kw):
+    """
+    Utility cost for every portfolio (row of df) × γ, shape (len(df), len(γ)).
+    Re-integrates from the fitted (ν, σ_t, rf_mean) so any γ grid can be used;
+    falls back to the stored uc_g* columns for frames without rf_mean.
+    """
+    if 'rf_mean' in df.columns:
+        _, uc = expected_utility_matrix(df['nu'].values, df['sigma_t'].values,
+                                        df['rf_mean'].values, gammas, **kw)
+        return uc
+    return np.column_stack([df[f'uc_g{g}'].values for g in gammas])
+
+
+def _univariate_ols(X, y, weights=None):
+    """
+    Slope, R² and t-stat of y on a constant + each column of X separately,
+    for all columns at once.  Rows with NaN in y or that column are dropped
+    per column (as df.dropna(subset=[col, y]) would).
+
+    weights (n_draws × n_rows) are frequency weights — one row per bootstrap
+    draw; the returned arrays then have shape (n_draws, n_cols).
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    M = np.isfinite(X) & np.isfinite(y)[:, None]
+    Xm = np.where(M, X, 0.0)
+    ym = np.where(M, y[:, None], 0.0)
+    W = np.ones((1, len(y))) if weights is None else np.asarray(weights, float)
+
+    n   = W @ M
+    sx  = W @ Xm
+    sy  = W @ ym
+    sxx = W @ (Xm * Xm) - sx**2 / n
+    syy = W @ (ym * ym) - sy**2 / n
+    sxy = W @ (Xm * ym) - sx * sy / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        coef = sxy / sxx
+        r2   = sxy**2 / (sxx * syy)
+        s2   = (syy - coef * sxy) / (n - 2)
+        t    = coef / np.sqrt(s2 / sxx)
+    if weights is None:
+        return coef[0], r2[0], t[0]
+    return coef, r2, t
+
+
+def find_implied_gamma(df, gammas=(1, 2, 3, 5, 8, 10), verbose=True):
     """
     Find γ that maximises cross-sectional R² of utility cost
     predicting mean excess returns.
     This is the implied aggregate market risk aversion.
+
+    The utility-cost matrix and all per-γ regressions are computed in one
+    pass, so dense γ grids (hundreds of values) cost little extra.
     """
-    print(f"\n── Finding Implied Market Risk Aversion ─────────────────────────")
-    print(f"  {'γ':>5}  {'Util cost R²':>13}  {'t-stat':>8}  {'sign':>6}")
-    print("  " + "-"*38)
-
-    results = []
-    for gamma in gammas:
-        uc_col = f'uc_g{gamma}'
-        if uc_col not in df.columns:
-            continue
-        sub = df.dropna(subset=[uc_col,'mean_excess'])
-        y   = sub['mean_excess']
-        X   = sm.add_constant(sub[[uc_col]])
-        reg = sm.OLS(y, X).fit()
-        t   = reg.tvalues.get(uc_col, np.nan)
-        c   = reg.params.get(uc_col, np.nan)
-        sign = '+✓' if c > 0 else '-✗'
-        print(f"  {gamma:>5.1f}  {reg.rsquared:>13.4f}  {t:>+8.2f}  {sign:>6}")
-        results.append({'gamma': gamma, 'r2': reg.rsquared,
-                        't': t, 'coef': c})
-
-    res_df = pd.DataFrame(results)
-    best   = res_df.loc[res_df['r2'].idxmax()]
-    print(f"\n  Implied γ (max R²): {best.gamma:.1f}  "
-          f"(R²={best.r2:.4f}, t={best.t:+.2f})")
+    gammas = list(gammas)
+    coef, r2, t = _univariate_ols(utility_cost_matrix(df, gammas),
+                                  df['mean_excess'].values)
+    res_df = pd.DataFrame({'gamma': gammas, 'r2': r2, 't': t, 'coef': coef})
+
+    best = res_df.loc[res_df['r2'].idxmax()]
+    if verbose:
+        print(f"\n── Finding Implied Market Risk Aversion ─────────────────────────")
+        print(f"  {'γ':>5}  {'Util cost R²':>13}  {'t-stat':>8}  {'sign':>6}")
+        print("  " + "-"*38)
+        for _, r in res_df.iterrows():
+            sign = '+✓' if r.coef > 0 else '-✗'
+            print(f"  {r.gamma:>5.1f}  {r.r2:>13.4f}  {r.t:>+8.2f}  {sign:>6}")
+        print(f"\n  Implied γ (max R²): {best.gamma:.1f}  "
+              f"(R²={best.r2:.4f}, t={best.t:+.2f})")
     return float(best.gamma), res_df
 
 
+def bootstrap_implied_gamma(df, gammas, n_boot=1000, ci=0.90, seed=0):
+    """
+    Bootstrap the implied γ by resampling portfolios with replacement.
+    The utility-cost matrix is integrated once; each draw only re-weights
+    the cross-sectional regressions, so all draws × all γ are one matrix
+    product.  Returns (gamma_draws, (lo, hi)).
+    """
+    gammas = np.asarray(list(gammas), dtype=float)
+    uc = utility_cost_matrix(df, gammas)
+    y  = df['mean_excess'].values
+    rng = np.random.default_rng(seed)
+    W = rng.multinomial(len(y), np.full(len(y), 1.0 / len(y)), size=n_boot)
+    _, r2, _ = _univariate_ols(uc, y, weights=W)
+    draws = gammas[np.nanargmax(r2, axis=1)]
+    a = (1 - ci) / 2
+    return draws, (float(np.quantile(draws, a)),
+                   float(np.quantile(draws, 1 - a)))
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # 4.  MAIN REGRESSIONS
 # ══════════════════════════════════════════════════════════════════════════════
@@ -796,6 +881,13 @@ def main():
     # Find implied γ
     gamma_implied, gamma_df = find_implied_gamma(df, gammas)
 
+    # Dense γ sweep + bootstrap band (reuses the fitted ν, σ per portfolio)
+    dense = np.round(np.arange(1.0, 20.01, 0.1), 2)
+    g_dense, _ = find_implied_gamma(df, dense, verbose=False)
+    _, (g_lo, g_hi) = bootstrap_implied_gamma(df, dense)
+    print(f"  Dense sweep (Δγ=0.1): γ={g_dense:.1f}  "
+          f"90% bootstrap CI [{g_lo:.1f}, {g_hi:.1f}]")
+
     # Main regressions
     regs_all, sub_all = run_regressions(df, gamma_implied, 'All portfolios')
 
@@ -134,6 +134,97 @@ def fetch_data():
 # 2.  TAIL INDEX ESTIMATION
 # ══════════════════════════════════════════════════════════════════════════════
 
+def hill_curve(losses):
+    """
+    Hill estimates for every k at once.
+
+    Each series is sorted once (descending); with cumulative sums of the
+    log losses, α̂(k) = k / (Σ_{i<k} log L_(i) − k·log L_(k)) for all k.
+
+    Parameters:
+        losses: 1-D array, or 2-D (series × obs) array padded with NaN.
+                Non-positive and NaN values are ignored.
+
+    Returns:
+        alphas: (series × max_k) array, alphas[..., k-1] = α̂ at k
+                (NaN where k >= n or the log-ratio sum is not positive)
+        n:      number of positive losses per series
+    """
+    L = np.atleast_2d(np.asarray(losses, dtype=float))
+    L = np.where(L > 0, L, np.nan)
+    L = -np.sort(-L, axis=1)                 # descending, NaN last
+    n = np.isfinite(L).sum(axis=1)
+
+    logs = np.log(L)
+    cum  = np.cumsum(np.nan_to_num(logs), axis=1)
+    k    = np.arange(1, max(L.shape[1], 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        denom  = cum[:, k-1] - k * logs[:, k] if L.shape[1] > 1 \
+                 else np.full((len(L), 1), np.nan)
+        alphas = k / denom
+    alphas[(k[None, :] >= n[:, None]) | ~(denom > 1e-12)] = np.nan
+    if np.ndim(losses) == 1:
+        return alphas[0], n[0]
+    return alphas, n
+
+
+def hill_batch(losses, k=None, k_fraction=0.10):
+    """
+    hill_estimator for many series at once (rows of a NaN-padded matrix).
+    k may be None (k_fraction rule), a scalar or a per-series array.
+    Returns (alpha, k_used) arrays.
+    """
+    alphas, n = hill_curve(np.atleast_2d(losses))
+    if k is None:
+        k = np.maximum(5, (n * k_fraction).astype(int))
+    k = np.minimum(np.broadcast_to(k, n.shape), n - 1)
+    ok = (n >= 5) & (k >= 1)
+    rows = np.arange(len(n))
+    alpha = np.full(len(n), np.nan)
+    alpha[ok] = alphas[rows[ok], k[ok] - 1]
+    ok &= np.isfinite(alpha)
+    return np.where(ok, alpha, np.nan), np.where(ok, k, 0)
+
+
+def optimal_k_batch(alphas, n):
+    """
+    optimal_k_hill applied to a batch of Hill curves from hill_curve.
+
+    Scans k in [5, min(n-1, max(10, n//2))) and picks the end of the
+    window (≤5 points) with the smallest rolling variance of α̂.  Falls
+    back to k=5 when no window has a defined variance.
+    """
+    alphas = np.atleast_2d(alphas); n = np.atleast_1d(n)
+    S, K = alphas.shape
+    k_hi = np.minimum(n - 1, np.maximum(10, n // 2))
+    m    = np.maximum(k_hi - 5, 0)                      # length of k range
+    w    = np.minimum(5, m // 3)
+
+    # Hill curve on the scanned range, position j ↔ k = 5 + j
+    j = np.arange(max(K - 4, 1))
+    A = np.full((S, len(j)), np.nan)
+    A[:, :max(K-4, 0)] = alphas[:, 4:]
+    A[j[None, :] >= m[:, None]] = np.nan
+    bad = np.cumsum(np.concatenate([np.zeros((S, 1)), ~np.isfinite(A)], 1), 1)
+    A0  = np.nan_to_num(A)
+    c1 = np.cumsum(np.concatenate([np.zeros((S, 1)), A0], 1), 1)
+    c2 = np.cumsum(np.concatenate([np.zeros((S, 1)), A0**2], 1), 1)
+
+    best = np.full(S, 5)
+    for win in range(2, 6):
+        rows = np.flatnonzero(w == win)
+        if not len(rows) or len(j) < win: continue
+        hi = np.arange(win, len(j) + 1)           # window = [hi-win, hi)
+        s1 = c1[rows][:, hi] - c1[rows][:, hi-win]
+        s2 = c2[rows][:, hi] - c2[rows][:, hi-win]
+        nb = bad[rows][:, hi] - bad[rows][:, hi-win]
+        var = (s2 - s1**2 / win) / (win - 1)
+        var[(nb > 0) | (hi[None, :] > m[rows, None])] = np.inf
+        has = np.isfinite(var).any(axis=1)
+        best[rows[has]] = 5 + hi[np.argmin(var[has], axis=1)] - 1
+    return np.where(n < 10, np.maximum(5, n // 3), best)
+
+
 def hill_estimator(losses, k=None, k_fraction=0.10):
     """
     Hill estimator for tail index α of a power law distribution.
@@ -151,25 +242,9 @@ def hill_estimator(losses, k=None, k_fraction=0.10):
         alpha: estimated tail index
         n_used: number of observations used
     """
-    losses = np.asarray(losses, dtype=float)
-    losses = losses[losses > 0]  # only positive losses
-    losses = np.sort(losses)[::-1]  # sort descending
-
-    n = len(losses)
-    if n < 5:
-        return np.nan, 0
-
-    if k is None:
-        k = max(5, int(n * k_fraction))
-    k = min(k, n - 1)
-
-    # Hill estimator
-    log_ratios = np.log(losses[:k] / losses[k])
-    if np.any(np.isnan(log_ratios)) or np.sum(log_ratios) <= 0:
-        return np.nan, 0
-
-    alpha = k / np.sum(log_ratios)
-    return float(alpha), k
+    alpha, k_used = hill_batch(np.asarray(losses, dtype=float)[None, :],
+                               k=k, k_fraction=k_fraction)
+    return float(alpha[0]), int(k_used[0])
 
 
 def optimal_k_hill(losses, k_range=None):
@@ -178,33 +253,76 @@ def optimal_k_hill(losses, k_range=None):
     Tests a range of k values and selects the most stable region of the
     Hill plot — where the estimate is approximately constant.
     """
-    losses = np.asarray(losses, dtype=float)
-    losses = losses[losses > 0]
-    losses = np.sort(losses)[::-1]
-    n = len(losses)
+    alphas, n = hill_curve(np.asarray(losses, dtype=float)[None, :])
+    if k_range is None:
+        return int(optimal_k_batch(alphas, n)[0])
+
+    k_range = list(k_range)
+    if n[0] < 10:
+        return max(5, int(n[0]) // 3)
+    a = np.array([alphas[0, k-1] if 0 < k <= alphas.shape[1] else np.nan
+                  for k in k_range])
+    if len(a) < 5:
+        return k_range[0]
+    window = min(5, len(a) // 3)
+    rolling_var = pd.Series(a).rolling(window).var()
+    return k_range[int(rolling_var.idxmin())]
+
+
+def systematic_tail_batch(R_exc, RM_exc, mask, tail_q=0.10,
+                          k_method='fraction'):
+    """
+    compute_systematic_tail_index for many (series, window) rows at once.
 
-    if n < 10:
-        return max(5, n // 3)
+    R_exc, RM_exc, mask: (rows × months) arrays, padded where mask is False.
+    The market tail threshold is the tail_q percentile of each row's own
+    valid market returns; tail losses are gathered into one NaN-padded
+    matrix and fed to a single hill_curve call.
 
-    if k_range is None:
-        k_range = range(5, min(n - 1, max(10, n // 2)))
+    Returns dict of arrays: alpha, k_used, n_tail, sys_tail (mean tail
+    return, NaN unless > 3 tail months), sys_tail_mean (as returned by
+    compute_systematic_tail_index), and the full Hill curve 'alphas'
+    with the number of positive tail losses 'n_pos'.
+    """
+    R  = np.where(mask, R_exc, np.nan)
+    RM = np.where(mask, RM_exc, np.nan)
+    thr = _row_percentile(RM, tail_q * 100)
+    tail = mask & (RM <= thr[:, None])
+    n_tail = tail.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tail_mean = np.where(tail, R, 0.0).sum(axis=1) / n_tail
+    losses = np.where(tail & (-R > 0), -R, np.nan)
+    alphas, n_pos = hill_curve(losses)
+    if k_method == 'optimal':
+        alpha, k_used = hill_batch(losses, k=optimal_k_batch(alphas, n_pos))
+    else:
+        alpha, k_used = hill_batch(losses)
 
-    alphas = []
-    for k in k_range:
-        log_ratios = np.log(losses[:k] / losses[k])
-        if np.sum(log_ratios) > 0:
-            alphas.append(k / np.sum(log_ratios))
-        else:
-            alphas.append(np.nan)
+    enough = n_tail >= 5
+    alpha  = np.where(enough, alpha, np.nan)
+    k_used = np.where(enough, k_used, 0)
+    return {
+        'alpha':         alpha,
+        'k_used':        k_used,
+        'n_tail':        n_tail,
+        'sys_tail':      np.where(n_tail > 3, tail_mean, np.nan),
+        'sys_tail_mean': np.where(enough, tail_mean, np.nan),
+        'alphas':        alphas,
+        'n_pos':         n_pos,
+    }
 
-    alphas = np.array(alphas)
-    # Find most stable region: minimum rolling variance
-    if len(alphas) < 5:
-        return list(k_range)[0]
-    window = min(5, len(alphas) // 3)
-    rolling_var = pd.Series(alphas).rolling(window).var()
-    best_k_idx = rolling_var.idxmin()
-    return list(k_range)[int(best_k_idx)]
+
+def _row_percentile(X, pct):
+    """np.percentile(row[~isnan(row)], pct) for every row of X."""
+    S = np.sort(X, axis=1)
+    n = np.isfinite(X).sum(axis=1)
+    pos = pct / 100 * np.maximum(n - 1, 0)
+    lo  = np.floor(pos).astype(int)
+    hi  = np.minimum(lo + 1, np.maximum(n - 1, 0))
+    rows = np.arange(len(X))
+    out = S[rows, lo] + (S[rows, hi] - S[rows, lo]) * (pos - lo)
+    return np.where(n > 0, out, np.nan)
 
 
 def compute_systematic_tail_index(r_exc, rm_exc, tail_q=0.10,
@@ -220,36 +338,12 @@ def compute_systematic_tail_index(r_exc, rm_exc, tail_q=0.10,
         n_tail_obs: number of tail observations used
         sys_tail_mean: mean portfolio return in tail months (for comparison)
     """
-    # Market tail threshold
-    threshold = float(np.percentile(rm_exc.dropna(), tail_q * 100))
-    tail_mask = rm_exc <= threshold
-
-    r_tail  = r_exc[tail_mask]
-    n_tail  = tail_mask.sum()
-
-    if n_tail < 5:
-        return np.nan, 0, np.nan
-
-    # Convert to losses (negate returns, keep positive losses)
-    # We look at losses relative to the risk-free rate
-    losses = -r_tail.values  # losses are positive when returns are negative
-    # Keep all values — even small positive returns in tail months
-    # represent "less bad" outcomes that inform the tail shape
-    losses_positive = losses[losses > 0]
-
-    if len(losses_positive) < 5:
-        return np.nan, 0, float(r_tail.mean())
-
-    # Estimate tail index
-    if k_method == 'optimal':
-        k = optimal_k_hill(losses_positive)
-    else:
-        k = None  # use k_fraction default
-
-    alpha, k_used = hill_estimator(losses_positive, k=k)
-    sys_tail_mean = float(r_tail.mean())
-
-    return alpha, k_used, sys_tail_mean
+    r  = np.asarray(r_exc, dtype=float)[None, :]
+    rm = np.asarray(rm_exc, dtype=float)[None, :]
+    res = systematic_tail_batch(r, rm, np.isfinite(r) & np.isfinite(rm),
+                                tail_q=tail_q, k_method=k_method)
+    return (float(res['alpha'][0]), int(res['k_used'][0]),
+            float(res['sys_tail_mean'][0]))
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -489,6 +583,42 @@ def run_retroactive(df, label='All portfolios'):
 # 5.  ROLLING MEDIATION WITH TAIL INDEX
 # ══════════════════════════════════════════════════════════════════════════════
 
+ROLL_FACTORS = ['Mkt-RF','SMB','HML','RMW','CMA','MOM']
+
+def rolling_tail_chars_batch(R_exc, F, mask, tail_q=0.10):
+    """
+    compute_rolling_tail_index for many (portfolio, window) rows at once.
+
+    R_exc: (rows × months) excess returns, F: (rows × months × 6) factor
+    returns in ROLL_FACTORS order (both in decimals), mask: valid months.
+    FF6 loadings come from per-row normal equations; tail measures from
+    systematic_tail_batch.  Returns a DataFrame with one row per input
+    row and the same columns as compute_rolling_tail_index.
+    """
+    W  = mask.astype(float)
+    X  = np.concatenate([np.ones(F.shape[:2] + (1,)), np.nan_to_num(F)], 2)
+    R0 = np.where(mask, R_exc, 0.0)
+    XtX = np.einsum('stk,st,stl->skl', X, W, X)
+    Xty = np.einsum('stk,st->sk', X, W * R0)
+    params = np.einsum('skl,sl->sk', np.linalg.pinv(XtX), Xty)
+
+    rm = np.where(mask, F[:, :, 0], np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rm_var = np.nanvar(rm, axis=1, ddof=1)
+    beta = params[:, 1]
+    tail = systematic_tail_batch(R_exc, F[:, :, 0], mask, tail_q=tail_q)
+
+    out = pd.DataFrame({f'load_{k}': params[:, i+1]
+                        for i, k in enumerate(ROLL_FACTORS)})
+    out['beta']       = beta
+    out['sys_var']    = beta**2 * rm_var
+    out['sys_tail']   = tail['sys_tail']
+    out['tail_alpha'] = tail['alpha']
+    out['neg_alpha']  = -tail['alpha']
+    out['n_tail_obs'] = tail['k_used']
+    return out
+
+
 def compute_rolling_tail_index(ret_series, factors_df,
                                 lookback_years=10, tail_q=0.10):
     """
@@ -501,48 +631,54 @@ def compute_rolling_tail_index(ret_series, factors_df,
     if len(idx) < 36:
         return None
 
-    r   = ret_series.loc[idx] / 100
-    rf  = factors_df.loc[idx, 'RF']  / 100
-    mkt = factors_df.loc[idx, 'Mkt-RF'] / 100
-    smb = factors_df.loc[idx, 'SMB'] / 100
-    hml = factors_df.loc[idx, 'HML'] / 100
-    rmw = factors_df.loc[idx, 'RMW'] / 100
-    cma = factors_df.loc[idx, 'CMA'] / 100
-    mom_s = factors_df.loc[idx, 'MOM'] / 100 \
-            if 'MOM' in factors_df.columns \
-            else pd.Series(0.0, index=idx)
+    f = factors_df.loc[idx].reindex(columns=ROLL_FACTORS + ['RF']).fillna(0)
+    r_exc = (ret_series.loc[idx] - f['RF']).values / 100
+    F = f[ROLL_FACTORS].values / 100
+    chars = rolling_tail_chars_batch(r_exc[None, :], F[None, :, :],
+                                     np.ones((1, len(idx)), bool),
+                                     tail_q=tail_q)
+    row = chars.iloc[0].to_dict()
+    row['n_tail_obs'] = int(row['n_tail_obs'])
+    return row
 
-    r_exc  = r - rf
-    rm_exc = mkt
 
-    # Factor loadings
-    Xf = sm.add_constant(pd.DataFrame({
-        'Mkt-RF': mkt, 'SMB': smb, 'HML': hml,
-        'RMW': rmw, 'CMA': cma, 'MOM': mom_s
-    }))
-    reg  = sm.OLS(r_exc, Xf).fit()
-    beta = float(reg.params['Mkt-RF'])
-    loadings = {f'load_{k}': reg.params[k]
-                for k in ['Mkt-RF','SMB','HML','RMW','CMA','MOM']}
+def _portfolio_matrix(all_factors, deciles, industries):
+    """All decile and industry portfolios as one (month × portfolio) frame."""
+    port_series = {}
+    for fname, ddf in deciles.items():
+        for col in ddf.columns:
+            port_series[f'{fname}_{col}'] = ddf[col]
+    for col in industries.columns:
+        port_series[f'ind_{col}'] = industries[col]
+    return pd.DataFrame(port_series).reindex(all_factors.index)
 
-    sys_var  = float(beta**2 * rm_exc.var())
-    threshold = float(np.percentile(rm_exc.dropna(), tail_q * 100))
-    tail_mask = rm_exc <= threshold
-    sys_tail  = float(r_exc[tail_mask].mean()) if tail_mask.sum() > 3 else np.nan
 
-    alpha, n_used, _ = compute_systematic_tail_index(
-        r_exc, rm_exc, tail_q=tail_q)
-    neg_alpha = -alpha if not np.isnan(alpha) else np.nan
+def _window_rows(P, all_factors, windows, min_obs=36):
+    """
+    Stack every (window, portfolio) pair with >= min_obs valid months into
+    padded arrays for rolling_tail_chars_batch.  windows is a list of
+    (start, end) dates, both inclusive.
+    Returns (keys, R_exc, F, mask) with keys = [(window_no, port_no)].
+    """
+    dates = all_factors.index
+    a = dates.searchsorted([w[0] for w in windows], side='left')
+    b = dates.searchsorted([w[1] for w in windows], side='right')
+    L = int((b - a).max()) if len(windows) else 0
 
-    return {
-        **loadings,
-        'beta':       beta,
-        'sys_var':    sys_var,
-        'sys_tail':   sys_tail,
-        'tail_alpha': alpha,
-        'neg_alpha':  neg_alpha,
-        'n_tail_obs': n_used,
-    }
+    pos  = a[:, None] + np.arange(L)[None, :]               # W × L
+    live = pos < b[:, None]
+    pos  = np.minimum(pos, len(dates) - 1)
+
+    Pv  = P.values / 100
+    rf  = all_factors['RF'].values / 100
+    fac = all_factors.reindex(columns=ROLL_FACTORS).fillna(0).values / 100
+
+    ok = np.isfinite(Pv[pos]) & live[:, :, None]            # W × L × N
+    ww, pp = np.nonzero(ok.sum(axis=1) >= min_obs)
+    mask  = ok[ww, :, pp]
+    R_exc = Pv[pos[ww], pp[:, None]] - rf[pos[ww]]
+    F     = fac[pos[ww]]
+    return list(zip(ww, pp)), R_exc, F, mask
 
 
 def build_rolling_mediation_panel(all_factors, deciles, industries,
@@ -553,68 +689,61 @@ def build_rolling_mediation_panel(all_factors, deciles, industries,
     Rolling panel where tail index is estimated from lookback window
     and forward returns measured in subsequent non-overlapping window.
     Uses longer lookback (10y) to get reliable tail index estimates.
+
+    All portfolio × window characteristics are estimated in a single
+    batched call (rolling_tail_chars_batch).
     """
-    # Normalise portfolios
-    port_series = {}
-    for fname, ddf in deciles.items():
-        for col in ddf.columns:
-            port_series[f'{fname}_{col}'] = ddf[col]
-    for col in industries.columns:
-        port_series[f'ind_{col}'] = industries[col]
+    P = _portfolio_matrix(all_factors, deciles, industries)
+    names = list(P.columns)
 
     print(f"\nBuilding rolling tail index panel "
           f"(lookback={lookback_years}y, non-overlapping)...")
 
-    panels = {fwd: [] for fwd in forward_years_list}
     start  = all_factors.index.min() + pd.DateOffset(years=lookback_years)
     end    = all_factors.index.max() - pd.DateOffset(years=max(forward_years_list))
-
+    times  = []
     t = start
     while t <= end:
-        lookback_start = t - pd.DateOffset(years=lookback_years)
-        f_back = all_factors.loc[lookback_start:t]
+        times.append(t)
+        # Step forward by forward_years (non-overlapping)
+        t += pd.DateOffset(years=min(forward_years_list))
 
-        for port_name, s_raw in port_series.items():
-            s  = s_raw.dropna() / 100
-            rf = all_factors['RF'] / 100
+    windows = [(t - pd.DateOffset(years=lookback_years), t) for t in times]
+    keys, R_exc, F, mask = _window_rows(P, all_factors, windows)
+    chars = rolling_tail_chars_batch(R_exc, F, mask, tail_q=tail_q) \
+            .to_dict('records')
 
-            r_back_idx = s.index.intersection(f_back.index)
-            if len(r_back_idx) < 36:
-                continue
-            r_back = s.loc[r_back_idx] - rf.loc[r_back_idx]
+    # Forward mean excess returns from cumulative sums over time
+    exc = (P.values - all_factors['RF'].values[:, None]) / 100
+    ok  = np.isfinite(exc)
+    c_sum = np.vstack([np.zeros(exc.shape[1]),
+                       np.cumsum(np.where(ok, exc, 0.0), axis=0)])
+    c_cnt = np.vstack([np.zeros(exc.shape[1]), np.cumsum(ok, axis=0)])
+    dates = all_factors.index
+    t_pos = dates.searchsorted(times, side='left')
 
-            chars = compute_rolling_tail_index(
-                s_raw.loc[r_back_idx], f_back.loc[r_back_idx],
-                tail_q=tail_q)
-            if chars is None:
+    panels = {fwd: [] for fwd in forward_years_list}
+    for (w, p), ch in zip(keys, chars):
+        ch['n_tail_obs'] = int(ch['n_tail_obs'])
+        port_name = names[p]
+        factor_group = '_'.join(port_name.split('_')[:-1]) \
+                       if port_name.startswith(tuple(deciles.keys())) \
+                       else 'industry'
+        for fwd_years in forward_years_list:
+            e = dates.searchsorted(
+                times[w] + pd.DateOffset(years=fwd_years), side='right')
+            n = c_cnt[e, p] - c_cnt[t_pos[w], p]
+            if n < 12:
                 continue
-
-            factor_group = '_'.join(port_name.split('_')[:-1]) \
-                           if port_name.startswith(tuple(deciles.keys())) \
-                           else 'industry'
-
-            for fwd_years in forward_years_list:
-                fwd_end    = t + pd.DateOffset(years=fwd_years)
-                f_fwd      = all_factors.loc[t:fwd_end]
-                r_fwd_idx  = s.index.intersection(f_fwd.index)
-                if len(r_fwd_idx) < 12:
-                    continue
-                r_fwd      = s.loc[r_fwd_idx]
-                rf_fwd     = rf.loc[r_fwd_idx]
-                r_exc_fwd  = r_fwd - rf_fwd
-                fwd_return = float(r_exc_fwd.mean() * 12)
-
-                panels[fwd_years].append({
-                    'date':         t,
-                    'portfolio':    port_name,
-                    'factor_group': factor_group,
-                    'fwd_years':    fwd_years,
-                    'fwd_return':   fwd_return,
-                    **chars,
-                })
-
-        # Step forward by forward_years (non-overlapping)
-        t += pd.DateOffset(years=min(forward_years_list))
+            panels[fwd_years].append({
+                'date':         times[w],
+                'portfolio':    port_name,
+                'factor_group': factor_group,
+                'fwd_years':    fwd_years,
+                'fwd_return':   float((c_sum[e, p] - c_sum[t_pos[w], p])
+                                      / n * 12),
+                **ch,
+            })
 
     result = {}
     for fwd in forward_years_list:
@@ -733,6 +862,49 @@ def hill_plot_diagnostic(df):
         print(f"  {col:<20}: r={c:+.4f}  (theory: {theory})  {match}")
 
 
+def hill_k_stability(all_factors, deciles, industries,
+                     tail_qs=(0.05, 0.10, 0.20)):
+    """
+    Sensitivity of the full-sample systematic tail index to the choice of
+    k.  The Hill curve of every portfolio at every threshold comes from
+    one batched call, so the whole k range is examined at once.
+    """
+    P = _portfolio_matrix(all_factors, deciles, industries)
+    _, R_exc, F, mask = _window_rows(
+        P, all_factors, [(all_factors.index.min(), all_factors.index.max())],
+        min_obs=60)
+    if not len(R_exc):
+        return
+
+    print(f"\n── Hill Estimate Stability Across k ─────────────────────────────")
+    print(f"  Median α̂ across {len(R_exc)} portfolios; CV = within-portfolio")
+    print(f"  std/mean of α̂ over k ∈ [5, n/2)")
+    print(f"  {'tail_q':>6} {'n_pos':>6} {'k=5':>7} {'k=10':>7} {'k=20':>7} "
+          f"{'k_frac':>7} {'k_opt':>7} {'CV':>7}")
+    print("  " + "-"*58)
+    for q in tail_qs:
+        res = systematic_tail_batch(R_exc, F[:, :, 0], mask, tail_q=q)
+        A, n = res['alphas'], res['n_pos']
+        k_opt = optimal_k_batch(A, n)
+        rows  = np.arange(len(A))
+        pick  = lambda k: np.where((k >= 1) & (k <= A.shape[1]),
+                                   A[rows, np.clip(k, 1, A.shape[1]) - 1],
+                                   np.nan)
+        kk = np.arange(1, A.shape[1] + 1)
+        in_range = (kk[None, :] >= 5) & (kk[None, :] < n[:, None] // 2)
+        Ak = np.where(in_range, A, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cv = np.nanstd(Ak, axis=1) / np.nanmean(Ak, axis=1)
+        med = lambda x: np.nanmedian(x) if np.isfinite(x).any() else np.nan
+        print(f"  {q:>6.2f} {np.median(n):>6.0f} "
+              f"{med(pick(np.full(len(A), 5))):>7.3f} "
+              f"{med(pick(np.full(len(A), 10))):>7.3f} "
+              f"{med(pick(np.full(len(A), 20))):>7.3f} "
+              f"{med(res['alpha']):>7.3f} "
+              f"{med(pick(np.minimum(k_opt, n - 1))):>7.3f} "
+              f"{med(cv):>7.3f}")
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # 7.  PLOTS
 # ══════════════════════════════════════════════════════════════════════════════
@@ -857,6 +1029,7 @@ def main():
 
     # Diagnostic
     hill_plot_diagnostic(df)
+    hill_k_stability(all_factors, deciles, industries)
 
     # Retroactive regressions — all portfolios
     regs_all, sub_all = run_retroactive(df, 'All portfolios')
@@ -28,7 +28,7 @@ Test structure:
   2. Joint: both together — do they rescue each other?
   3. vs FF5: how much factor R² do they absorb?
   4. Implied utility: what γ does the coefficient ratio imply?
-  5. At multiple tail thresholds (5%, 10%, 15%) for robustness
+  5. Across a sweep of tail thresholds (3%-30%) for robustness
   6. Industry portfolios as unbiased test
 
 Usage:
@@ -246,31 +246,84 @@ def compute_risk_measures(ret_series, factors_df,
     return result
 
 
-def build_cross_section(all_factors, deciles, industries):
-    print("\nComputing risk measures...")
-    rows = []
+def _portfolio_panel(all_factors, deciles, industries):
+    """All decile and industry portfolios as one (months x portfolios) frame."""
+    cols, meta = {}, []
     for fname, ddf in deciles.items():
         for col in ddf.columns:
-            s = ddf[col].dropna()
-            idx = s.index.intersection(all_factors.index)
-            row = compute_risk_measures(s.loc[idx], all_factors.loc[idx])
-            if row:
-                row['portfolio_type'] = 'decile'
-                row['factor_group']   = fname
-                rows.append(row)
+            key = f'{fname}:{col}'
+            cols[key] = ddf[col]
+            meta.append((key, 'decile', fname))
     for col in industries.columns:
-        s = industries[col].dropna()
-        idx = s.index.intersection(all_factors.index)
-        row = compute_risk_measures(s.loc[idx], all_factors.loc[idx])
+        key = f'industry:{col}'
+        cols[key] = industries[col]
+        meta.append((key, 'industry', 'industry'))
+    return pd.DataFrame(cols).reindex(all_factors.index), meta
+
+
+def build_cross_section(all_factors, deciles, industries):
+    print("\nComputing risk measures...")
+    R, meta = _portfolio_panel(all_factors, deciles, industries)
+    rows = []
+    for key, ptype, group in meta:
+        s = R[key].dropna()
+        row = compute_risk_measures(s, all_factors.loc[s.index])
         if row:
-            row['portfolio_type'] = 'industry'
-            row['factor_group']   = 'industry'
+            row['portfolio']      = key
+            row['portfolio_type'] = ptype
+            row['factor_group']   = group
             rows.append(row)
     df = pd.DataFrame(rows)
     print(f"  {len(df)} portfolios built")
     return df
 
 
+TAIL_GRID = np.round(np.arange(0.03, 0.3001, 0.01), 2)   # tail quantile sweep
+MIN_TAIL  = 5                                             # tail months needed
+
+
+def tail_sweep(all_factors, deciles, industries, qs=TAIL_GRID,
+               min_tail=MIN_TAIL):
+    """
+    sys_tail = E[R_i | R_market <= q-th pct] for every portfolio and every
+    q in qs, without rebuilding the other risk measures.
+
+    Portfolios sharing the same months form one group.  Per group the
+    market returns are sorted once and the portfolio returns are
+    prefix-summed in that order, so each q is a percentile, a binary
+    search and one row lookup.  Returns a DataFrame indexed by portfolio
+    key (as in build_cross_section), one column per q; NaN where the
+    tail has fewer than min_tail months.
+    """
+    qs = np.asarray(qs, float)
+    R, _ = _portfolio_panel(all_factors, deciles, industries)
+    rf = all_factors['RF'].values / 100
+    rm = all_factors['Mkt-RF'].values / 100
+    V  = R.notna().values
+
+    groups = {}
+    for j in range(R.shape[1]):
+        groups.setdefault(V[:, j].tobytes(), []).append(j)
+
+    out = np.full((R.shape[1], len(qs)), np.nan)
+    for cols in groups.values():
+        t = V[:, cols[0]]
+        if t.sum() < 60:
+            continue
+        r_exc  = R.values[t][:, cols] / 100 - rf[t, None]
+        order  = np.argsort(rm[t], kind='stable')
+        rm_s   = rm[t][order]
+        C      = np.zeros((len(order) + 1, len(cols)))
+        np.cumsum(r_exc[order], axis=0, out=C[1:])
+
+        thr = np.percentile(rm[t], qs * 100)
+        k   = np.searchsorted(rm_s, thr, side='right')
+        tail = C[k] / np.maximum(k, 1)[:, None]
+        tail[k < min_tail] = np.nan
+        out[cols] = tail.T
+    return pd.DataFrame(out, index=R.columns, columns=qs)
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # 3.  IMPLIED UTILITY FUNCTION
 # ══════════════════════════════════════════════════════════════════════════════
@@ -486,44 +539,81 @@ def run_regressions(df, label='All portfolios',
     return regs, sub
 
 
-def robustness_across_thresholds(df, label='All portfolios'):
-    """Run core test at 5%, 10%, 15% tail thresholds."""
+def _batched_ols(y, X):
+    """
+    OLS of y (n,) on a stack of designs X (Q, n, k), each with its own
+    constant column.  Returns coefficients and t-stats (Q, k), R² (Q,).
+    """
+    n, k = X.shape[1], X.shape[2]
+    XtX_inv = np.linalg.inv(np.einsum('qni,qnj->qij', X, X))
+    coef = np.einsum('qij,qnj,n->qi', XtX_inv, X, y)
+    ssr  = ((y - np.einsum('qni,qi->qn', X, coef))**2).sum(axis=1)
+    se   = np.sqrt(ssr[:, None] / (n - k) * np.diagonal(XtX_inv, axis1=1, axis2=2))
+    r2   = 1 - ssr / ((y - y.mean())**2).sum()
+    return coef, coef / se, r2
+
+
+def robustness_across_thresholds(df, label='All portfolios', sweep=None):
+    """
+    Run the core test (sys_var + sys_tail) across tail thresholds.
+
+    sweep: optional tail_sweep() output for a continuous grid of
+    thresholds; otherwise the 5%, 10%, 15% columns of df.  All thresholds
+    use the same portfolios (those with a tail mean at every q), and the
+    regressions for every threshold are solved as one batch.
+    Returns a DataFrame indexed by q.
+    """
     print(f"\n── Robustness Across Tail Thresholds: {label} ───────────────────")
     print(f"  {'Threshold':>10}  {'sys_var t':>10}  {'sys_tail t':>11}  "
           f"{'Joint R²':>9}  {'FF5 R²':>7}  {'Rescue?':>8}")
     print("  " + "-"*62)
 
     sub_req = (['mean_excess','beta','sys_var','sigma','var_5'] +
-               FACTOR_VARS +
-               [f'sys_tail_q{q}' for q in [5,10,15]])
+               FACTOR_VARS)
     sub = df.dropna(subset=sub_req)
-    y   = sub['mean_excess']
-    ra  = sm.OLS(y, sm.add_constant(sub[FACTOR_VARS])).fit()
-
-    for q_label, q_val in [('q5',0.05),('q10',0.10),('q15',0.15)]:
-        tvar = f'sys_tail_{q_label}'
-        if tvar not in sub.columns:
-            continue
-        sub2 = sub.dropna(subset=[tvar])
-        y2   = sub2['mean_excess']
-
-        rc   = sm.OLS(y2, sm.add_constant(sub2[['sys_var']])).fit()
-        rd   = sm.OLS(y2, sm.add_constant(sub2[[tvar]])).fit()
-        re   = sm.OLS(y2, sm.add_constant(sub2[['sys_var',tvar]])).fit()
-        ra2  = sm.OLS(y2, sm.add_constant(sub2[FACTOR_VARS])).fit()
-
-        t_var  = re.tvalues.get('sys_var', np.nan)
-        t_tail = re.tvalues.get(tvar, np.nan)
-
-        # "Rescue" = both become more significant jointly than alone
-        t_var_alone  = rc.tvalues.get('sys_var', np.nan)
-        t_tail_alone = rd.tvalues.get(tvar, np.nan)
-        rescued = (abs(t_var) > abs(t_var_alone) and
-                   abs(t_tail) > abs(t_tail_alone))
-        rescue_str = 'YES ✓' if rescued else 'no'
-
-        print(f"  {q_label:>10}  {t_var:>+10.2f}  {t_tail:>+11.2f}  "
-              f"{re.rsquared:>9.4f}  {ra2.rsquared:>7.4f}  {rescue_str:>8}")
+    if sweep is None:
+        qs   = np.array([0.05, 0.10, 0.15])
+        tail = sub[[f'sys_tail_q{int(q*100)}' for q in qs]].values
+    else:
+        qs   = np.asarray(sweep.columns, float)
+        tail = sweep.reindex(sub['portfolio']).values
+    keep = np.isfinite(tail).all(axis=1)
+    sub, tail = sub[keep], tail[keep]
+    y   = sub['mean_excess'].values
+    n   = len(y)
+    if n <= 3:
+        print("  (too few portfolios)")
+        return pd.DataFrame()
+
+    ra  = sm.OLS(sub['mean_excess'], sm.add_constant(sub[FACTOR_VARS])).fit()
+    rc  = sm.OLS(sub['mean_excess'], sm.add_constant(sub[['sys_var']])).fit()
+    t_var_alone = rc.tvalues.get('sys_var', np.nan)
+
+    ones = np.ones((len(qs), n))
+    T    = tail.T                                             # (Q, n)
+    sv   = np.broadcast_to(sub['sys_var'].values, T.shape)
+    _, t_d, _    = _batched_ols(y, np.stack([ones, T], axis=2))
+    _, t_e, r2_e = _batched_ols(y, np.stack([ones, sv, T], axis=2))
+
+    t_var, t_tail = t_e[:, 1], t_e[:, 2]
+    # "Rescue" = both become more significant jointly than alone
+    rescued = (np.abs(t_var) > abs(t_var_alone)) & (np.abs(t_tail) > np.abs(t_d[:, 1]))
+
+    for i, q in enumerate(qs):
+        q_label = f'q{q*100:g}'
+        rescue_str = 'YES ✓' if rescued[i] else 'no'
+        print(f"  {q_label:>10}  {t_var[i]:>+10.2f}  {t_tail[i]:>+11.2f}  "
+              f"{r2_e[i]:>9.4f}  {ra.rsquared:>7.4f}  {rescue_str:>8}")
+    print(f"  (N={n} portfolios; rescued at {rescued.sum()} of {len(qs)} thresholds)")
+
+    return pd.DataFrame({
+        't_var':        t_var,
+        't_tail':       t_tail,
+        't_tail_alone': t_d[:, 1],
+        'r2_joint':     r2_e,
+        'r2_ff5':       ra.rsquared,
+        'rescued':      rescued,
+    }, index=pd.Index(qs, name='q'))
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -676,10 +766,11 @@ def main():
         regs_ind, _ = run_regressions(
             ind_df, 'Industry portfolios only', 'q5')
 
-    # Robustness across thresholds
-    robustness_across_thresholds(df, 'All portfolios')
+    # Robustness across a continuous grid of tail thresholds
+    sweep = tail_sweep(all_factors, deciles, industries)
+    robustness_across_thresholds(df, 'All portfolios', sweep)
     if len(ind_df) > 20:
-        robustness_across_thresholds(ind_df, 'Industry only')
+        robustness_across_thresholds(ind_df, 'Industry only', sweep)
 
     # Plots
     print("\nGenerating plots...")
@@ -46,9 +46,9 @@ except ImportError:
 import pandas as pd
 import numpy as np
 from scipy.optimize import minimize_scalar, minimize
-from scipy import stats
 import statsmodels.api as sm
 import requests, zipfile, io, os
+import multiprocessing as mp
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -131,10 +131,45 @@ def fetch_all_data():
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-# 2.  SDF ESTIMATION  (power utility)
+# 2.  DENSE PANEL
 # ══════════════════════════════════════════════════════════════════════════════
 
-def estimate_sdf(factors_window, deciles_window, gamma_grid=(2, 5, 10)):
+def build_panel(factors, mom_factor, deciles):
+    """
+    Align factors and every decile portfolio into dense arrays once, so
+    the walk-forward loop only slices rows.
+
+    Returns dict:
+      dates:  DatetimeIndex of the combined factor table
+      rf, mkt: (T,) risk-free and market excess return, decimal
+      R:      (T, P) decile returns, decimal, NaN where missing
+      names:  [(factor, decile)] for the P columns
+      start, end: common sample bounds across all inputs
+    """
+    all_factors = pd.concat([factors, mom_factor], axis=1)
+    dates = all_factors.index
+    names, cols = [], []
+    for fname, ddf in deciles.items():
+        sub = ddf.reindex(dates) / 100
+        for i, col in enumerate(ddf.columns):   # D1 .. D10
+            names.append((fname, i + 1))
+            cols.append(sub[col].values)
+    return {
+        'dates': dates,
+        'rf':    all_factors['RF'].values / 100,
+        'mkt':   all_factors['Mkt-RF'].values / 100,
+        'R':     np.column_stack(cols),
+        'names': names,
+        'start': max(df.index.min() for df in [all_factors] + list(deciles.values())),
+        'end':   min(df.index.max() for df in [all_factors] + list(deciles.values())),
+    }
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# 3.  SDF ESTIMATION  (power utility)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def estimate_sdf(mkt, rf, R, gamma_grid=(2, 5, 10)):
     """
     Estimate the power-utility SDF:  M_t = (1 + R_m,t)^{-γ}
     where R_m is the market gross return.
@@ -142,32 +177,27 @@ def estimate_sdf(factors_window, deciles_window, gamma_grid=(2, 5, 10)):
     We choose γ by minimising the average absolute pricing error
     E[M·R_i] - 1 across all available decile portfolios.
 
+    mkt, rf: (T,) window series (decimal); R: (T, P) decile returns.
+    The gross returns of the portfolios with more than 12 months are
+    stacked once (zero where missing), so the pricing error for any γ
+    is a single matrix-vector product.
+
     Returns: γ_hat, M series, pricing errors by γ
     """
-    rf    = factors_window['RF'] / 100
-    mkt   = factors_window['Mkt-RF'] / 100
-    R_mkt = mkt + rf           # gross excess → gross return (approx)
-
-    # Collect all decile return series aligned to window
-    all_rets = []
-    for name, df in deciles_window.items():
-        for col in df.columns:
-            s = df[col].dropna() / 100
-            idx = s.index.intersection(R_mkt.index)
-            if len(idx) > 12:
-                all_rets.append(s.loc[idx])
+    R_mkt  = mkt + rf           # gross excess → gross return (approx)
+    log_gm = np.log1p(R_mkt)
+    V = np.isfinite(R) & np.isfinite(log_gm)[:, None] & np.isfinite(rf)[:, None]
+    cnt = V.sum(axis=0)
+    keep = cnt > 12
+    G = np.where(V, 1 + R + rf[:, None], 0.0)[:, keep]
+    cnt = cnt[keep]
+    log_gm = np.nan_to_num(log_gm)
 
     def pricing_error(gamma):
-        M = (1 + R_mkt) ** (-gamma)
-        errors = []
-        for r in all_rets:
-            idx = M.index.intersection(r.index)
-            if len(idx) < 12:
-                continue
-            gross_r = 1 + r.loc[idx] + rf.loc[idx]
-            err = np.abs(np.mean(M.loc[idx] * gross_r) - 1)
-            errors.append(err)
-        return np.mean(errors) if errors else 1e6
+        if not keep.any():
+            return 1e6
+        M = np.exp(-gamma * log_gm)
+        return np.mean(np.abs(M @ G / cnt - 1))
 
     # Grid search then refine
     errors = {g: pricing_error(g) for g in gamma_grid}
@@ -184,46 +214,52 @@ def estimate_sdf(factors_window, deciles_window, gamma_grid=(2, 5, 10)):
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-# 3.  PREMIUM PREDICTION
+# 4.  PREMIUM PREDICTION
 # ══════════════════════════════════════════════════════════════════════════════
 
-def compute_decile_moments(ret_series, mkt_series, rf_series):
+def _masked_mean(X, V, n):
+    return np.where(V, X, 0.0).sum(axis=0) / n
+
+def compute_decile_moments(r, rm, rf, V):
     """
-    Compute return distribution moments and risk measures for a decile portfolio.
-    Returns dict of: mean, std, skew, kurt, downside_beta, coskewness, sdf_premium
+    Return distribution moments and risk measures for every decile
+    portfolio at once.  r: (T, P) returns, rm/rf: (T,), all decimal;
+    V: (T, P) months each portfolio is used.
+    Returns dict of (P,) arrays: mean, std, skew, kurt, downside_beta,
+    coskewness.
     """
-    idx = ret_series.index.intersection(mkt_series.index)
-    r   = ret_series.loc[idx] / 100
-    rm  = mkt_series.loc[idx] / 100
-    rf  = rf_series.loc[idx]  / 100
-
-    r_excess  = r  - rf
-    rm_excess = rm - rf
+    n = V.sum(axis=0)
+    r_excess  = r - rf[:, None]
+    rm_excess = np.broadcast_to((rm - rf)[:, None], r.shape)
 
     # Standard moments
-    mu    = r_excess.mean()
-    sigma = r_excess.std()
-    skew  = stats.skew(r_excess.dropna())
-    kurt  = stats.kurtosis(r_excess.dropna())
+    mu   = _masked_mean(r_excess, V, n)
+    dr   = np.where(V, r_excess - mu, 0.0)
+    m2   = (dr**2).sum(axis=0) / n
+    sigma = np.sqrt(m2 * n / (n - 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        skew = (dr**3).sum(axis=0) / n / m2**1.5          # stats.skew
+        kurt = (dr**4).sum(axis=0) / n / m2**2 - 3.0      # stats.kurtosis
 
     # Standard beta
-    cov_matrix = np.cov(r_excess, rm_excess)
-    beta = cov_matrix[0,1] / cov_matrix[1,1] if cov_matrix[1,1] > 0 else np.nan
+    mu_m = _masked_mean(rm_excess, V, n)
+    drm  = np.where(V, rm_excess - mu_m, 0.0)
+    var_m = (drm**2).sum(axis=0) / (n - 1)
+    cov   = (dr * drm).sum(axis=0) / (n - 1)
+    beta  = np.where(var_m > 0, cov / np.where(var_m > 0, var_m, 1), np.nan)
 
     # Downside beta: beta estimated on months where market is below its mean
-    below_mean = rm_excess < rm_excess.mean()
-    r_down  = r_excess[below_mean]
-    rm_down = rm_excess[below_mean]
-    if len(r_down) > 10:
-        cov_down = np.cov(r_down, rm_down)
-        down_beta = cov_down[0,1] / cov_down[1,1] if cov_down[1,1] > 0 else np.nan
-    else:
-        down_beta = np.nan
+    Vd = V & (rm_excess < mu_m)
+    nd = Vd.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dr_d  = np.where(Vd, r_excess - _masked_mean(r_excess, Vd, nd), 0.0)
+        drm_d = np.where(Vd, rm_excess - _masked_mean(rm_excess, Vd, nd), 0.0)
+        var_d = (drm_d**2).sum(axis=0) / (nd - 1)
+        down_beta = (dr_d * drm_d).sum(axis=0) / (nd - 1) / var_d
+    down_beta = np.where((nd > 10) & (var_d > 0), down_beta, np.nan)
 
     # Coskewness: E[(r-μ)(rm-μm)²] / σm²
-    demeaned_r  = r_excess  - r_excess.mean()
-    demeaned_rm = rm_excess - rm_excess.mean()
-    coskew = np.mean(demeaned_r * demeaned_rm**2) / (rm_excess.std()**2 + 1e-10)
+    coskew = (dr * drm**2).sum(axis=0) / n / (var_m + 1e-10)
 
     return {
         'mean_excess':  mu,
@@ -236,137 +272,115 @@ def compute_decile_moments(ret_series, mkt_series, rf_series):
     }
 
 
-def predict_premiums(M, factors_window, deciles_window):
+def predict_premiums(M, mkt, rf, R, min_obs=24):
     """
-    For each factor's decile portfolios, compute:
+    For each decile portfolio (columns of R), compute:
       1. The SDF-implied premium using E[M·R] = 1  →  E[R] = 1/E[M] - Cov(M,R)/E[M]
       2. Distribution moments and higher-moment risk measures
 
-    Returns DataFrame: one row per (factor, decile), columns = moments + predicted_premium
+    Returns (ok, dict of (P,) arrays): ok marks portfolios with at least
+    min_obs months in the window; the arrays hold moments, sdf_predicted
+    and realised_mean.
     """
-    rf    = factors_window['RF'] / 100
-    mkt   = factors_window['Mkt-RF'] / 100
-
-    rows = []
-    for fname, ddf in deciles_window.items():
-        for i, col in enumerate(ddf.columns):  # D1 .. D10
-            s = ddf[col].dropna() / 100
-            idx = s.index.intersection(M.index).intersection(rf.index)
-            if len(idx) < 24:
-                continue
-
-            r      = s.loc[idx]
-            M_     = M.loc[idx]
-            rf_    = rf.loc[idx]
-            gross_r = 1 + r + rf_   # gross return
-
-            # SDF pricing equation: predicted premium = 1/E[M] - 1/rf - Cov(M,R)/E[M]
-            EM     = M_.mean()
-            cov_MR = np.cov(M_, gross_r)[0,1]
-            sdf_predicted_premium = (-cov_MR / EM) * 12  # annualised
-
-            # Moments
-            moments = compute_decile_moments(
-                ddf[col].loc[idx] * 100,   # back to % for function
-                (mkt.loc[idx] * 100),
-                (rf.loc[idx] * 100)
-            )
-
-            rows.append({
-                'factor':            fname,
-                'decile':            i + 1,
-                'sdf_predicted':     sdf_predicted_premium,
-                'realised_mean':     (r - rf_).mean() * 12,   # annualised
-                **moments
-            })
-
-    return pd.DataFrame(rows)
+    V = np.isfinite(R) & np.isfinite(M)[:, None] & np.isfinite(rf)[:, None]
+    n = V.sum(axis=0)
+    ok = n >= min_obs
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gross_r = 1 + R + rf[:, None]   # gross return
+
+        # SDF pricing equation: predicted premium = -Cov(M,R)/E[M]
+        Mb = np.broadcast_to(M[:, None], R.shape)
+        EM = _masked_mean(Mb, V, n)
+        cov_MR = (np.where(V, Mb - EM, 0.0)
+                  * np.where(V, gross_r - _masked_mean(gross_r, V, n), 0.0)
+                  ).sum(axis=0) / (n - 1)
+        out = compute_decile_moments(R, mkt, rf, V)
+        out['sdf_predicted'] = (-cov_MR / EM) * 12  # annualised
+        out['realised_mean'] = out['mean_excess'] * 12
+    return ok, out
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-# 4.  ROLLING WINDOW BACKTEST
+# 5.  ROLLING WINDOW BACKTEST
 # ══════════════════════════════════════════════════════════════════════════════
 
 def run_backtest(factors, mom_factor, deciles,
-                 collection_years=5, investment_years=1):
+                 collection_years=5, investment_years=1, panel=None):
     """
     Walk-forward backtest:
       - Fit SDF and predict premiums in collection window
       - Evaluate predictions in subsequent investment window
       - Repeat, stepping forward by investment_years
+    Windows are inclusive date ranges, so the collection-end month is
+    also the first investment month.  panel: optional build_panel()
+    output to reuse across runs.
     """
-    # Align everything
-    all_factors = pd.concat([factors, mom_factor], axis=1)
-    common_start = max(df.index.min() for df in [all_factors] + list(deciles.values()))
-    common_end   = min(df.index.max() for df in [all_factors] + list(deciles.values()))
+    P = panel if panel is not None else build_panel(factors, mom_factor, deciles)
+    dates, rf, mkt, R = P['dates'], P['rf'], P['mkt'], P['R']
+    factor_names = np.array([f for f, _ in P['names']])
+    decile_nums  = np.array([d for _, d in P['names']])
 
     results = []
-    start = common_start
+    start = P['start']
 
     while True:
         coll_end  = start + pd.DateOffset(years=collection_years)
         inv_end   = coll_end + pd.DateOffset(years=investment_years)
 
-        if inv_end > common_end:
+        if inv_end > P['end']:
             break
 
-        # Slice windows
-        f_coll  = all_factors.loc[start:coll_end]
-        f_inv   = all_factors.loc[coll_end:inv_end]
-        d_coll  = {k: v.loc[start:coll_end]  for k,v in deciles.items()}
-        d_inv   = {k: v.loc[coll_end:inv_end] for k,v in deciles.items()}
+        # Slice windows (row ranges, both ends inclusive)
+        c0, c1 = dates.searchsorted(start), dates.searchsorted(coll_end, 'right')
+        i0, i1 = dates.searchsorted(coll_end), dates.searchsorted(inv_end, 'right')
 
-        if len(f_coll) < collection_years * 10:
+        if c1 - c0 < collection_years * 10:
             start += pd.DateOffset(years=investment_years)
             continue
 
         # Estimate SDF in collection window
-        gamma, M_coll, gamma_errors = estimate_sdf(f_coll, d_coll)
+        gamma, M_coll, gamma_errors = estimate_sdf(mkt[c0:c1], rf[c0:c1], R[c0:c1])
 
         # Predict premiums from collection window
-        preds = predict_premiums(M_coll, f_coll, d_coll)
-        if preds.empty:
+        ok, pred = predict_premiums(M_coll, mkt[c0:c1], rf[c0:c1], R[c0:c1])
+
+        # Compute realised premiums in investment window
+        R_inv = R[i0:i1] - rf[i0:i1, None]
+        V_inv = np.isfinite(R_inv)
+        n_inv = V_inv.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            realised = _masked_mean(R_inv, V_inv, n_inv) * 12
+        use = np.flatnonzero(ok & (n_inv >= 3))
+        if len(use) == 0:
             start += pd.DateOffset(years=investment_years)
             continue
 
-        # Compute realised premiums in investment window
-        rf_inv = all_factors.loc[coll_end:inv_end, 'RF'] / 100
-        for _, row in preds.iterrows():
-            fname  = row['factor']
-            decile = int(row['decile'])
-            col    = f'D{decile}'
-            if fname not in d_inv or col not in d_inv[fname].columns:
-                continue
-            s   = d_inv[fname][col].dropna() / 100
-            idx = s.index.intersection(rf_inv.index)
-            if len(idx) < 3:
-                continue
-            realised = (s.loc[idx] - rf_inv.loc[idx]).mean() * 12
-
-            results.append({
-                'window_start':      start,
-                'window_coll_end':   coll_end,
-                'window_inv_end':    inv_end,
-                'factor':            fname,
-                'decile':            decile,
-                'gamma':             gamma,
-                'sdf_predicted':     row['sdf_predicted'],
-                'beta':              row['beta'],
-                'down_beta':         row['down_beta'],
-                'coskewness':        row['coskewness'],
-                'skewness':          row['skewness'],
-                'kurtosis':          row['kurtosis'],
-                'realised':          realised,
-                'collection_years':  collection_years,
-            })
+        results.append(pd.DataFrame({
+            'window_start':      start,
+            'window_coll_end':   coll_end,
+            'window_inv_end':    inv_end,
+            'factor':            factor_names[use],
+            'decile':            decile_nums[use],
+            'gamma':             gamma,
+            'sdf_predicted':     pred['sdf_predicted'][use],
+            'beta':              pred['beta'][use],
+            'down_beta':         pred['down_beta'][use],
+            'coskewness':        pred['coskewness'][use],
+            'skewness':          pred['skewness'][use],
+            'kurtosis':          pred['kurtosis'][use],
+            'realised':          realised[use],
+            'collection_years':  collection_years,
+        }))
 
         start += pd.DateOffset(years=investment_years)
 
-    return pd.DataFrame(results)
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results, ignore_index=True)
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-# 5.  EVALUATION
+# 6.  EVALUATION
 # ══════════════════════════════════════════════════════════════════════════════
 
 def evaluate(results_df):
@@ -446,33 +460,64 @@ def evaluate(results_df):
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-# 6.  ROBUSTNESS: MULTIPLE WINDOW LENGTHS
+# 7.  ROBUSTNESS: MULTIPLE WINDOW LENGTHS
 # ══════════════════════════════════════════════════════════════════════════════
 
-def robustness_check(factors, mom_factor, deciles):
+ROBUST_COLL_YEARS = (3, 5, 10)
+ROBUST_INV_YEARS  = (1, 3)
+N_WORKERS         = None    # process pool size (None = all cores, 1 = serial)
+
+_PANEL = {}
+
+def _init_worker(panel):
+    _PANEL.update(panel)
+
+def _run_config(cfg):
+    coll_yrs, inv_yrs = cfg
+    df = run_backtest(None, None, None, collection_years=coll_yrs,
+                      investment_years=inv_yrs, panel=_PANEL)
+    return coll_yrs, inv_yrs, df
+
+def robustness_check(factors, mom_factor, deciles,
+                     coll_years=ROBUST_COLL_YEARS, inv_years=ROBUST_INV_YEARS,
+                     n_workers=N_WORKERS):
+    """
+    Re-run the backtest over every (collection, investment) window pair.
+    The panel is built once and handed to each worker; configurations
+    are independent and run in a process pool.
+    """
     print("\n── Robustness: Multiple Window Lengths ──────────────────────────")
-    print(f"  {'Coll yrs':>9}  {'SDF corr':>9}  {'Beta corr':>9}  {'N obs':>7}")
-    print("  " + "-" * 42)
+    print(f"  {'Coll yrs':>9}  {'Inv yrs':>8}  {'SDF corr':>9}  {'Beta corr':>9}  {'N obs':>7}")
+    print("  " + "-" * 52)
+
+    panel = build_panel(factors, mom_factor, deciles)
+    cfgs  = [(c, i) for c in coll_years for i in inv_years]
+    if n_workers == 1:
+        _init_worker(panel)
+        runs = list(map(_run_config, cfgs))
+    else:
+        with mp.Pool(min(n_workers or os.cpu_count(), len(cfgs)),
+                     initializer=_init_worker, initargs=(panel,)) as pool:
+            runs = pool.map(_run_config, cfgs)
 
     summary = []
-    for coll_yrs in [3, 5, 10]:
-        df = run_backtest(factors, mom_factor, deciles,
-                          collection_years=coll_yrs, investment_years=1)
+    for coll_yrs, inv_yrs, df in runs:
         if df.empty:
-            print(f"  {coll_yrs:>9}  (insufficient data)")
+            print(f"  {coll_yrs:>9}  {inv_yrs:>8}  (insufficient data)")
             continue
         sub = df.dropna(subset=['sdf_predicted','realised'])
         c_sdf  = sub['sdf_predicted'].corr(sub['realised'])
         c_beta = sub['beta'].corr(sub['realised'])
-        print(f"  {coll_yrs:>9}  {c_sdf:>+9.4f}  {c_beta:>+9.4f}  {len(sub):>7d}")
-        summary.append({'coll_yrs': coll_yrs, 'sdf_corr': c_sdf,
-                        'beta_corr': c_beta, 'n': len(sub), 'results': df})
+        print(f"  {coll_yrs:>9}  {inv_yrs:>8}  {c_sdf:>+9.4f}  {c_beta:>+9.4f}  {len(sub):>7d}")
+        summary.append({'coll_yrs': coll_yrs, 'inv_yrs': inv_yrs,
+                        'sdf_corr': c_sdf, 'beta_corr': c_beta,
+                        'n': len(sub), 'results': df})
 
     return summary
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-# 7.  PLOTS
+# 8.  PLOTS
 # ══════════════════════════════════════════════════════════════════════════════
 
 def make_plots(results_df, outpath='unified_beta_results.png'):
@@ -564,7 +609,7 @@ def make_plots(results_df, outpath='unified_beta_results.png'):
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-# 8.  MAIN
+# 9.  MAIN
 # ══════════════════════════════════════════════════════════════════════════════
 
 def main():
@@ -217,19 +217,12 @@ def poly_systematic(r_exc, rm_exc, degree=3):
     return coeffs, r_sys, beta_fn, metrics
 
 
-def compute_portfolio_chars(ret_series, factors_df, gamma,
-                            tail_q=(0.05, 0.10)):
+def _portfolio_base(ret_series, factors_df, tail_q=(0.05, 0.10)):
     """
-    For a single portfolio:
-      1. Estimate beta via OLS on FF5+MOM
-      2. Estimate conditional beta β(x) per market-return quintile
-      3. Construct R_sys_t = β(bin_t)*R_market_t month-by-month
-      3. Compute:
-         a. E[U*(R_sys; gamma)]  — the utility equilibrium measure
-         b. Moments of R_sys     — systematic variance, skew, kurt
-         c. Tail measures of R_sys — systematic tail VaR, tail beta
-         d. Utility residual     — E[U*(R_sys)] - U*(rf)
-            (negative = asset is utility-costly = should earn premium)
+    γ-independent stage of compute_portfolio_chars: loadings, polynomial
+    systematic component, moments and tail measures.
+    Returns (chars, r_sys_gross, {q_label: tail r_sys_gross}, rf_mean) as
+    plain arrays for the utility stage, or None.
     """
     idx = ret_series.index.intersection(factors_df.index)
     ret_series = ret_series.loc[idx].dropna()
@@ -271,18 +264,9 @@ def compute_portfolio_chars(ret_series, factors_df, gamma,
     beta_asym_cond = poly_metrics['beta_asym_poly']
     cond_beta_dict = poly_metrics   # all poly metrics stored
 
-    # ── Utility measures on systematic component ──────────────────────────────
     # Add back rf to get gross return for utility calculation
     r_sys_gross = r_sys + rf    # systematic gross return
 
-    eu_sys   = expected_utility(r_sys_gross, gamma)
-    u_rf     = utility_of_rf(rf_mean, gamma)
-    # Utility residual: negative means asset is costly in utility terms
-    # → should predict positive excess return
-    util_residual = eu_sys - u_rf  if not np.isnan(eu_sys) else np.nan
-    # Negated: higher value = more utility-costly = higher predicted premium
-    util_cost = -util_residual     if not np.isnan(util_residual) else np.nan
-
     # ── Moments of systematic component ──────────────────────────────────────
     sys_sigma = float(r_sys.std())
     sys_skew  = float(stats.skew(r_sys.dropna()))
@@ -293,6 +277,7 @@ def compute_portfolio_chars(ret_series, factors_df, gamma,
 
     # ── Tail measures of systematic component ────────────────────────────────
     tail_measures = {}
+    tail_gross    = {}
     for q in tail_q:
         q_label = f'q{int(q*100)}'
         mkt_threshold = float(np.percentile(rm_exc.dropna(), q * 100))
@@ -303,7 +288,7 @@ def compute_portfolio_chars(ret_series, factors_df, gamma,
         if len(r_sys_tail) < 5:
             tail_measures[f'sys_mvar_{q_label}']      = np.nan
             tail_measures[f'sys_tail_beta_{q_label}'] = np.nan
-            tail_measures[f'util_tail_{q_label}']     = np.nan
+            tail_gross[q_label] = None
             continue
 
         # Systematic marginal VaR: mean of R_sys in market tail
@@ -316,20 +301,15 @@ def compute_portfolio_chars(ret_series, factors_df, gamma,
         else:
             sys_tail_beta = np.nan
 
-        # Utility of systematic component in tail months
-        r_sys_tail_gross = r_sys_tail + rf.loc[r_sys_tail.index]
-        util_tail = expected_utility(r_sys_tail_gross, gamma)
-
         tail_measures[f'sys_mvar_{q_label}']      = sys_mvar
         tail_measures[f'sys_tail_beta_{q_label}'] = sys_tail_beta
-        tail_measures[f'util_tail_{q_label}']     = float(util_tail) \
-            if not np.isnan(util_tail) else np.nan
+        tail_gross[q_label] = (r_sys_tail + rf.loc[r_sys_tail.index]).values
 
     # ── Standalone moments for comparison ────────────────────────────────────
     standalone_sigma = float(r_exc.std())
     standalone_var5  = float(np.percentile(r_exc.dropna(), 5))
 
-    return {
+    chars = {
         'mean_excess':     float(r_exc.mean() * 12),
         'n_obs':           len(idx),
         'beta_mkt':        beta_mkt,
@@ -339,11 +319,6 @@ def compute_portfolio_chars(ret_series, factors_df, gamma,
                     'beta_at_tail','beta_at_boom',
                     'beta_asym_poly','nonlin_r2_gain']},
         **loadings,
-        # Utility measures (systematic)
-        'eu_systematic':   eu_sys,
-        'u_rf':            u_rf,
-        'util_residual':   util_residual,
-        'util_cost':       util_cost,   # higher = more utility-costly = higher predicted premium
         # Moments of systematic component
         'sys_sigma':       sys_sigma,
         'sys_variance':    sys_var,
@@ -355,44 +330,195 @@ def compute_portfolio_chars(ret_series, factors_df, gamma,
         'standalone_var5':  standalone_var5,
         **tail_measures,
     }
+    return chars, r_sys_gross.values, tail_gross, rf_mean
 
 
-def build_cross_section(all_factors, deciles, industries, gamma):
-    print(f"\nComputing characteristics (gamma={gamma:.2f})...")
-    rows = []
+def compute_portfolio_chars(ret_series, factors_df, gamma,
+                            tail_q=(0.05, 0.10)):
+    """
+    For a single portfolio:
+      1. Estimate beta via OLS on FF5+MOM
+      2. Estimate conditional beta β(x) per market-return quintile
+      3. Construct R_sys_t = β(bin_t)*R_market_t month-by-month
+      3. Compute:
+         a. E[U*(R_sys; gamma)]  — the utility equilibrium measure
+         b. Moments of R_sys     — systematic variance, skew, kurt
+         c. Tail measures of R_sys — systematic tail VaR, tail beta
+         d. Utility residual     — E[U*(R_sys)] - U*(rf)
+            (negative = asset is utility-costly = should earn premium)
+    """
+    base = _portfolio_base(ret_series, factors_df, tail_q)
+    if base is None:
+        return None
+    chars, r_sys_gross, tail_gross, rf_mean = base
+
+    # ── Utility measures on systematic component ──────────────────────────────
+    eu_sys   = expected_utility(r_sys_gross, gamma)
+    u_rf     = utility_of_rf(rf_mean, gamma)
+    # Utility residual: negative means asset is costly in utility terms
+    # → should predict positive excess return
+    util_residual = eu_sys - u_rf  if not np.isnan(eu_sys) else np.nan
+    # Negated: higher value = more utility-costly = higher predicted premium
+    util_cost = -util_residual     if not np.isnan(util_residual) else np.nan
+
+    # Utility of systematic component in tail months
+    util_tail = {}
+    for q_label, g in tail_gross.items():
+        u = expected_utility(g, gamma) if g is not None else np.nan
+        util_tail[f'util_tail_{q_label}'] = float(u) if not np.isnan(u) \
+            else np.nan
+
+    return {
+        **chars,
+        # Utility measures (systematic)
+        'eu_systematic':   eu_sys,
+        'u_rf':            u_rf,
+        'util_residual':   util_residual,
+        'util_cost':       util_cost,   # higher = more utility-costly = higher predicted premium
+        **util_tail,
+    }
+
+
+def _pad(arrays):
+    """Stack ragged 1-D arrays into (n × T_max) with a validity mask."""
+    T = max([len(a) for a in arrays if a is not None] + [1])
+    out  = np.zeros((len(arrays), T))
+    mask = np.zeros((len(arrays), T), dtype=bool)
+    for i, a in enumerate(arrays):
+        if a is not None:
+            out[i, :len(a)], mask[i, :len(a)] = a, True
+    return out, mask
+
+
+def build_characteristics(all_factors, deciles, industries,
+                          tail_q=(0.05, 0.10)):
+    """
+    γ-independent stage of build_cross_section, computed once.
+    Returns a dict with the characteristics DataFrame ('chars') and the
+    padded systematic gross returns used by utility_matrix.
+    """
+    print(f"\nComputing characteristics (γ-independent stage)...")
+    rows, sys_g, tails, rf_means = [], [], {}, []
+
+    def add(s, ptype, group):
+        idx  = s.index.intersection(all_factors.index)
+        base = _portfolio_base(s.loc[idx], all_factors.loc[idx], tail_q)
+        if base is None:
+            return
+        chars, g, tg, rf_mean = base
+        chars['portfolio_type'] = ptype
+        chars['factor_group']   = group
+        rows.append(chars)
+        sys_g.append(g)
+        rf_means.append(rf_mean)
+        for q_label, arr in tg.items():
+            tails.setdefault(q_label, []).append(arr)
 
     for fname, ddf in deciles.items():
         for col in ddf.columns:
-            s = ddf[col].dropna()
-            idx = s.index.intersection(all_factors.index)
-            row = compute_portfolio_chars(
-                s.loc[idx], all_factors.loc[idx], gamma)
-            if row:
-                row['portfolio_type'] = 'decile'
-                row['factor_group']   = fname
-                rows.append(row)
-
+            add(ddf[col].dropna(), 'decile', fname)
     for col in industries.columns:
-        s = industries[col].dropna()
-        idx = s.index.intersection(all_factors.index)
-        row = compute_portfolio_chars(
-            s.loc[idx], all_factors.loc[idx], gamma)
-        if row:
-            row['portfolio_type'] = 'industry'
-            row['factor_group']   = 'industry'
-            rows.append(row)
+        add(industries[col].dropna(), 'industry', 'industry')
 
     df = pd.DataFrame(rows)
     print(f"  {len(df)} portfolios built")
+    return {
+        'chars':   df,
+        'sys':     _pad(sys_g),
+        'tails':   {q: _pad(v) for q, v in tails.items()},
+        'rf_mean': np.array(rf_means),
+    }
+
+
+def _mean_utility(ret, mask, gammas, block=32):
+    """
+    Mean power utility U(1+r) of each row of `ret` (valid where mask and
+    1+r > 0) for every γ: returns (n_rows × n_gammas), NaN where a row
+    has no valid observation — matches expected_utility row by row.
+    """
+    gross = 1.0 + ret
+    valid = mask & (gross > 0)
+    lg    = np.log(np.where(valid, gross, 1.0))
+    cnt   = valid.sum(axis=1)
+    g     = np.asarray(gammas, dtype=float)
+    is_log = np.abs(g - 1.0) < 1e-6
+    expo   = np.where(is_log, 1.0, 1.0 - g)
+    out    = np.empty((gross.shape[0], len(g)))
+    for lo in range(0, len(g), block):
+        e = expo[lo:lo+block]
+        u = np.exp(e[None, :, None] * lg[:, None, :]) / e[None, :, None]
+        out[:, lo:lo+block] = np.sum(u * valid[:, None, :], axis=2)
+    if is_log.any():
+        out[:, is_log] = (lg * valid).sum(axis=1)[:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = out / cnt[:, None]
+    out[cnt == 0] = np.nan
+    return out
+
+
+def utility_matrix(base, gammas):
+    """
+    Utility stage for a whole γ vector: every γ-dependent column of
+    compute_portfolio_chars as a (portfolio × γ) matrix.
+    """
+    g    = np.asarray(gammas, dtype=float)
+    eu   = _mean_utility(*base['sys'], g)
+    gross_rf = 1.0 + base['rf_mean'][:, None]
+    u_rf = np.where(np.abs(g - 1.0) < 1e-6, np.log(gross_rf),
+                    gross_rf**(1 - g) / np.where(np.abs(g - 1.0) < 1e-6,
+                                                 1.0, 1 - g))
+    out = {
+        'eu_systematic': eu,
+        'u_rf':          u_rf,
+        'util_residual': eu - u_rf,
+        'util_cost':     u_rf - eu,
+    }
+    for q_label, (ret, mask) in base['tails'].items():
+        out[f'util_tail_{q_label}'] = _mean_utility(ret, mask, g)
+    return out
+
+
+def cross_section_at(base, gamma):
+    """build_cross_section output at one γ, from a precomputed base."""
+    df = base['chars'].copy()
+    for col, m in utility_matrix(base, [gamma]).items():
+        df[col] = m[:, 0]
     return df
 
 
+def build_cross_section(all_factors, deciles, industries, gamma, base=None):
+    """
+    Cross-section of portfolio characteristics at a given γ.  Pass `base`
+    (from build_characteristics) to skip refitting the γ-independent stage.
+    """
+    if base is None:
+        base = build_characteristics(all_factors, deciles, industries)
+    return cross_section_at(base, gamma)
+
+
+def _pred_r2(util_cost, mean_excess):
+    """
+    R² of mean_excess on a constant + each column of util_cost, with
+    per-column NaN dropping (univariate OLS, so R² = corr²).
+    """
+    M  = np.isfinite(util_cost) & np.isfinite(mean_excess)[:, None]
+    n  = M.sum(axis=0)
+    X  = np.where(M, util_cost, 0.0)
+    Y  = np.where(M, mean_excess[:, None], 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sxx = (X*X).sum(0) - X.sum(0)**2 / n
+        syy = (Y*Y).sum(0) - Y.sum(0)**2 / n
+        sxy = (X*Y).sum(0) - X.sum(0)*Y.sum(0) / n
+        r2  = sxy**2 / (sxx * syy)
+    return np.where(n > 10, r2, np.nan)
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # 4.  GAMMA ESTIMATION
 # ══════════════════════════════════════════════════════════════════════════════
 
 def estimate_gamma(all_factors, deciles, industries,
-                   gamma_grid=None, verbose=True):
+                   gamma_grid=None, verbose=True, base=None, refine=False):
     """
     Find gamma that minimises cross-sectional dispersion of E[U*(R_sys)].
     In equilibrium all assets should have equal expected utility,
@@ -401,6 +527,11 @@ def estimate_gamma(all_factors, deciles, industries,
 
     Also find gamma that maximises cross-sectional R² of
     util_cost predicting mean_excess — the predictive gamma.
+
+    The characteristics are built once (or taken from `base`) and the
+    whole grid is evaluated as one (portfolio × γ) utility matrix.
+    refine=True polishes both estimates with a bounded scalar search
+    between the neighbouring grid points.
     """
     if gamma_grid is None:
         gamma_grid = np.concatenate([
@@ -408,48 +539,59 @@ def estimate_gamma(all_factors, deciles, industries,
             np.linspace(3,  10, 10),
             np.linspace(10, 30, 8),
         ])
+    gamma_grid = np.asarray(gamma_grid, dtype=float)
+    if base is None:
+        base = build_characteristics(all_factors, deciles, industries)
+    mean_excess = base['chars']['mean_excess'].values
+
+    def sweep(gammas):
+        um = utility_matrix(base, gammas)
+        eu = um['eu_systematic']
+        ok = np.isfinite(eu) & np.isfinite(mean_excess)[:, None]
+        # Dispersion of expected utility across assets (pandas std, ddof=1)
+        eu_disp = np.array([np.std(eu[ok[:, j], j], ddof=1)
+                            for j in range(len(gammas))])
+        # Predictive R²: does util_cost predict mean_excess?
+        pred_r2 = _pred_r2(np.where(ok, um['util_cost'], np.nan), mean_excess)
+        return eu_disp, pred_r2
+
+    eu_disp, pred_r2 = sweep(gamma_grid)
+    res_df = pd.DataFrame({'gamma': gamma_grid, 'eu_disp': eu_disp,
+                           'pred_r2': pred_r2})
 
     if verbose:
         print("\nEstimating gamma...")
         print(f"  {'Gamma':>7}  {'EU dispersion':>14}  {'Pred R²':>9}")
         print("  " + "-" * 36)
-
-    results = []
-    for gamma in gamma_grid:
-        df = build_cross_section(all_factors, deciles, industries, gamma)
-        df = df.dropna(subset=['eu_systematic','mean_excess'])
-
-        # Dispersion of expected utility across assets
-        eu_disp = float(df['eu_systematic'].std())
-
-        # Predictive R²: does util_cost predict mean_excess?
-        sub = df.dropna(subset=['util_cost'])
-        if len(sub) > 10:
-            reg = sm.OLS(sub['mean_excess'],
-                         sm.add_constant(sub['util_cost'])).fit()
-            pred_r2 = reg.rsquared
-        else:
-            pred_r2 = np.nan
-
-        results.append({
-            'gamma':    gamma,
-            'eu_disp':  eu_disp,
-            'pred_r2':  pred_r2,
-        })
-        if verbose:
-            print(f"  {gamma:>7.2f}  {eu_disp:>14.6f}  "
-                  f"{pred_r2:>9.4f}" if not np.isnan(pred_r2)
-                  else f"  {gamma:>7.2f}  {eu_disp:>14.6f}  {'N/A':>9}")
-
-    res_df = pd.DataFrame(results)
+        for _, r in res_df.iterrows():
+            print(f"  {r.gamma:>7.2f}  {r.eu_disp:>14.6f}  "
+                  f"{r.pred_r2:>9.4f}" if not np.isnan(r.pred_r2)
+                  else f"  {r.gamma:>7.2f}  {r.eu_disp:>14.6f}  {'N/A':>9}")
 
     # Gamma that minimises EU dispersion (equilibrium gamma)
-    gamma_eq = float(res_df.loc[res_df['eu_disp'].idxmin(), 'gamma'])
+    i_eq = int(res_df['eu_disp'].idxmin())
+    gamma_eq = float(res_df.loc[i_eq, 'gamma'])
 
     # Gamma that maximises predictive R² (predictive gamma)
     valid = res_df.dropna(subset=['pred_r2'])
-    gamma_pred = float(valid.loc[valid['pred_r2'].idxmax(), 'gamma']) \
-                 if len(valid) > 0 else gamma_eq
+    i_pred = int(valid['pred_r2'].idxmax()) if len(valid) > 0 else None
+    gamma_pred = float(res_df.loc[i_pred, 'gamma']) \
+                 if i_pred is not None else gamma_eq
+
+    if refine:
+        def polish(i, f):
+            lo = gamma_grid[max(i - 1, 0)]
+            hi = gamma_grid[min(i + 1, len(gamma_grid) - 1)]
+            if hi <= lo:
+                return float(gamma_grid[i])
+            r = minimize_scalar(lambda g: f(np.array([g])),
+                                bounds=(lo, hi), method='bounded',
+                                options={'xatol': 1e-4})
+            return float(r.x)
+        gamma_eq = polish(i_eq, lambda g: sweep(g)[0][0])
+        if i_pred is not None:
+            gamma_pred = polish(i_pred, lambda g: -np.nan_to_num(
+                sweep(g)[1][0], nan=-np.inf))
 
     print(f"\n  Equilibrium gamma  (min EU dispersion): {gamma_eq:.2f}")
     print(f"  Predictive gamma   (max pred R²):       {gamma_pred:.2f}")
@@ -592,11 +734,13 @@ def run_regressions(df, label='All portfolios'):
 # ══════════════════════════════════════════════════════════════════════════════
 
 def gamma_sensitivity(all_factors, deciles, industries,
-                      gammas=(1, 2, 5, 10, 20)):
+                      gammas=(1, 2, 5, 10, 20), base=None):
     """
     For fixed theoretically motivated gamma values, test predictive power
     of utility cost. Shows how sensitive results are to utility assumption.
     """
+    if base is None:
+        base = build_characteristics(all_factors, deciles, industries)
     print(f"\n── Gamma Sensitivity (fixed values) ─────────────────────────────")
     print(f"  {'Gamma':>7}  {'Util R²':>8}  {'Sys mom R²':>11}  "
           f"{'Combined R²':>12}  {'Util t-stat':>12}")
@@ -604,7 +748,7 @@ def gamma_sensitivity(all_factors, deciles, industries,
 
     rows = []
     for gamma in gammas:
-        df = build_cross_section(all_factors, deciles, industries, gamma)
+        df = cross_section_at(base, gamma)
         req = ['mean_excess'] + UTIL_VAR + SYS_MOM_VARS
         sub = df.dropna(subset=req)
         y   = sub['mean_excess']
@@ -664,12 +808,13 @@ def out_of_sample_test(factors_all, deciles, industries,
 
     print(f"  Out-of-sample: {split_year}–{factors_all.index[-1].year} "
           f"({len(f_out)} months)")
+    base_out = build_characteristics(f_out, d_out, i_out)
 
     # Test at estimated gamma and at gamma=2 (theoretical)
     for gamma, label in [(best_gamma, 'estimated γ'),
                          (2.0, 'fixed γ=2'),
                          (5.0, 'fixed γ=5')]:
-        df_out = build_cross_section(f_out, d_out, i_out, gamma)
+        df_out = cross_section_at(base_out, gamma)
         req    = ['mean_excess'] + UTIL_VAR + FACTOR_VARS
         sub    = df_out.dropna(subset=req)
         if len(sub) < 10:
@@ -898,14 +1043,16 @@ def main():
     factors, mom, deciles, industries = fetch_data()
     all_factors = factors.join(mom, how='left').fillna(0)
 
+    # γ-independent characteristics, fitted once and reused below
+    base = build_characteristics(all_factors, deciles, industries)
+
     # Step 1: Estimate gamma from data
     gamma_eq, gamma_pred, gamma_df = estimate_gamma(
-        all_factors, deciles, industries)
+        all_factors, deciles, industries, base=base)
 
     # Step 2: Build cross-section at estimated gamma
     print(f"\nBuilding cross-section at equilibrium gamma={gamma_eq:.2f}...")
-    df_main = build_cross_section(
-        all_factors, deciles, industries, gamma_eq)
+    df_main = cross_section_at(base, gamma_eq)
 
     # Step 2b: Nonlinearity diagnostic
     nonlinearity_diagnostic(df_main, 'All portfolios')
@@ -925,7 +1072,7 @@ def main():
 
     # Step 4: Fixed gamma sensitivity
     sens_df = gamma_sensitivity(all_factors, deciles, industries,
-                                gammas=[1, 2, 5, 10, 20])
+                                gammas=[1, 2, 5, 10, 20], base=base)
 
     # Step 5: Out-of-sample validation
     oos_gamma = out_of_sample_test(all_factors, deciles, industries,